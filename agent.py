@@ -1,23 +1,45 @@
 """LangGraph agent for autonomous quiz solving."""
+import asyncio
 import logging
 import os
-from typing import TypedDict, Annotated, List
+import time
+import uuid
+from typing import TypedDict, Annotated, List, NotRequired, Optional
 
 from langgraph.graph import StateGraph, END, START
-from langgraph.prebuilt import ToolNode
-from langgraph.graph.message import add_messages
+from langgraph.types import Command
+from langchain_core.messages import AIMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langchain_google_genai import ChatGoogleGenerativeAI
 
-from config import EMAIL, SECRET, RECURSION_LIMIT
+from config import (
+    EMAIL,
+    SECRET,
+    RECURSION_LIMIT,
+    LLM_MAX_RETRIES,
+    QUESTION_TIME_LIMIT,
+    DEADLINE_HURRY_SECONDS,
+    DEADLINE_FINAL_SECONDS,
+)
+from compaction import compaction_node, estimate_tokens
+from history import append_messages
+from llm_cache import llm_cache, cache_key, prompt_fingerprint
+from ratelimit import llm_limiter
+import solvers
+from tool_node import ToolCalls
 from tools import scrape_page, download_file, run_code, send_post, install_package
+from tools.context import current_job, JobCancelled
+from tools.deadline import Deadline, current_deadline, question_deadline, HURRY, FINAL, EXPIRED
+from tools.tracing import current_span, span
 
 logger = logging.getLogger(__name__)
 
 
 # State definition
 class AgentState(TypedDict):
-    messages: Annotated[List, add_messages]
+    messages: Annotated[List, append_messages]
+    handback: NotRequired[Optional[str]]  # Next question, once the graph gives the chain back to the solvers
 
 
 # Tools available to agent
@@ -25,10 +47,19 @@ TOOLS = [scrape_page, download_file, run_code, send_post, install_package]
 
 
 # LLM - using ChatGoogleGenerativeAI directly
+LLM_MODEL = "gemini-2.0-flash"
+LLM_FAST_MODEL = "gemini-2.0-flash-lite"  # Used once a question is short on time
 llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
+    model=LLM_MODEL,
     google_api_key=os.getenv("GOOGLE_API_KEY"),
     temperature=0,
+    max_retries=LLM_MAX_RETRIES,
+).bind_tools(TOOLS)
+fast_llm = ChatGoogleGenerativeAI(
+    model=LLM_FAST_MODEL,
+    google_api_key=os.getenv("GOOGLE_API_KEY"),
+    temperature=0,
+    max_retries=LLM_MAX_RETRIES,
 ).bind_tools(TOOLS)
 
 # System prompt - concise and structured
@@ -55,9 +86,9 @@ SYSTEM_PROMPT = f"""You are an autonomous quiz-solving agent.
 - Return "END" only when no "url" in response
 
 **TOOLS:**
-- scrape_page: Get HTML (works with JS)
-- download_file: Save files (returns filename only)
-- run_code: Execute Python (cwd=temp_files, so just use filename)
+- scrape_page: Get page text, links, forms, tables and media (works with JS; raw HTML saved to a file)
+- download_file: Save files (returns filename only; extract=True unpacks .zip/.tar.gz/.gz and lists the files)
+- run_code: Execute Python (cwd is the chain's working directory, so just use filename; session=True keeps variables between calls, so load data once and reuse it)
 - send_post: Submit answers
 - install_package: Add Python libs if needed
 """
@@ -68,13 +99,161 @@ prompt = ChatPromptTemplate.from_messages([
 ])
 
 llm_with_prompt = prompt | llm
+fast_llm_with_prompt = prompt | fast_llm
+
+# Appended to the system prompt as a question runs out of time
+DEADLINE_NOTES = {
+    HURRY: f"Less than {DEADLINE_HURRY_SECONDS}s left on this question: skip verification and extra "
+           "exploration, compute the answer directly and submit it.",
+    FINAL: f"Less than {DEADLINE_FINAL_SECONDS}s left on this question: submit your best answer with send_post now.",
+    EXPIRED: "Time is up on this question: submit your best answer with send_post now to get the next URL.",
+}
+
+
+# Rough size of the system prompt and tool schemas sent with every call
+PROMPT_TOKENS = (len(SYSTEM_PROMPT) + 3000) // 4
+
+# Identifies the model, prompt and tools in LLM cache keys
+PROMPT_FINGERPRINT = prompt_fingerprint(LLM_MODEL, SYSTEM_PROMPT, TOOLS)
+FAST_PROMPT_FINGERPRINT = prompt_fingerprint(LLM_FAST_MODEL, SYSTEM_PROMPT, TOOLS)
+
+
+def _log_wait(waited: float):
+    if waited >= 1:
+        logger.info(f"Waited {waited:.1f}s in the LLM rate-limit queue")
+    current_span().set(queue_seconds=round(waited, 4))
+
+
+def _queue_deadline(config: RunnableConfig) -> Optional[float]:
+    """Rate-limit queue priority: when the current question runs out (else the run's deadline)."""
+    return question_deadline().expires() or config.get("configurable", {}).get("deadline")
+
+
+def _reserve_llm_call(messages: List, config: RunnableConfig) -> int:
+    """Wait for the shared rate limiter; returns the token estimate used."""
+    estimate = PROMPT_TOKENS + estimate_tokens(messages)
+    _log_wait(llm_limiter.acquire(estimate, deadline=_queue_deadline(config)))
+    return estimate
+
+
+async def _areserve_llm_call(messages: List, config: RunnableConfig) -> int:
+    estimate = PROMPT_TOKENS + estimate_tokens(messages)
+    _log_wait(await llm_limiter.aacquire(estimate, deadline=_queue_deadline(config)))
+    return estimate
+
+
+def _record_llm_usage(result, estimate: int):
+    usage = getattr(result, "usage_metadata", None)
+    if usage and usage.get("total_tokens"):
+        llm_limiter.record_usage(estimate, usage["total_tokens"])
+    usage = usage or {}
+    current_span().set(
+        input_tokens=usage.get("input_tokens"),
+        output_tokens=usage.get("output_tokens"),
+        estimated_tokens=estimate,
+        tool_calls=len(getattr(result, "tool_calls", None) or []),
+    )
+
+
+def _cache_key(messages: List, config: RunnableConfig, fingerprint: str) -> Optional[str]:
+    """
+    LLM cache key for this call; None if the cache is off, the run set
+    configurable llm_cache=False, or the question's last answer was wrong
+    (a cached reply would only repeat the step that led to it).
+    """
+    if not llm_cache.enabled or config.get("configurable", {}).get("llm_cache") is False:
+        return None
+    if question_deadline().retrying:
+        return None
+    return cache_key(fingerprint, messages)
+
+
+def _cached(key: Optional[str], current) -> Optional[AIMessage]:
+    cached = llm_cache.get(key) if key else None
+    if cached is not None:
+        logger.info("✓ LLM response served from cache")
+        current.set(cached=True)
+    return cached
+
+
+def _forced_step(phase: str) -> Optional[AIMessage]:
+    """
+    Act without the LLM once time is up: resubmit the question's best-known
+    answer (send_post keeps the next URL when a retry can no longer land),
+    and stop once that was done and the question has expired anyway.
+    """
+    if phase not in (FINAL, EXPIRED):
+        return None
+    deadline = question_deadline()
+    best = deadline.take_best()
+    if best is not None:
+        url, payload = best
+        call = {"name": send_post.name, "args": {"url": url, "payload": payload}, "id": f"call_{uuid.uuid4().hex[:12]}"}
+        return AIMessage(content="", tool_calls=[call])
+    if phase == EXPIRED and deadline.forced:
+        logger.warning(f"Out of time on {deadline.question} with nothing left to try, ending the chain")
+        return AIMessage(content="END")
+    return None
+
+
+def _llm_step(phase: str, messages: List) -> tuple:
+    """(messages, model, fingerprint) for the next call; short on time, the fast model is told to hurry."""
+    if phase not in DEADLINE_NOTES:
+        return messages, llm_with_prompt, PROMPT_FINGERPRINT
+    return list(messages) + [SystemMessage(content=DEADLINE_NOTES[phase])], fast_llm_with_prompt, FAST_PROMPT_FINGERPRINT
+
+
+def _raise_if_cancelled():
+    job = current_job.get()
+    if job:
+        job.raise_if_cancelled()
+
+
+def _begin_step(state: AgentState, config: RunnableConfig, current) -> tuple:
+    """(reply that needs no LLM call or None, messages, model, cache key) for the next agent step."""
+    phase = question_deadline().phase()
+    current.set(phase=phase)
+    forced = _forced_step(phase)
+    if forced is not None:
+        return forced, None, None, None
+    messages, model, fingerprint = _llm_step(phase, state["messages"])
+    return None, messages, model, _cache_key(messages, config, fingerprint)
 
 
 # Agent node
-def agent_node(state: AgentState):
+def agent_node(state: AgentState, config: RunnableConfig):
     """Execute LLM reasoning step."""
-    result = llm_with_prompt.invoke({"messages": state["messages"]})
-    return {"messages": state["messages"] + [result]}
+    _raise_if_cancelled()
+    with span("agent", messages=len(state["messages"])) as current:
+        reply, messages, model, key = _begin_step(state, config, current)
+        if reply is None:
+            reply = _cached(key, current)
+        if reply is None:
+            estimate = _reserve_llm_call(messages, config)
+            with span("agent.llm"):
+                reply = model.invoke({"messages": messages})
+            _record_llm_usage(reply, estimate)
+            if key:
+                llm_cache.put(key, reply)
+        return {"messages": [reply]}
+
+
+async def aagent_node(state: AgentState, config: RunnableConfig):
+    """Async LLM reasoning step, used when the graph runs via ainvoke."""
+    _raise_if_cancelled()
+    with span("agent", messages=len(state["messages"])) as current:
+        reply, messages, model, key = _begin_step(state, config, current)
+        if reply is None and key:
+            # The cache's SQLite store must not block the event loop
+            reply = await asyncio.to_thread(_cached, key, current)
+        if reply is None:
+            estimate = await _areserve_llm_call(messages, config)
+            with span("agent.llm"):
+                reply = await model.ainvoke({"messages": messages})
+            _record_llm_usage(reply, estimate)
+            if key:
+                await asyncio.to_thread(llm_cache.put, key, reply)
+        return {"messages": [reply]}
 
 
 # Routing logic
@@ -105,30 +284,187 @@ def route_decision(state: AgentState):
     return "agent"
 
 
-# Build graph
+async def _aroute_decision(state: AgentState):
+    return route_decision(state)
+
+
+def compact_step(state: AgentState):
+    """
+    Compact the history, then go on with the agent, or end the run once an
+    accepted answer moved the chain to a new question: the solvers get the
+    next question and the finished one is already summarized.
+    """
+    # Read before compaction folds the submission into the summary
+    handback = solvers.handback_url(state["messages"])
+    update = compaction_node(state)
+    if handback:
+        logger.info("Answer accepted, handing the next question to the solvers")
+        return Command(update={**update, "handback": handback}, goto=END)
+    return Command(update=update, goto="agent")
+
+
+async def _acompact_step(state: AgentState):
+    # Pure in-memory work: run it on the event loop instead of a thread
+    return compact_step(state)
+
+
+# Build graph (each node has an async twin so ainvoke never hops threads)
 graph = StateGraph(AgentState)
-graph.add_node("agent", agent_node)
-graph.add_node("tools", ToolNode(TOOLS))
+graph.add_node("agent", RunnableLambda(agent_node, afunc=aagent_node, name="agent"))
+tool_calls = ToolCalls(TOOLS)
+graph.add_node("tools", RunnableLambda(tool_calls.invoke, afunc=tool_calls.ainvoke, name="tools"))
+# Routes with Command: a conditional edge would re-apply compaction's removals to read the state
+graph.add_node("compact", RunnableLambda(compact_step, afunc=_acompact_step, name="compact"), destinations=("agent", END))
 
 graph.add_edge(START, "agent")
-graph.add_edge("tools", "agent")
-graph.add_conditional_edges("agent", route_decision)
+graph.add_edge("tools", "compact")
+graph.add_conditional_edges("agent", RunnableLambda(route_decision, afunc=_aroute_decision))
 
 app = graph.compile()
+_checkpointed = {}  # checkpointer -> graph compiled with it
+
+
+def _graph_for(job) -> tuple:
+    """(compiled graph, checkpointer) for a chain: checkpointed when its job can be resumed elsewhere."""
+    checkpointer = job.checkpointer if job else None
+    if checkpointer is None:
+        return app, None
+    if checkpointer not in _checkpointed:
+        _checkpointed[checkpointer] = graph.compile(checkpointer=checkpointer)
+    return _checkpointed[checkpointer], checkpointer
+
+
+def _run_config(counter: solvers.SubmissionCounter, job=None, thread: Optional[str] = None) -> dict:
+    config = {
+        "recursion_limit": RECURSION_LIMIT,
+        "configurable": {"deadline": llm_limiter.clock.now() + QUESTION_TIME_LIMIT},
+        "callbacks": [counter],
+    }
+    if thread:
+        # Checkpointed: one thread per graph run, tagged with the job to find it again
+        config["configurable"]["thread_id"] = thread
+        config["metadata"] = {"job_id": job.job_id}
+    return config
+
+
+def _new_thread(job, checkpointer) -> Optional[str]:
+    return f"{job.job_id}:{uuid.uuid4().hex[:8]}" if checkpointer is not None else None
+
+
+def _unfinished_thread(job, graph_app, checkpointer) -> Optional[str]:
+    """The job's latest checkpointed graph run, if an earlier process stopped in the middle of it."""
+    if checkpointer is None:
+        return None
+    for saved in checkpointer.list(None, filter={"job_id": job.job_id}, limit=1):
+        thread = saved.config["configurable"]["thread_id"]
+        if graph_app.get_state({"configurable": {"thread_id": thread}}).next:
+            return thread
+    return None
+
+
+def _start_deadline(url: Optional[str]):
+    """
+    Give the chain its question clock; it shares the limiter's clock so
+    queue priorities compare. A resumed chain starts without a question:
+    the first page it scrapes becomes one.
+    """
+    deadline = Deadline(clock=llm_limiter.clock)
+    if url:
+        deadline.begin(url)
+    return current_deadline.set(deadline)
+
+
+def _graph_input(history: List, task: str) -> dict:
+    """A new graph run's input: the summary of the questions the agent finished so far, then `task`."""
+    return {"messages": list(history) + [{"role": "user", "content": task}]}
+
+
+class _ChainRun:
+    """
+    Bookkeeping of one quiz chain between its graph runs, shared by
+    run_agent and run_agent_async (which only add the blocking or awaited
+    calls). Used as a context manager around the runs: it logs how the
+    chain ended and drops its question clock.
+    """
+
+    def __init__(self, url: str):
+        logger.info(f"Agent starting with URL: {url}")
+        self.url = url
+        self.job = current_job.get()
+        self.graph, self.checkpointer = _graph_for(self.job)
+        # append_messages mutates the state in place: checkpoints must be written before the next step
+        self.durability = "sync" if self.checkpointer is not None else None
+        self.result = {"messages": []}
+        self.thread = None
+        self.next_url = None
+        self._counter = None
+        self._started = 0.0
+        self._deadline_token = None
+
+    def begin(self, thread: Optional[str]) -> Optional[str]:
+        """Start the question clock; returns the URL for the fast path, None when resuming `thread`."""
+        self.thread = thread
+        self._deadline_token = _start_deadline(None if thread else self.url)
+        return None if thread else self.url
+
+    def pending(self, task: Optional[str]) -> bool:
+        return task is not None or self.thread is not None
+
+    def next_run(self, task: Optional[str]) -> tuple:
+        """(input, config) of the next graph run: the unfinished thread, or a new one for `task`."""
+        self._counter = solvers.SubmissionCounter()
+        self._started = time.perf_counter()
+        if self.thread:
+            logger.info(f"Resuming the chain from checkpoint thread {self.thread}")
+            return None, _run_config(self._counter, self.job, self.thread)
+        thread = _new_thread(self.job, self.checkpointer)
+        return _graph_input(self.result["messages"], task), _run_config(self._counter, self.job, thread)
+
+    def ran(self, result: dict):
+        self.thread = None
+        self.result = result
+        solvers.record_agent(time.perf_counter() - self._started, self._counter.count)
+        self.next_url = result.get("handback")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        current_deadline.reset(self._deadline_token)
+        if exc_type is None:
+            logger.info("✅ Agent completed successfully")
+        elif issubclass(exc_type, JobCancelled):
+            logger.warning(f"Agent stopped: job cancelled ({self.url})")
+        elif issubclass(exc_type, Exception):
+            logger.error(f"❌ Agent failed: {exc}", exc_info=(exc_type, exc, tb))
+        return False
 
 
 def run_agent(url: str):
-    """Run the agent on a quiz URL."""
-    logger.info(f"Agent starting with URL: {url}")
-    
-    try:
-        result = app.invoke(
-            {"messages": [{"role": "user", "content": url}]},
-            config={"recursion_limit": RECURSION_LIMIT}
-        )
-        logger.info("✅ Agent completed successfully")
-        return result
-    
-    except Exception as e:
-        logger.error(f"❌ Agent failed: {e}", exc_info=True)
-        raise
+    """
+    Run a quiz chain: the deterministic solvers answer the questions they
+    recognise and the agent takes over the others. A chain resumed by
+    another process first finishes the graph run it was in.
+    """
+    chain = _ChainRun(url)
+    start_url = chain.begin(_unfinished_thread(chain.job, chain.graph, chain.checkpointer))
+    with chain:
+        task = solvers.fast_path(start_url) if start_url else None
+        while chain.pending(task):
+            graph_input, config = chain.next_run(task)
+            chain.ran(chain.graph.invoke(graph_input, config=config, durability=chain.durability))
+            task = solvers.fast_path(chain.next_url) if chain.next_url else None
+        return chain.result
+
+
+async def run_agent_async(url: str):
+    """Async `run_agent`, on the current event loop."""
+    chain = _ChainRun(url)
+    start_url = chain.begin(await asyncio.to_thread(_unfinished_thread, chain.job, chain.graph, chain.checkpointer))
+    with chain:
+        task = await solvers.afast_path(start_url) if start_url else None
+        while chain.pending(task):
+            graph_input, config = chain.next_run(task)
+            chain.ran(await chain.graph.ainvoke(graph_input, config=config, durability=chain.durability))
+            task = await solvers.afast_path(chain.next_url) if chain.next_url else None
+        return chain.result
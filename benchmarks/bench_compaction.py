@@ -0,0 +1,64 @@
+"""Replay a synthetic quiz chain and compare LLM input tokens per step
+with and without history compaction.
+
+Usage: python -m benchmarks.bench_compaction [--questions 8]
+"""
+import argparse
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.graph.message import add_messages
+
+from compaction import compact_messages, estimate_tokens
+
+
+def synthetic_question(q: int) -> list:
+    """One question: scrape, download, two run_code attempts, submit."""
+    base = f"https://quiz.example.com/q{q}"
+    turns = [
+        ("scrape_page", {"url": base}, "<div>" + "question text and markup " * 400 + "</div>"),
+        ("download_file", {"url": f"{base}/data.csv", "filename": f"q{q}.csv"}, f"q{q}.csv"),
+        ("run_code", {"code": "import pandas as pd\nprint(pd.read_csv('x.csv'))"},
+         json.dumps({"stdout": "   value\n" + "\n".join(f"{i}  {i * 7}" for i in range(600)), "stderr": "", "return_code": 0})),
+        ("run_code", {"code": "import pandas as pd\nprint(pd.read_csv('x.csv')['value'].sum())"},
+         json.dumps({"stdout": "12345\n", "stderr": "", "return_code": 0})),
+        ("send_post", {"url": "https://quiz.example.com/submit", "payload": {"url": base, "answer": 12345}},
+         json.dumps({"correct": True, "url": f"https://quiz.example.com/q{q + 1}", "reason": None})),
+    ]
+    messages = []
+    for i, (name, args, output) in enumerate(turns):
+        call_id = f"q{q}-{i}"
+        messages.append(AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": call_id}]))
+        messages.append(ToolMessage(content=output, tool_call_id=call_id, name=name))
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--questions", type=int, default=8)
+    args = parser.parse_args()
+
+    steps = [m for q in range(1, args.questions + 1) for m in synthetic_question(q)]
+    start = HumanMessage(content="https://quiz.example.com/q1")
+
+    full = add_messages([], [start])
+    compact = add_messages([], [start])
+    totals = [0, 0]
+    print(f"{'step':>5} {'no compaction':>14} {'compacted':>10}")
+    for step, msg in enumerate(steps, 1):
+        full = add_messages(full, [msg])
+        compact = add_messages(compact, [msg])
+        if not isinstance(msg, ToolMessage):
+            continue
+        # The agent node runs after every tool result
+        compact = add_messages(compact, compact_messages(compact))
+        before, after = estimate_tokens(full), estimate_tokens(compact)
+        totals[0] += before
+        totals[1] += after
+        print(f"{step // 2:>5} {before:>14} {after:>10}")
+
+    print(f"total input tokens: {totals[0]} -> {totals[1]} ({1 - totals[1] / totals[0]:.0%} less)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Check the per-question deadline on a virtual clock.
+
+Time is a VirtualClock shared by the question deadline, the LLM rate
+limiter, a fake quiz server that reports `delay` like the real one, and a
+scripted LLM that "thinks" for --think virtual seconds per call. The
+chain has four questions:
+
+1. answered right away;
+2. answered wrong again and again, a different answer each time: the
+   fast model takes over with a hurry note, and the last wrong answer
+   moves on instead of retrying;
+3. answered wrong once, then the model keeps verifying with run_code:
+   when time is up the best-known answer is resubmitted without the LLM;
+   the submission log already holds its verdict, so the chain moves on to
+   the URL that verdict named without posting the answer again;
+4. the same as the last question: once the resubmission brings no next
+   URL and time is up, the chain ends instead of looping.
+
+Checks also cover phases, tool timeouts, re-anchoring to the server's
+delay and send_post's retry policy. Nothing waits in real time.
+
+Usage: python -m benchmarks.bench_deadline [--think 40] [--async]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import re
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+import agent
+import solvers
+import tools.requester as requester
+from benchmarks.cache_harness import Checks
+from benchmarks.server import LocalServer, html
+from clock import VirtualClock
+from compaction import SUMMARY_PREFIX
+from config import CODE_TIMEOUT, DEADLINE_MIN_TIMEOUT, QUESTION_TIME_LIMIT
+from llm_cache import LLMCache
+from ratelimit import RateLimiter
+from tools.deadline import Deadline, current_deadline, tool_timeout, NORMAL, HURRY, FINAL, EXPIRED
+from tools.requester import _apply_retry_policy
+from tools.submissions import SubmissionLog
+
+_QUESTION = re.compile(r"What is (\d+) \+ (\d+)\?")
+_SUBMIT = re.compile(r"POST the answer to (\S+) ")
+_PAGE_URL = re.compile(r"^URL: (\S+)", re.MULTILINE)
+_NEXT_URL = re.compile(r"next url: (\S+)")
+
+RIGHT, WRONG, STUBBORN = "right", "wrong", "stubborn"
+SCRIPT = {1: RIGHT, 2: WRONG, 3: STUBBORN, 4: STUBBORN}
+
+
+class TimedQuizServer(LocalServer):
+    """
+    Four-question chain whose /submit reports `delay`, the virtual seconds
+    since the question was first served, and always names the next question
+    (like the real server, which leaves retrying up to the client).
+    """
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self.clock = clock
+        self.served = {}
+        self.submissions = []
+        self.routes["/submit"] = self._submit
+        for level in SCRIPT:
+            self.routes[f"/quiz/{level}"] = self._page
+
+    def _page(self, handler):
+        level = int(handler.path.split("?")[0].rsplit("/", 1)[1])
+        self.served.setdefault(level, self.clock.now())
+        return html(
+            f"<html><body><h1>Question {level}</h1><p>What is {level * 7} + {level * 11}? "
+            f"POST the answer to {self.base_url}/submit as JSON with email, secret, url and answer.</p></body></html>"
+        )
+
+    def _submit(self, handler):
+        data = json.loads(handler.read_body() or b"{}")
+        level = int(data["url"].rsplit("/", 1)[1])
+        delay = int(self.clock.now() - self.served[level])
+        correct = data["answer"] == level * 18
+        self.submissions.append({"level": level, "delay": delay, "correct": correct})
+        response = {"correct": correct, "reason": None if correct else "Wrong answer", "delay": delay}
+        if level < len(SCRIPT):
+            response["url"] = f"{self.base_url}/quiz/{level + 1}"
+        return 200, "application/json", json.dumps(response).encode()
+
+    @property
+    def start_url(self) -> str:
+        return f"{self.base_url}/quiz/1"
+
+
+def _call(name: str, args: dict) -> AIMessage:
+    return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}"}])
+
+
+def thinking_llm(clock: VirtualClock, think: float, model: str, calls: list) -> RunnableLambda:
+    """Scripted model that spends `think` virtual seconds per call and follows SCRIPT per question."""
+
+    def decide(inputs):
+        clock.advance(think)
+        messages = inputs["messages"]
+        note = next((m.content for m in messages if isinstance(m, SystemMessage)), None)
+        reply = respond([m for m in messages if not isinstance(m, SystemMessage)])
+        calls.append({"model": model, "note": note, "action": reply.tool_calls[0]["name"] if reply.tool_calls else None})
+        return reply
+
+    def respond(history):
+        last = history[-1]
+
+        if isinstance(last, ToolMessage) and last.name == "scrape_page":
+            a, b = _QUESTION.search(last.content).groups()
+            page = _PAGE_URL.search(last.content).group(1)
+            right = SCRIPT[int(page.rsplit("/", 1)[1])] == RIGHT
+            answer = int(a) + int(b) + (0 if right else 1)
+            return _call("send_post", {"url": _SUBMIT.search(last.content).group(1),
+                                       "payload": {"email": "e", "secret": "s", "url": page, "answer": answer}})
+        if isinstance(last, ToolMessage) and last.name == "send_post":
+            data = json.loads(last.content)
+            if data.get("url"):
+                return _call("scrape_page", {"url": data["url"]})
+            if data.get("correct"):
+                return AIMessage(content="END")
+            submitted = next(m for m in reversed(history) if isinstance(m, AIMessage) and m.tool_calls)
+            level = int(submitted.tool_calls[0]["args"]["payload"]["url"].rsplit("/", 1)[1])
+            if SCRIPT[level] == STUBBORN:
+                return _call("run_code", {"code": "print('checking')"})
+            args = submitted.tool_calls[0]["args"]
+            return _call("send_post", {**args, "payload": {**args["payload"], "answer": args["payload"]["answer"] + 1}})
+        if isinstance(last, ToolMessage) and last.name == "run_code":
+            return _call("run_code", {"code": "print('checking again')"})
+        if isinstance(last, HumanMessage) and last.content.startswith(SUMMARY_PREFIX):
+            return _call("scrape_page", {"url": _NEXT_URL.findall(last.content)[-1]})
+        return _call("scrape_page", {"url": last.content.split()[0]})
+
+    async def adecide(inputs):
+        return decide(inputs)
+
+    return RunnableLambda(decide, afunc=adecide)
+
+
+def unit_checks(check: Checks):
+    clock = VirtualClock()
+    deadline = Deadline(clock=clock)
+    deadline.begin("https://quiz/1")
+    check("no timeout cut before the question is scraped", deadline.timeout(CODE_TIMEOUT) == CODE_TIMEOUT)
+    deadline.scraped("https://quiz/data.csv")
+    check("scraping another page does not start the clock", deadline.remaining() is None)
+    deadline.scraped("https://quiz/1")
+    phases = []
+    for elapsed in (0, 130, 165, 185):
+        clock.advance(elapsed - (deadline.elapsed() or 0))
+        phases.append(deadline.phase())
+    check("phases follow the time left", phases == [NORMAL, HURRY, FINAL, EXPIRED], str(phases))
+
+    clock = VirtualClock()
+    deadline = Deadline(clock=clock)
+    deadline.scraped("https://quiz/1")
+    clock.advance(100)
+    token = current_deadline.set(deadline)
+    try:
+        cut = tool_timeout(CODE_TIMEOUT)
+        clock.advance(75)
+        floor = tool_timeout(CODE_TIMEOUT)
+    finally:
+        current_deadline.reset(token)
+    check("run_code's timeout shrinks to the time left minus the submit reserve", cut == 70, str(cut))
+    check("tools keep a minimum timeout past the deadline", floor == DEADLINE_MIN_TIMEOUT, str(floor))
+    check("outside a chain tools keep their default timeout", tool_timeout(CODE_TIMEOUT) == CODE_TIMEOUT)
+
+    deadline.submitted("https://quiz/submit", {"answer": 1}, False, delay=30)
+    check("the server's delay re-anchors the clock", deadline.elapsed() == 30, str(deadline.elapsed()))
+
+
+def policy_checks(check: Checks):
+    def verdict(delay, elapsed: float = 0) -> dict:
+        clock = VirtualClock()
+        deadline = Deadline(clock=clock)
+        deadline.begin("https://quiz/1")
+        deadline.scraped("https://quiz/1")
+        clock.advance(elapsed)
+        token = current_deadline.set(deadline)
+        try:
+            return _apply_retry_policy({"correct": False, "delay": delay, "url": "https://quiz/2"},
+                                       "https://quiz/submit", {"answer": 1})
+        finally:
+            current_deadline.reset(token)
+
+    check("a wrong answer with time left is retried", "url" not in verdict(100))
+    check("a wrong answer too close to the deadline moves on", verdict(170).get("url") == "https://quiz/2")
+    check("past the limit only the next URL is kept", verdict(QUESTION_TIME_LIMIT + 5) == {"url": "https://quiz/2"})
+    check("without a usable delay the local clock decides: time left, retry", "url" not in verdict("soon", elapsed=30))
+    check("without a usable delay the local clock decides: out of time, move on",
+          verdict(None, elapsed=170).get("url") == "https://quiz/2")
+
+
+def chain_checks(check: Checks, think: float, use_async: bool):
+    clock = VirtualClock()
+    calls = []
+    agent.llm_limiter = RateLimiter(requests_per_second=1e9, burst=10**9, tokens_per_minute=10**12, clock=clock)
+    agent.llm_with_prompt = thinking_llm(clock, think, agent.LLM_MODEL, calls)
+    agent.fast_llm_with_prompt = thinking_llm(clock, think, agent.LLM_FAST_MODEL, calls)
+    requester.submission_log = SubmissionLog(path=None)
+
+    with TimedQuizServer(clock) as server:
+        if use_async:
+            asyncio.run(agent.run_agent_async(server.start_url))
+        else:
+            agent.run_agent(server.start_url)
+
+    by_level = {level: [s for s in server.submissions if s["level"] == level] for level in SCRIPT}
+    fast = [c for c in calls if c["model"] == agent.LLM_FAST_MODEL]
+    print(f"{'question':>8} {'submissions (virtual delay, verdict)'}")
+    for level, submissions in by_level.items():
+        print(f"{level:>8} " + ", ".join(f"{s['delay']}s {'✓' if s['correct'] else '✗'}" for s in submissions))
+    print(f"LLM calls: {len(calls)} ({len(fast)} on {agent.LLM_FAST_MODEL})")
+
+    check("a correct answer moves on at once", [s["correct"] for s in by_level[1]] == [True])
+    check("the fast model takes over with a hurry note when time runs short",
+          fast and all(c["note"] for c in fast) and all(c["note"] is None for c in calls if c not in fast))
+    wrong = by_level[2]
+    check("wrong answers are retried while a retry can land, then the chain moves on",
+          len(wrong) > 1 and all(s["delay"] < QUESTION_TIME_LIMIT for s in wrong) and len(by_level[3]) > 0,
+          str(wrong))
+    stubborn = by_level[3]
+    check("when time is up the best-known answer is resubmitted from the log and the chain moves on",
+          len(stubborn) == 1 and len(by_level[4]) > 0 and requester.submission_log.metrics["duplicates"] == 2,
+          f"{stubborn}, {requester.submission_log.metrics}")
+    check("the last question ends the chain once time is up", len(by_level[4]) == 1, str(by_level[4]))
+    llm_submissions = sum(1 for c in calls if c["action"] == "send_post")
+    check("the resubmissions did not call the LLM or the server", len(server.submissions) == llm_submissions,
+          f"{len(server.submissions)} submissions, {llm_submissions} from the LLM")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--think", type=float, default=40.0, help="virtual seconds per LLM call")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run the chain with ainvoke")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    solvers.SOLVERS_ENABLED = False
+    agent.llm_cache = LLMCache(path=None, mode="0")
+    check = Checks()
+    unit_checks(check)
+    policy_checks(check)
+    chain_checks(check, args.think, args.use_async)
+    if check.failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Latency of run_code with a cold python3 per snippet vs the warm interpreter pool,
+plus a stateful session that reuses a DataFrame loaded by an earlier call.
+
+Usage: python -m benchmarks.bench_executor [--repeat 10]
+"""
+import argparse
+import logging
+import statistics
+import time
+
+import tools.executor as executor
+from config import TEMP_DIR
+from tools.interpreter import InterpreterPool, session_manager
+
+DATA_FILE = "bench_sales.csv"
+
+SNIPPETS = {
+    "sum column": (
+        "import pandas as pd\n"
+        f"df = pd.read_csv('{DATA_FILE}')\n"
+        "print(df['value'].sum())\n"
+    ),
+    "filter + groupby": (
+        "import pandas as pd\n"
+        f"df = pd.read_csv('{DATA_FILE}')\n"
+        "print(df[df['value'] > 500].groupby('region')['value'].mean().round(2).to_dict())\n"
+    ),
+    "numpy stats": (
+        "import numpy as np\n"
+        "import pandas as pd\n"
+        f"values = pd.read_csv('{DATA_FILE}')['value'].to_numpy()\n"
+        "print(np.percentile(values, [25, 50, 75]), values.std())\n"
+    ),
+}
+
+
+def write_data(rows: int = 5000):
+    regions = ["north", "south", "east", "west"]
+    lines = ["region,value"] + [f"{regions[i % 4]},{(i * 7919) % 1000}" for i in range(rows)]
+    (TEMP_DIR / DATA_FILE).write_text("\n".join(lines) + "\n")
+
+
+def measure(code: str, repeat: int) -> list:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = executor.run_code.invoke({"code": code})
+        timings.append(time.perf_counter() - start)
+        assert result["return_code"] == 0, result["stderr"]
+    return timings
+
+
+def report(name: str, mode: str, timings: list):
+    print(f"{name:<18} {mode:<5} {statistics.mean(timings):>8.1f} "
+          f"{statistics.median(timings):>8.1f} {max(timings):>8.1f}")
+
+
+def measure_session(repeat: int) -> list:
+    """Load the CSV once in a session, then time follow-up snippets that reuse it."""
+    executor.run_code.invoke({"code": f"import pandas as pd\ndf = pd.read_csv('{DATA_FILE}')", "session": True})
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = executor.run_code.invoke({"code": "print(df['value'].sum())", "session": True})
+        timings.append(time.perf_counter() - start)
+        assert result["return_code"] == 0, result["stderr"]
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    write_data()
+
+    warm_pool = InterpreterPool(size=1)
+    warm_pool.start()
+    modes = {"cold": InterpreterPool(size=0), "warm": warm_pool}
+    try:
+        # First warm call waits for the preload; keep it out of the numbers
+        executor.interpreter_pool = warm_pool
+        measure("pass", 1)
+
+        print(f"{'snippet':<18} {'mode':<5} {'mean ms':>8} {'p50 ms':>8} {'max ms':>8}")
+        for name, code in SNIPPETS.items():
+            for mode, pool in modes.items():
+                executor.interpreter_pool = pool
+                timings = [t * 1000 for t in measure(code, args.repeat)]
+                report(name, mode, timings)
+        report("sum column", "sess", [t * 1000 for t in measure_session(args.repeat)])
+    finally:
+        warm_pool.stop()
+        session_manager.close_all()
+        (TEMP_DIR / DATA_FILE).unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
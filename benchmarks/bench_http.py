@@ -0,0 +1,133 @@
+"""Per-request latency of a new connection per call vs the shared pooled client.
+
+The local server can add a delay to every new connection to stand in for
+the TCP + TLS handshake to a remote quiz host. The script also checks the
+retry policy: a flaky GET is retried, a POST that reached the server is not,
+and retries stop once the question deadline is in its FINAL phase.
+
+Usage: python -m benchmarks.bench_http [--requests 200] [--handshake-ms 20]
+"""
+import argparse
+import logging
+import statistics
+import time
+
+import requests
+
+from benchmarks.server import LocalServer
+from clock import VirtualClock
+from tools import http_client
+from tools.deadline import Deadline, current_deadline
+
+
+def emulate_handshake(server: LocalServer, delay: float):
+    handler = server.httpd.RequestHandlerClass
+    setup = handler.setup
+
+    def slow_setup(self):
+        time.sleep(delay)
+        setup(self)
+
+    handler.setup = slow_setup
+
+
+def timed(fn, count: int) -> list:
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def flaky(failures: int):
+    state = {"left": failures, "calls": 0}
+
+    def route(handler):
+        state["calls"] += 1
+        handler.read_body()  # leave the kept-alive connection clean for the next request
+        if state["left"] > 0:
+            state["left"] -= 1
+            return 503, "text/plain", b"busy"
+        return 200, "application/json", b'{"ok": true}'
+
+    return route, state
+
+
+def busy(clock: VirtualClock, takes: float, retry_after: str = None):
+    """Always 503; each call moves the question clock on by `takes` seconds."""
+    state = {"calls": 0}
+
+    def route(handler):
+        state["calls"] += 1
+        clock.advance(takes)
+        handler.send_response(503)
+        if retry_after is not None:
+            handler.send_header("Retry-After", retry_after)
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+
+    return route, state
+
+
+def check_deadline(server: LocalServer):
+    clock = VirtualClock()
+    deadline = Deadline(clock=clock)
+    token = current_deadline.set(deadline)
+    try:
+        deadline.scraped("question")
+        clock.advance(deadline.limit - 15)
+        route, state = busy(clock, 0, retry_after="20")
+        start = time.perf_counter()
+        status = http_client.request("GET", server.add("/busy-final", route)).status_code
+        took = time.perf_counter() - start
+        print(f"{'✓' if status == 503 and state['calls'] == 1 and took < 5 else '❌'} "
+              f"GET in the FINAL phase neither retried nor waited out Retry-After "
+              f"({state['calls']} attempt, {took:.1f}s)")
+
+        deadline.submitted("question", {}, correct=False, delay=100)
+        route, state = busy(clock, 25)
+        http_client.request("GET", server.add("/busy-slow", route))
+        print(f"{'✓' if state['calls'] == 3 else '❌'} retries stopped when the deadline reached FINAL "
+              f"({state['calls']} attempts)")
+    finally:
+        current_deadline.reset(token)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--handshake-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with LocalServer() as server:
+        url = server.add("/data.json", (200, "application/json", b'{"value": 42}' * 50))
+        if args.handshake_ms:
+            emulate_handshake(server, args.handshake_ms / 1000)
+
+        modes = {
+            "requests.get per call": lambda: requests.get(url, timeout=10).content,
+            "shared http_client": lambda: http_client.request("GET", url, timeout=10).content,
+        }
+        print(f"{args.requests} GETs, emulated handshake {args.handshake_ms:.0f} ms per new connection")
+        print(f"{'client':<24} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        for name, fn in modes.items():
+            timings = sorted(timed(fn, args.requests))
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            print(f"{name:<24} {statistics.mean(timings):>8.2f} {statistics.median(timings):>8.2f} {p95:>8.2f}")
+        print(f"reuse: {http_client.get_http_stats()}")
+
+        route, state = flaky(2)
+        ok = http_client.request("GET", server.add("/flaky-get", route)).status_code == 200
+        print(f"{'✓' if ok and state['calls'] == 3 else '❌'} flaky GET retried ({state['calls']} attempts)")
+
+        route, state = flaky(2)
+        status = http_client.request("POST", server.add("/flaky-post", route), json={"answer": 1}).status_code
+        print(f"{'✓' if status == 503 and state['calls'] == 1 else '❌'} POST answered 503 was not resent ({state['calls']} attempt)")
+
+        check_deadline(server)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Check the LLM response cache and measure a re-run chain with it.
+
+A quiz chain from the fake quiz server is solved once with a scripted LLM
+(recording every response), run again in the same process (memory hits),
+then replayed from the SQLite file with an LLM that fails on any call, as
+an offline run would. Checks also cover key normalization, the per-run
+opt-out, retries after a wrong answer, TTL expiry, LRU size accounting and replay misses.
+
+Usage: python -m benchmarks.bench_llm_cache [--levels 4] [--llm-latency 1.0]
+"""
+import argparse
+import logging
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+import agent
+import solvers
+from benchmarks.cache_harness import Checks
+from benchmarks.fakes import FakeQuizServer, scripted_quiz_llm
+from llm_cache import CacheMiss, LLMCache, cache_key, prompt_fingerprint
+from ratelimit import RateLimiter
+from tools import run_code
+from tools.context import JobContext, current_job
+from tools.deadline import Deadline, current_deadline
+
+
+def counting_llm(latency: float, calls: list) -> RunnableLambda:
+    llm = scripted_quiz_llm(latency)
+
+    def respond(inputs):
+        calls.append(1)
+        return llm.invoke(inputs)
+
+    return RunnableLambda(respond)
+
+
+def offline_llm(inputs):
+    raise RuntimeError("the LLM was called during an offline replay")
+
+
+def timed_chain(url: str) -> float:
+    start = time.perf_counter()
+    agent.run_agent(url)
+    return time.perf_counter() - start
+
+
+def key_checks(check: Checks):
+    fingerprint = agent.PROMPT_FINGERPRINT
+
+    def history(call_id: str, workdir: str) -> list:
+        return [
+            {"role": "user", "content": "https://quiz.example/1"},
+            AIMessage(content="", tool_calls=[{"name": "run_code", "args": {"code": "1"}, "id": call_id}], id=str(uuid.uuid4())),
+            ToolMessage(content=f"saved {workdir}/out.csv", tool_call_id=call_id, name="run_code"),
+        ]
+
+    first, second = JobContext("cache-a"), JobContext("cache-b")
+    token = current_job.set(first)
+    key_a = cache_key(fingerprint, history("call_1", str(first.workdir)))
+    current_job.reset(token)
+    token = current_job.set(second)
+    key_b = cache_key(fingerprint, history("call_2", str(second.workdir)))
+    current_job.reset(token)
+    check("message ids, tool-call ids and the workdir don't change the key", key_a == key_b)
+
+    text_parts = [AIMessage(content=[{"type": "text", "text": "EN"}, {"type": "text", "text": "D"}])]
+    check("text parts hash like the same text as a string",
+          cache_key(fingerprint, text_parts) == cache_key(fingerprint, [AIMessage(content="END")]))
+
+    other_tools = prompt_fingerprint(agent.LLM_MODEL, agent.SYSTEM_PROMPT, [t for t in agent.TOOLS if t is not run_code])
+    check("a different tool set changes the key", cache_key(other_tools, text_parts) != cache_key(fingerprint, text_parts))
+
+    agent.llm_cache = LLMCache(path=None, mode="1")
+    check("a run can opt out with configurable llm_cache=False",
+          agent._cache_key(text_parts, {"configurable": {"llm_cache": False}}, fingerprint) is None
+          and agent._cache_key(text_parts, {"configurable": {}}, fingerprint) is not None)
+
+    deadline = Deadline()
+    deadline.begin("https://quiz.example/1")
+    deadline.submitted("https://quiz.example/submit", {"answer": 1}, False, None)
+    token = current_deadline.set(deadline)
+    try:
+        retry_key = agent._cache_key(text_parts, {"configurable": {}}, fingerprint)
+    finally:
+        current_deadline.reset(token)
+    check("a retry after a wrong answer skips the cache", retry_key is None)
+
+
+def backend_checks(check: Checks, directory: Path):
+    cache = LLMCache(path=directory / "ttl.sqlite3", mode="1", ttl=0.2)
+    cache.put("k", AIMessage(content="hello"))
+    fresh = cache.get("k")
+    time.sleep(0.3)
+    check("entries expire after the TTL", fresh is not None and cache.get("k") is None
+          and cache.disk.stats()["entries"] == 0, str(cache.stats()))
+
+    cache = LLMCache(path=directory / "lru.sqlite3", mode="1", memory_bytes=4096, disk_bytes=16384)
+    for i in range(40):
+        cache.put(f"k{i}", AIMessage(content=f"{i}" * 400))
+    stats = cache.stats()
+    check("memory and disk stay within their byte budgets",
+          stats["memory_bytes"] <= 4096 and stats["disk"]["bytes"] <= 16384 and stats["evictions"] > 0, str(stats))
+    check("the most recent entry survives eviction", cache.get("k39") is not None)
+
+    cache.put("empty", AIMessage(content=""))
+    check("empty replies are not stored", cache.get("empty") is None and cache.stats()["skipped"] == 1)
+
+    hit = cache.get("k39")
+    again = cache.get("k39")
+    check("each hit gets fresh message ids", hit.id != again.id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--levels", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="seconds per fake LLM call")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    solvers.SOLVERS_ENABLED = False
+    agent.llm_limiter = RateLimiter(requests_per_second=1e9, burst=10**9, tokens_per_minute=10**12)
+    check = Checks()
+    key_checks(check)
+
+    calls = []
+    with tempfile.TemporaryDirectory() as directory, FakeQuizServer(levels=args.levels) as server:
+        path = Path(directory) / "llm.sqlite3"
+        backend_checks(check, Path(directory))
+        url = server.new_chain()
+
+        agent.llm_cache = LLMCache(path=path, mode="1")
+        agent.llm_with_prompt = counting_llm(args.llm_latency, calls)
+        recorded = timed_chain(url)
+        recorded_calls = len(calls)
+
+        calls.clear()
+        rerun = timed_chain(url)
+        check("a re-run of the same chain never calls the LLM", not calls, f"{len(calls)} calls")
+        stats = agent.llm_cache.stats()
+        check("the re-run is served from memory", stats["memory_hits"] == recorded_calls, str(stats))
+
+        agent.llm_cache = LLMCache(path=path, mode="replay")
+        agent.llm_with_prompt = RunnableLambda(offline_llm)
+        submissions = server.submissions
+        replayed = timed_chain(url)
+        check("replay from SQLite finishes the chain with the LLM offline",
+              server.submissions - submissions == args.levels and agent.llm_cache.stats()["hits"] == recorded_calls,
+              str(agent.llm_cache.stats()))
+        try:
+            agent.run_agent(server.new_chain())
+            check("a replay miss raises CacheMiss", False)
+        except CacheMiss:
+            check("a replay miss raises CacheMiss", True)
+
+        print(f"{args.levels} questions, {args.llm_latency:.1f}s per LLM call")
+        print(f"{'run':>18} {'seconds':>8} {'LLM calls':>10}")
+        print(f"{'recorded':>18} {recorded:>8.2f} {recorded_calls:>10}")
+        print(f"{'re-run (memory)':>18} {rerun:>8.2f} {0:>10}")
+        print(f"{'replay (SQLite)':>18} {replayed:>8.2f} {0:>10}")
+        print(f"disk: {agent.llm_cache.disk.stats()}")
+
+    if check.failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Latency of the download/scrape that follows a scrape, with and without prefetch.
+
+A local page links to a CSV, an over-the-limit file and a same-origin
+sub-page, all served with an emulated network delay. Each round scrapes
+the page, "thinks" for --think seconds like the LLM would, then downloads
+the CSV and scrapes the sub-page. Checks also cover joining an in-flight
+prefetch, the per-page limits and cancellation when the chain ends.
+
+Usage: python -m benchmarks.bench_prefetch [--rounds 5] [--delay-ms 300] [--think 1.0]
+"""
+import argparse
+import logging
+import statistics
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import tools.downloader as downloader
+import tools.prefetch as prefetch
+import tools.scraper as scraper
+from benchmarks.cache_harness import Checks
+from benchmarks.server import LocalServer, html
+from config import TEMP_DIR
+from tools import download_file, scrape_page
+from tools.context import JobContext, current_job
+from tools.download_cache import DownloadCache
+
+
+class SlowRoute:
+    """Static route answered after `delay` seconds, counting requests."""
+
+    def __init__(self, status: int, content_type: str, body: bytes, delay: float):
+        self.route = (status, content_type, body)
+        self.delay = delay
+        self.requests = 0
+
+    def __call__(self, handler):
+        self.requests += 1
+        time.sleep(self.delay)
+        return self.route
+
+
+def quiz_page(round_id: int, extra_files: int = 0) -> str:
+    files = "".join(f'<a href="/r{round_id}/extra{i}.csv">extra {i}</a> ' for i in range(extra_files))
+    return (
+        f"<html><body><h1>Question {round_id}</h1>"
+        f'<p>Download <a href="/r{round_id}/data.csv">the data</a> and read '
+        f'<a href="/r{round_id}/hint">the hint page</a>. Ignore <a href="/r{round_id}/huge.bin.zip">the archive</a>. {files}</p>'
+        "<p>POST the answer to /submit as JSON with the sum of the value column.</p></body></html>"
+    )
+
+
+def add_round(server: LocalServer, round_id: int, delay: float, extra_files: int = 0) -> dict:
+    routes = {
+        "page": SlowRoute(*html(quiz_page(round_id, extra_files)), delay),
+        "csv": SlowRoute(200, "text/csv", b"value\n" + b"\n".join(str(i).encode() for i in range(1000)), delay),
+        "hint": SlowRoute(*html("<html><body><p>The hint: values are integers, no header tricks here.</p></body></html>"), delay),
+        "huge": SlowRoute(200, "application/zip", b"\0" * (2 * 1024 * 1024), delay),
+    }
+    server.add(f"/r{round_id}/q", routes["page"])
+    server.add(f"/r{round_id}/data.csv", routes["csv"])
+    server.add(f"/r{round_id}/hint", routes["hint"])
+    server.add(f"/r{round_id}/huge.bin.zip", routes["huge"])
+    for i in range(extra_files):
+        server.add(f"/r{round_id}/extra{i}.csv", SlowRoute(200, "text/csv", b"x\n1\n", delay))
+    return routes
+
+
+def play_round(server: LocalServer, round_id: int, think: float) -> tuple:
+    base = f"{server.base_url}/r{round_id}"
+    scrape_page.invoke({"url": f"{base}/q"})
+    time.sleep(think)
+    start = time.perf_counter()
+    download_file.invoke({"url": f"{base}/data.csv", "filename": f"prefetch-{round_id}.csv"})
+    download_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    scrape_page.invoke({"url": f"{base}/hint"})
+    page_ms = (time.perf_counter() - start) * 1000
+    return download_ms, page_ms
+
+
+def checks(server: LocalServer, delay: float, check: Checks):
+    prefetch.PREFETCH_ENABLED = True
+
+    routes = add_round(server, 900, delay)
+    scrape_page.invoke({"url": f"{server.base_url}/r900/q"})
+    download_file.invoke({"url": f"{server.base_url}/r900/data.csv", "filename": "prefetch-900.csv"})
+    check("a download of a URL being prefetched joins it instead of fetching twice",
+          routes["csv"].requests == 1 and prefetch.prefetcher.metrics["joined"] >= 1, str(routes["csv"].requests))
+    time.sleep(delay * 3)
+    check("files over PREFETCH_MAX_MB are abandoned", prefetch.prefetcher.metrics["abandoned"] >= 1
+          and downloader.download_cache.lookup(f"{server.base_url}/r900/huge.bin.zip") is None)
+
+    skipped = prefetch.prefetcher.metrics["skipped_over_limit"]
+    add_round(server, 901, 0, extra_files=prefetch.PREFETCH_MAX_FILES + 3)
+    scrape_page.invoke({"url": f"{server.base_url}/r901/q"})
+    time.sleep(0.5)
+    check("links beyond the per-page limit are skipped",
+          prefetch.prefetcher.metrics["skipped_over_limit"] - skipped == 5, str(prefetch.prefetcher.metrics))
+
+    slow = add_round(server, 902, delay=2.0)
+    job = JobContext("prefetch-bench")
+    token = current_job.set(job)
+    try:
+        scrape_page.invoke({"url": f"{server.base_url}/r902/q"})
+    finally:
+        current_job.reset(token)
+    time.sleep(0.2)
+    before = Counter(prefetch.prefetcher.metrics)
+    job.close()
+    job.cleanup()
+    time.sleep(2.5)
+    after = prefetch.prefetcher.metrics
+    check("ending the chain stops its prefetches",
+          after["cancelled"] + after["abandoned"] > before["cancelled"] + before["abandoned"]
+          and downloader.download_cache.lookup(f"{server.base_url}/r902/data.csv") is None,
+          f"requests={slow['csv'].requests} {dict(after)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--delay-ms", type=float, default=300)
+    parser.add_argument("--think", type=float, default=1.0, help="seconds the LLM spends between tool calls")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    delay = args.delay_ms / 1000
+
+    with tempfile.TemporaryDirectory() as directory, LocalServer() as server:
+        cache = DownloadCache(Path(directory))
+        downloader.download_cache = prefetch.download_cache = cache
+        prefetch.prefetcher = prefetch.Prefetcher(max_bytes=1024 * 1024)
+        downloader.prefetcher = scraper.prefetcher = prefetch.prefetcher
+
+        print(f"{args.rounds} rounds, {args.delay_ms:.0f} ms per request, {args.think:.1f}s thinking")
+        print(f"{'prefetch':>9} {'download ms':>12} {'next page ms':>13}")
+        for enabled in (False, True):
+            prefetch.PREFETCH_ENABLED = enabled
+            offset = 100 if enabled else 0
+            timings = []
+            for i in range(args.rounds):
+                add_round(server, offset + i, delay)
+                timings.append(play_round(server, offset + i, args.think))
+            downloads, pages = zip(*timings)
+            print(f"{'on' if enabled else 'off':>9} {statistics.median(downloads):>12.1f} {statistics.median(pages):>13.1f}")
+
+        check = Checks()
+        checks(server, delay, check)
+        print(f"prefetch: {prefetch.prefetcher.stats()}")
+        prefetch.prefetcher.shutdown()
+
+    for path in TEMP_DIR.glob("prefetch-*.csv"):
+        path.unlink()
+    if check.failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
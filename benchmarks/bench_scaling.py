@@ -0,0 +1,251 @@
+"""Throughput of 1..N worker processes sharing the SQLite job store, and recovery from a killed one.
+
+Each worker process (this script with --worker) runs StoreJobManager with
+--workers chains at once, the real agent graph and a scripted LLM that
+sleeps --llm-latency and burns --cpu-ms of CPU per call (standing in for
+the in-process work of a step). Chains come from a local fake quiz
+server; solvers are off so every question goes through the agent.
+
+1. For every process count: start the processes, queue --chains chains
+   (the last quarter from a second submitter) and time until all end.
+2. Kill a process with SIGKILL in the middle of a chain; once its lease
+   runs out another process must resume the chain from its checkpoint
+   (the questions already answered are not fetched again).
+3. Cancel a running chain through the store; its process must stop it.
+
+Usage: python -m benchmarks.bench_scaling [--processes 1 2 4] [--chains 24] [--workers 2]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import agent
+import solvers
+import tools.requester as requester
+from benchmarks.cache_harness import Checks
+from benchmarks.fakes import FakeQuizServer, scripted_quiz_llm
+from job_store import JobStore
+from jobs import FINISHED, SUCCEEDED, CANCELLED, RUNNING, StoreJobManager
+from langchain_core.runnables import RunnableLambda
+from llm_cache import LLMCache
+from ratelimit import RateLimiter
+from tools.submissions import SubmissionLog
+
+
+class CountingQuizServer(FakeQuizServer):
+    """FakeQuizServer counting the requests for each question page."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pages = Counter()
+
+    def _page(self, handler):
+        self.pages[handler.path.split("?")[0]] += 1
+        return super()._page(handler)
+
+
+def _burn(ms: float):
+    end = time.perf_counter() + ms / 1000
+    while time.perf_counter() < end:
+        pass
+
+
+def busy_llm(latency: float, cpu_ms: float) -> RunnableLambda:
+    scripted = scripted_quiz_llm(latency)
+
+    def respond(inputs):
+        _burn(cpu_ms)
+        return scripted.invoke(inputs)
+
+    async def arespond(inputs):
+        _burn(cpu_ms)
+        return await scripted.ainvoke(inputs)
+
+    return RunnableLambda(respond, afunc=arespond)
+
+
+def worker_main(args):
+    """A worker process with the fakes in place of Gemini."""
+    import worker
+
+    logging.getLogger().setLevel(logging.WARNING)
+    solvers.SOLVERS_ENABLED = False
+    agent.llm_with_prompt = busy_llm(args.llm_latency, args.cpu_ms)
+    agent.llm_cache = LLMCache(path=None, mode="0")
+    agent.llm_limiter = RateLimiter(requests_per_second=1e9, burst=10**9, tokens_per_minute=10**12)
+    requester.submission_log = solvers.submission_log = SubmissionLog(args.store.with_suffix(".submissions"))
+    manager = StoreJobManager(
+        agent.run_agent_async if args.use_async else agent.run_agent,
+        JobStore(args.store, lease=args.lease),
+        workers=args.workers,
+        heartbeat=args.lease / 3,
+        limiter=agent.llm_limiter,
+    )
+    asyncio.run(worker.serve(manager, services=False))
+
+
+class Workers:
+    """Worker processes started from this script, logging to files next to the store."""
+
+    def __init__(self, store: Path, args):
+        self.store = store
+        self.args = args
+        self.procs = []
+
+    def start(self, count: int, workers: int) -> list:
+        started = []
+        for _ in range(count):
+            cmd = [sys.executable, "-m", "benchmarks.bench_scaling", "--worker", "--store", str(self.store),
+                   "--workers", str(workers), "--lease", str(self.args.lease),
+                   "--llm-latency", str(self.args.llm_latency), "--cpu-ms", str(self.args.cpu_ms)]
+            if self.args.use_async:
+                cmd.append("--async")
+            log = open(self.store.with_name(f"worker-{len(self.procs)}.log"), "w")
+            proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+            self.procs.append(proc)
+            started.append(proc)
+        return started
+
+    def stop(self):
+        for proc in self.procs:
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGTERM)
+        for proc in self.procs:
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        self.procs = []
+
+
+def wait_for(condition, timeout: float, interval: float = 0.1) -> bool:
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if condition():
+            return True
+        time.sleep(interval)
+    return condition()
+
+
+def scaling_run(server, directory: Path, processes: int, args) -> dict:
+    store_path = directory / f"scaling-{processes}.sqlite3"
+    store = JobStore(store_path, lease=args.lease)
+    workers = Workers(store_path, args)
+    workers.start(processes, args.workers)
+    try:
+        ready = wait_for(lambda: store.stats()["processes"] >= processes, timeout=120)
+        if not ready:
+            raise SystemExit(f"worker processes did not start, see {store_path.parent}/worker-*.log")
+        late = args.chains // 4
+        ids = [store.submit(f"chain-{processes}-{i}", server.new_chain(), "a" if i < args.chains - late else "b",
+                            queue_size=args.chains)["job_id"] for i in range(args.chains)]
+        start = time.perf_counter()
+        wait_for(lambda: all(store.get(i)["status"] in FINISHED for i in ids), timeout=args.chains * 60)
+        elapsed = time.perf_counter() - start
+    finally:
+        workers.stop()
+    records = [store.get(i) for i in ids]
+    order = sorted(records, key=lambda r: r["started_at"] or float("inf"))
+    return {
+        "seconds": elapsed,
+        "ok": sum(r["status"] == SUCCEEDED for r in records),
+        "per_process": Counter(r["worker"] for r in records),
+        "late_ranks": [rank for rank, r in enumerate(order, 1) if r["client"] == "b"],
+    }
+
+
+def crash_run(directory: Path, args, check: Checks):
+    levels = 6
+    store_path = directory / "crash.sqlite3"
+    store = JobStore(store_path, lease=args.lease)
+    workers = Workers(store_path, args)
+    with CountingQuizServer(levels=levels) as server:
+        try:
+            (first,) = workers.start(1, 1)
+            wait_for(lambda: store.stats()["processes"] >= 1, timeout=120)
+            url = server.new_chain()
+            job_id = store.submit("crash", url)["job_id"]
+            wait_for(lambda: server.submissions >= 2, timeout=120, interval=0.02)
+            before = server.submissions
+            first.send_signal(signal.SIGKILL)
+            first.wait()
+            killed_at = time.perf_counter()
+            workers.start(1, 1)
+            finished = wait_for(lambda: store.get(job_id)["status"] in FINISHED, timeout=args.lease + 120)
+            recovered = time.perf_counter() - killed_at
+            record = store.get(job_id)
+            submissions = server.submissions
+
+            cancel_id = store.submit("cancel", server.new_chain())["job_id"]
+            wait_for(lambda: store.get(cancel_id)["status"] == RUNNING, timeout=30)
+            store.cancel(cancel_id)
+            cancelled = wait_for(lambda: store.get(cancel_id)["status"] == CANCELLED, timeout=args.lease + 30)
+        finally:
+            workers.stop()
+
+    print(f"killed after {before} of {levels} answers; chain done {recovered:.2f}s later "
+          f"(lease {args.lease:g}s), attempts {record['attempts']}, {submissions} submissions in total")
+    first_page = url.replace(server.base_url, "")
+    check("a chain whose process was killed is finished by another one",
+          finished and record["status"] == SUCCEEDED and record["attempts"] == 2, str(record))
+    check("it resumes from its checkpoint instead of starting over",
+          server.pages[first_page] == 1 and submissions <= levels + 1, f"{dict(server.pages)} {submissions}")
+    check("finished chains leave no checkpoints behind", store.stats()["checkpoint_threads"] == 0, str(store.stats()))
+    check("a cancellation reaches the process running the chain", cancelled, str(store.get(cancel_id)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chains", type=int, default=24)
+    parser.add_argument("--levels", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=2, help="chains each process runs at once")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds per fake LLM call")
+    parser.add_argument("--cpu-ms", type=float, default=10, help="CPU milliseconds per fake LLM call")
+    parser.add_argument("--lease", type=float, default=3, help="job lease seconds (heartbeat every third)")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run chains with ainvoke")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--store", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker_main(args)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    check = Checks()
+    with tempfile.TemporaryDirectory() as tmp, FakeQuizServer(levels=args.levels) as server:
+        print(f"{os.cpu_count()} CPU(s), {args.workers} chains per process, "
+              f"{args.llm_latency:g}s + {args.cpu_ms:g}ms CPU per LLM call")
+        print(f"{'processes':>9} {'chains':>7} {'ok':>4} {'seconds':>8} {'chains/s':>9} {'speedup':>8}  per process")
+        runs = {}
+        for processes in args.processes:
+            run = runs[processes] = scaling_run(server, Path(tmp), processes, args)
+            speedup = runs[args.processes[0]]["seconds"] / run["seconds"]
+            spread = sorted(run["per_process"].values(), reverse=True)
+            print(f"{processes:>9} {args.chains:>7} {run['ok']:>4} {run['seconds']:>8.2f} "
+                  f"{args.chains / run['seconds']:>9.2f} {speedup:>8.2f}  {spread}")
+
+        check("every chain succeeds at every process count", all(r["ok"] == args.chains for r in runs.values()),
+              str({p: r["ok"] for p, r in runs.items()}))
+        most, fewest = max(args.processes), min(args.processes)
+        check(f"{most} processes finish the chains faster than {fewest}",
+              runs[most]["seconds"] * 1.5 < runs[fewest]["seconds"],
+              f"{runs[most]['seconds']:.2f}s vs {runs[fewest]['seconds']:.2f}s")
+        check("every process gets chains", len(runs[most]["per_process"]) == most, str(runs[most]["per_process"]))
+        late = runs[fewest]["late_ranks"]
+        check("a later submitter's chains do not wait behind an earlier one's backlog",
+              max(late) <= 2 * len(late) + args.workers * fewest, str(late))
+        crash_run(Path(tmp), args, check)
+    if check.failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Compare per-call scrape latency: one-off browser vs the warm browser pool.
+
+Checks first that the tier memory only skips HTTP for routes that keep failing.
+
+Usage: python -m benchmarks.bench_scraper [--calls 20]
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.cache_harness import Checks
+from benchmarks.server import LocalServer, html
+
+import tools.scraper as scraper
+from tools.browser import browser_pool
+from tools.scraper import BROWSER_TIER, HTTP_TIER, scrape_page
+
+PAGE = """<html><head><title>Quiz</title></head><body>
+<h1>Question</h1><p>What is the sum of the value column?</p>
+<a href="/data.csv">data.csv</a>
+<script>document.body.insertAdjacentHTML('beforeend', '<p id="x">rendered</p>')</script>
+</body></html>"""
+
+
+def measure(url: str, calls: int) -> list:
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        content = scrape_page.invoke({"url": url})
+        timings.append(time.perf_counter() - start)
+        if content.startswith("Error"):
+            raise RuntimeError(content)
+    return timings
+
+
+def escalate(url: str):
+    """An HTTP-tier failure on `url` that the browser then served."""
+    key, _ = scraper._plan(url)
+    scraper._settle(key, None)
+    scraper._remember(key, BROWSER_TIER)
+
+
+def tier_checks(check: Checks):
+    url = "http://quiz.example/question/1"
+    escalate(url)
+    check("one HTTP failure does not send a route to the browser", scraper._plan(url)[1])
+    escalate(url)
+    check("repeated HTTP failures send the route straight to the browser",
+          not scraper._plan("http://quiz.example/question/2")[1])
+
+    key = scraper._route_key(url)
+    until = scraper._tier_memory[key][1]
+    scraper._remember(key, BROWSER_TIER)  # what a call during the pin records
+    check("calls served by the browser during the pin do not extend it", scraper._tier_memory[key][1] == until)
+
+    scraper._tier_memory[key] = (BROWSER_TIER, time.monotonic())  # the pin runs out
+    check("the route tries HTTP again once the pin expires", scraper._plan(url)[1])
+    escalate(url)
+    check("a route still failing over HTTP is pinned again", not scraper._plan(url)[1])
+
+    scraper._remember(key, HTTP_TIER)
+    escalate(url)
+    check("an HTTP success starts the failure count over", scraper._plan(url)[1])
+    scraper._tier_memory.clear()
+    scraper._http_failures.clear()
+
+
+def report(label: str, timings: list):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(
+        f"{label:<10} mean={statistics.mean(timings) * 1000:8.1f} ms  "
+        f"p50={statistics.median(timings) * 1000:8.1f} ms  p95={p95 * 1000:8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=20)
+    args = parser.parse_args()
+
+    check = Checks()
+    tier_checks(check)
+    if check.failures:
+        raise SystemExit(1)
+
+    with LocalServer({"/quiz": html(PAGE)}) as server:
+        url = server.base_url + "/quiz"
+
+        report("per-call", measure(url, args.calls))
+
+        browser_pool.start()
+        try:
+            measure(url, 1)  # warm-up
+            report("pooled", measure(url, args.calls))
+            print(f"pool stats: {browser_pool.stats()}")
+        finally:
+            browser_pool.stop()
+
+
+if __name__ == "__main__":
+    main()
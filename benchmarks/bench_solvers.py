@@ -0,0 +1,126 @@
+"""Check the built-in solvers and measure the latency they save on quiz chains.
+
+First each template (arithmetic, base64, CSV column sum with a filter, table
+row count) is solved against local pages, and a rejected answer is checked
+to hand the question over to the agent. Then quiz chains where every other
+question is worded so no solver recognises it are run through the agent
+with the solvers off and on, using the scripted LLM; when the agent takes
+a question back from the solvers it must see the earlier ones summarized.
+
+Usage: python -m benchmarks.bench_solvers [--chains 8] [--levels 4] [--llm-latency 1.0]
+"""
+import argparse
+import base64
+import json
+import logging
+import time
+from pathlib import Path
+
+from langchain_core.runnables import RunnableLambda
+
+import agent
+import solvers
+from benchmarks.cache_harness import Checks
+from benchmarks.fakes import FakeQuizServer, scripted_quiz_llm
+from benchmarks.server import LocalServer, html
+from compaction import SUMMARY_PREFIX
+from llm_cache import LLMCache
+from ratelimit import RateLimiter
+
+PAGES = Path(__file__).parent / "pages"
+CSV = b"region,value\nNorth,10\nSouth,5\nNorth,32\nEast,7\n"
+
+
+def template_checks(check: Checks):
+    verdicts = []
+
+    def submit(handler):
+        data = json.loads(handler.read_body())
+        verdicts.append(data)
+        correct = not data["url"].endswith("/wrong")
+        return 200, "application/json", json.dumps({"correct": correct}).encode()
+
+    with LocalServer({"/submit": submit}) as server:
+        encoded = base64.b64encode(b"open sesame").decode()
+        pages = {
+            "/arith": html("<p>What is 6 * 7? POST the answer to /submit.</p>"),
+            "/b64": html(f"<p>Decode this base64 string and submit it:</p><pre>{encoded}</pre>"
+                         "<p>Submit to /submit as JSON.</p>"),
+            "/data/q834.csv": (200, "text/csv", CSV),
+            "/quiz-834": html((PAGES / "demo_quiz.html").read_text().replace("https://example.com", server.base_url)),
+            "/quiz-2": html((PAGES / "table_quiz.html").read_text()),
+            "/wrong": html("<p>What is 1 + 1? POST the answer to /submit.</p>"),
+        }
+        server.routes.update(pages)
+
+        expected = {"/arith": 42, "/b64": "open sesame", "/quiz-834": 42, "/quiz-2": 4}
+        for path, answer in expected.items():
+            question = solvers.Question.from_page(server.base_url + path, solvers.fetch_page(server.base_url + path))
+            solved = solvers.solve(question)
+            check(f"{path} answered {answer!r}", solved is not None and solved[1] == answer, str(solved))
+
+        question = solvers.Question.from_page(server.base_url + "/quiz-834", pages["/quiz-834"][2].decode())
+        check("submit URL and payload url come from the page", question.submit_url() == server.base_url + "/submit"
+              and question.payload_url() == server.base_url + "/quiz-834", f"{question.submit_url()} {question.payload_url()}")
+
+        handoff = solvers.fast_path(server.base_url + "/wrong")
+        check("a rejected answer hands the question to the agent with a note",
+              handoff is not None and handoff.startswith(server.base_url + "/wrong") and "2" in handoff, str(handoff))
+
+        handoff = solvers.fast_path(server.base_url + "/arith")
+        check("an accepted last answer finishes the chain without the agent", handoff is None, str(handoff))
+
+
+def counting_llm(latency: float, calls: list) -> RunnableLambda:
+    llm = scripted_quiz_llm(latency)
+
+    def respond(inputs):
+        calls.append(inputs["messages"])
+        return llm.invoke(inputs)
+
+    return RunnableLambda(respond)
+
+
+def run_chains(server: FakeQuizServer, chains: int, enabled: bool) -> float:
+    solvers.SOLVERS_ENABLED = enabled
+    start = time.perf_counter()
+    for _ in range(chains):
+        agent.run_agent(server.new_chain())
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chains", type=int, default=8)
+    parser.add_argument("--levels", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="seconds per fake LLM call")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    check = Checks()
+    template_checks(check)
+
+    calls = []
+    agent.llm_with_prompt = counting_llm(args.llm_latency, calls)
+    agent.llm_cache = LLMCache(path=None, mode="0")
+    agent.llm_limiter = RateLimiter(requests_per_second=1e9, burst=10**9, tokens_per_minute=10**12)
+    with FakeQuizServer(levels=args.levels, worded_every=2) as server:
+        print(f"{args.chains} chains x {args.levels} questions, half of them worded for the agent only, "
+              f"{args.llm_latency:.1f}s per LLM call")
+        print(f"{'solvers':>8} {'seconds':>8} {'LLM calls':>10} {'submissions':>12}")
+        for enabled in (False, True):
+            calls.clear()
+            submissions = server.submissions
+            elapsed = run_chains(server, args.chains, enabled)
+            print(f"{'on' if enabled else 'off':>8} {elapsed:>8.2f} {len(calls):>10} {server.submissions - submissions:>12}")
+        summarized = [messages for messages in calls if str(messages[0].content).startswith(SUMMARY_PREFIX)]
+        check("an agent taking a later question back from the solvers sees the earlier ones summarized",
+              len(summarized) > 0, f"{len(summarized)} of {len(calls)} calls")
+    print(json.dumps(solvers.solver_stats(), indent=2))
+
+    if check.failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
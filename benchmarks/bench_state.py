@@ -0,0 +1,95 @@
+"""Per-step overhead of the agent graph over long chains, driven by a fake LLM.
+
+Compares the compiled `agent.app` (delta updates, append-only history)
+with the previous state handling (node returns the whole list, merged by
+`add_messages`). The fake LLM calls a tool name that does not exist, so
+ToolNode answers instantly and only graph overhead is measured.
+
+Usage: python -m benchmarks.bench_state [--steps 100 200 400]
+"""
+import argparse
+import time
+import tracemalloc
+from typing import Annotated, List, TypedDict
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import StateGraph, START
+from langgraph.graph.message import add_messages
+from langgraph.prebuilt import ToolNode
+
+import agent
+from compaction import compaction_node
+from llm_cache import LLMCache
+from ratelimit import RateLimiter
+
+
+def fake_llm(steps: int) -> RunnableLambda:
+    """Emit one tool call per step (with a bulky argument), then END."""
+    counter = {"n": 0}
+
+    def respond(inputs):
+        counter["n"] += 1
+        if counter["n"] > steps:
+            return AIMessage(content="END")
+        return AIMessage(
+            content="thinking " * 50,
+            tool_calls=[{"name": "noop", "args": {"note": "x" * 500}, "id": f"call-{counter['n']}"}],
+        )
+
+    return RunnableLambda(respond)
+
+
+class LegacyState(TypedDict):
+    messages: Annotated[List, add_messages]
+
+
+def legacy_app():
+    def legacy_agent_node(state):
+        result = agent.llm_with_prompt.invoke({"messages": state["messages"]})
+        return {"messages": state["messages"] + [result]}
+
+    graph = StateGraph(LegacyState)
+    graph.add_node("agent", legacy_agent_node)
+    graph.add_node("tools", ToolNode(agent.TOOLS))
+    graph.add_node("compact", compaction_node)
+    graph.add_edge(START, "agent")
+    graph.add_edge("tools", "compact")
+    graph.add_edge("compact", "agent")
+    graph.add_conditional_edges("agent", lambda state: agent.route_decision(state))
+    return graph.compile()
+
+
+def run(app, steps: int) -> tuple:
+    agent.llm_with_prompt = fake_llm(steps)
+    agent.llm_cache = LLMCache(path=None, mode="0")
+    agent.llm_limiter = RateLimiter(requests_per_second=1e9, burst=10**9, tokens_per_minute=10**12)
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = app.invoke(
+        {"messages": [{"role": "user", "content": "https://quiz.example.com/q1"}]},
+        config={"recursion_limit": steps * 4 + 10},
+    )
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(result["messages"]) >= steps * 2
+    return elapsed / steps, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, nargs="+", default=[100, 200, 400])
+    args = parser.parse_args()
+
+    legacy = legacy_app()
+    print(f"{'steps':>6} {'legacy ms/step':>15} {'app ms/step':>12} {'legacy peak MB':>15} {'app peak MB':>12}")
+    for steps in args.steps:
+        legacy_step, legacy_peak = run(legacy, steps)
+        app_step, app_peak = run(agent.app, steps)
+        print(f"{steps:>6} {legacy_step * 1000:>15.2f} {app_step * 1000:>12.2f} "
+              f"{legacy_peak / 2**20:>15.1f} {app_peak / 2**20:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
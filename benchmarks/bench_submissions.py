@@ -0,0 +1,169 @@
+"""Check the submission log and measure a restarted chain replaying its answers.
+
+First send_post is driven directly against a local quiz endpoint: a
+repeated wrong answer must be answered locally, a new wrong answer must
+list the ones rejected before, and a repeat with no time left must move
+on to the URL the server named; another chain starts with a clean slate.
+Then a chain whose questions no solver recognises is run through the
+agent with the scripted LLM, and resumed after a "restart" (a new
+SubmissionLog on the same SQLite file): the fast path replays the
+accepted answers without the LLM, while a new chain solves them again.
+
+Usage: python -m benchmarks.bench_submissions [--levels 4] [--llm-latency 1.0]
+"""
+import argparse
+import json
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+import agent
+import solvers
+import tools.requester as requester
+from benchmarks.cache_harness import Checks
+from benchmarks.fakes import FakeQuizServer, scripted_quiz_llm
+from benchmarks.server import LocalServer
+from clock import VirtualClock
+from llm_cache import LLMCache
+from ratelimit import RateLimiter
+from tools import send_post
+from tools.context import JobContext, current_job
+from tools.deadline import Deadline, current_deadline
+from tools.submissions import SubmissionLog
+
+
+def in_chain(job_id: str, fn, *args):
+    """Call `fn` as part of the chain `job_id`."""
+    job = JobContext(job_id)
+    token = current_job.set(job)
+    try:
+        return fn(*args)
+    finally:
+        current_job.reset(token)
+        job.close()
+        job.cleanup()
+
+
+def use_log(log: SubmissionLog):
+    requester.submission_log = solvers.submission_log = log
+
+
+def pipeline_checks(check: Checks, directory: Path):
+    posts = []
+
+    def submit(handler):
+        data = json.loads(handler.read_body())
+        posts.append(data["answer"])
+        correct = data["answer"] == 42
+        return 200, "application/json", json.dumps(
+            {"correct": correct, "reason": None if correct else "Wrong answer", "url": "http://quiz/next"}
+        ).encode()
+
+    use_log(SubmissionLog(directory / "pipeline.sqlite3"))
+    with LocalServer({"/submit": submit}) as server:
+        url = server.base_url + "/submit"
+
+        def post(answer):
+            return send_post.invoke({"url": url, "payload": {"url": "http://quiz/1", "answer": answer}})
+
+        first = post(7)
+        check("a wrong answer with time left is retried", first.get("correct") is False and "url" not in first, str(first))
+        again = post(7)
+        check("a repeated wrong answer is not sent again", len(posts) == 1 and again.get("duplicate") is True
+              and "url" not in again, f"{posts} {again}")
+        other = post({"b": 1, "a": 2})
+        check("a new wrong answer lists the ones rejected before", other.get("rejected_before") == ["7"], str(other))
+        check("answers compare by value, not key order",
+              post({"a": 2, "b": 1}).get("duplicate") is True and len(posts) == 2, str(posts))
+
+        deadline = Deadline(clock=VirtualClock())
+        deadline.begin("http://quiz/1")
+        deadline.scraped("http://quiz/1")
+        deadline.clock.advance(170)
+        token = current_deadline.set(deadline)
+        try:
+            late = post(7)
+        finally:
+            current_deadline.reset(token)
+        check("a repeat with no time left moves on to the URL the server named",
+              late.get("url") == "http://quiz/next" and len(posts) == 2, str(late))
+
+        right = post(42)
+        check("a correct answer is sent and moves on", right.get("correct") is True and right.get("url"), str(right))
+        check("a correct answer can be sent again", post(42).get("correct") is True and len(posts) == 4, str(posts))
+
+        other = in_chain("other-chain", post, 7)
+        check("another chain's rejected answer is sent (the quiz data may have changed)",
+              "duplicate" not in other and len(posts) == 5 and "rejected_before" not in other, f"{posts} {other}")
+
+    restarted = SubmissionLog(directory / "pipeline.sqlite3")
+    check("verdicts survive a restart", restarted.correct_answer(url, "http://quiz/1") == (42,)
+          and restarted.rejected(url, "http://quiz/1") == ["7", '{"a":2,"b":1}'], str(restarted.stats()))
+    check("another chain's accepted answer is only replayed when asked to",
+          in_chain("new-chain", restarted.correct_answer, url, "http://quiz/1") is None
+          and in_chain("new-chain", SubmissionLog(directory / "pipeline.sqlite3", replay_across_chains=True)
+                       .correct_answer, url, "http://quiz/1") == (42,))
+
+
+def run_chain(url: str, job_id: str) -> float:
+    start = time.perf_counter()
+    in_chain(job_id, agent.run_agent, url)
+    return time.perf_counter() - start
+
+
+def replay_checks(check: Checks, directory: Path, levels: int, latency: float):
+    calls = []
+    llm = scripted_quiz_llm(latency)
+    agent.llm_with_prompt = agent.fast_llm_with_prompt = llm.with_listeners(on_start=lambda *_: calls.append(1))
+    agent.llm_limiter = RateLimiter(requests_per_second=1e9, burst=10**9, tokens_per_minute=10**12)
+    agent.llm_cache = LLMCache(path=None, mode="0")
+    solvers.SOLVERS_ENABLED = True
+
+    with FakeQuizServer(levels=levels, worded_every=1) as server:
+        url = server.new_chain()
+        use_log(SubmissionLog(directory / "chain.sqlite3"))
+        first = run_chain(url, "chain-1")
+        first_calls, first_posts = len(calls), server.submissions
+
+        use_log(SubmissionLog(directory / "chain.sqlite3"))
+        calls.clear()
+        server.submissions = 0
+        second = run_chain(url, "chain-1")
+        stats = solvers.solver_stats()["solvers"][solvers.REPLAY]
+        second_calls, second_posts = len(calls), server.submissions
+
+        calls.clear()
+        run_chain(url, "chain-2")
+        new_chain_calls = len(calls)
+
+    size = (directory / "chain.sqlite3").stat().st_size
+    print(f"{'run':<22} {'seconds':>8} {'LLM calls':>10} {'submissions':>12}")
+    print(f"{'first':<22} {first:>8.2f} {first_calls:>10} {first_posts:>12}")
+    print(f"{'resumed after restart':<22} {second:>8.2f} {second_calls:>10} {second_posts:>12}")
+    print(f"submission log: {size} bytes on disk for {levels} verdicts")
+
+    check("the first run needs the LLM for every question", first_calls >= levels, str(first_calls))
+    check("a restarted chain replays its accepted answers without the LLM",
+          second_calls == 0 and stats.get("correct") == levels, f"{second_calls} {stats}")
+    check("replaying is faster than solving again", second < first, f"{second:.2f}s vs {first:.2f}s")
+    check("a new chain of the same quiz solves it again", new_chain_calls >= levels, str(new_chain_calls))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="seconds per fake LLM call")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    check = Checks()
+    with tempfile.TemporaryDirectory() as tmp:
+        pipeline_checks(check, Path(tmp))
+        replay_checks(check, Path(tmp), args.levels, args.llm_latency)
+    if check.failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
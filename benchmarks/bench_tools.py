@@ -0,0 +1,261 @@
+"""Wall time of scripted agent turns through the tools node, against LangGraph's ToolNode.
+
+A local server answers every request after --delay-ms. The turns are:
+
+1. a scrape plus four downloads, one of them a duplicate of another;
+2. the same scrape and download again, plus run_code reading the file;
+3. run_code rewriting the downloaded file, then the download once more;
+4. two identical send_post calls of an accepted answer (both must reach
+   the server, one after the other);
+5. six scrapes of different pages (at most TOOL_CONCURRENCY["scrape_page"]
+   at once).
+
+Both nodes run the same turns in their own chain; the benchmark prints
+wall time and server hits per turn and checks that results match. The
+concurrency limits make the last two turns slower than ToolNode, which
+starts every call at once; reuse makes the first turns faster. Finally
+two chains scrape the pages at once through the tools node, and together
+must stay within the scrape limit too.
+
+Usage: python -m benchmarks.bench_tools [--delay-ms 300] [--async]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import StateGraph, START, END
+from langgraph.prebuilt import ToolNode
+
+import agent
+import tools.downloader as downloader
+import tools.prefetch as prefetch
+import tool_node
+from benchmarks.cache_harness import Checks
+from benchmarks.server import LocalServer, html
+from config import TOOL_CONCURRENCY
+from tools.context import JobContext, current_job
+from tools.download_cache import DownloadCache
+
+PAGES = 6
+
+
+class Gauge:
+    """Requests being served at once, and the most seen."""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def exit(self):
+        with self._lock:
+            self.active -= 1
+
+
+class CountingRoute:
+    """Route answered after `delay` seconds; counts requests and the most served at once (also in `gauge`)."""
+
+    def __init__(self, status: int, content_type: str, body: bytes, delay: float, gauge: Gauge = None):
+        self.route = (status, content_type, body)
+        self.delay = delay
+        self.requests = 0
+        self.gauges = [Gauge()] + ([gauge] if gauge else [])
+        self._lock = threading.Lock()
+
+    @property
+    def peak(self) -> int:
+        return self.gauges[0].peak
+
+    def __call__(self, handler):
+        with self._lock:
+            self.requests += 1
+        for gauge in self.gauges:
+            gauge.enter()
+        try:
+            if handler.command == "POST":
+                handler.read_body()
+            time.sleep(self.delay)
+            return self.route
+        finally:
+            for gauge in self.gauges:
+                gauge.exit()
+
+
+def _routes(server: LocalServer, delay: float, pages: Gauge) -> dict:
+    csv = b"value\n" + b"\n".join(str(i).encode() for i in range(500))
+    text = "Download the files a.csv, b.csv and c.csv, sum the value column of a.csv and POST the total to /submit."
+    routes = {"/quiz": CountingRoute(*html(f"<html><body><h1>Question 1</h1><p>{text}</p></body></html>"), delay)}
+    for name in ("a", "b", "c"):
+        routes[f"/{name}.csv"] = CountingRoute(200, "text/csv", csv, delay)
+    routes["/submit"] = CountingRoute(200, "application/json", json.dumps({"correct": True}).encode(), delay)
+    for i in range(PAGES):
+        routes[f"/page{i}"] = CountingRoute(*html(f"<html><body><h1>Page {i}</h1><p>{text}</p></body></html>"), delay, pages)
+    for path, route in routes.items():
+        server.add(path, route)
+    return routes
+
+
+def _turn(*calls) -> AIMessage:
+    return AIMessage(content="", tool_calls=[
+        {"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}"} for name, args in calls
+    ])
+
+
+def turns(base: str) -> list:
+    def download(name):
+        return "download_file", {"url": f"{base}/{name}.csv", "filename": f"{name}.csv"}
+
+    scrape = ("scrape_page", {"url": f"{base}/quiz"})
+    post = ("send_post", {"url": f"{base}/submit", "payload": {"answer": 1}})
+    return [
+        ("scrape + 4 downloads (1 duplicate)", _turn(scrape, download("a"), download("b"), download("c"), download("a"))),
+        ("repeat scrape/download + run_code", _turn(scrape, download("a"), ("run_code", {"code": "print(len(open('a.csv').read()))"}))),
+        ("rewrite a.csv", _turn(("run_code", {"code": "open('a.csv', 'w').write('value\\n1\\n')"}))),
+        ("download a.csv again", _turn(download("a"))),
+        ("2 identical send_post", _turn(post, post)),
+        (f"{PAGES} scrapes", _turn(*[("scrape_page", {"url": f"{base}/page{i}"}) for i in range(PAGES)])),
+    ]
+
+
+def single_node(node):
+    """A graph of just `node`, so both nodes run with the config LangGraph gives them."""
+    graph = StateGraph(agent.AgentState)
+    graph.add_node("tools", node)
+    graph.add_edge(START, "tools")
+    graph.add_edge("tools", END)
+    return graph.compile()
+
+
+def run(node, base: str, routes: dict, job_id: str, use_async: bool) -> list:
+    """Run all turns through `node`; returns (label, seconds, server hits, contents) per turn."""
+    job = JobContext(job_id)
+    token = current_job.set(job)
+    results = []
+    try:
+        for label, message in turns(base):
+            before = {path: route.requests for path, route in routes.items()}
+            start = time.perf_counter()
+            state = {"messages": [message]}
+            if use_async:
+                output = asyncio.run(node.ainvoke(state))
+            else:
+                output = node.invoke(state)
+            seconds = time.perf_counter() - start
+            hits = {path: route.requests - before[path] for path, route in routes.items() if route.requests > before[path]}
+            contents = [str(m.content).replace(job_id, "<job>") for m in output["messages"][1:]]
+            results.append((label, seconds, hits, contents))
+    finally:
+        current_job.reset(token)
+        job.close()
+        job.cleanup()
+    return results
+
+
+def two_chains(node, base: str, use_async: bool):
+    """Scrape the pages in two chains at once through `node`."""
+    message = _turn(*[("scrape_page", {"url": f"{base}/page{i}"}) for i in range(PAGES)])
+
+    def chain(job_id):
+        job = JobContext(job_id)
+        token = current_job.set(job)
+        try:
+            return node.invoke({"messages": [message]})
+        finally:
+            current_job.reset(token)
+            job.close()
+            job.cleanup()
+
+    async def achain(job_id):
+        job = JobContext(job_id)
+        current_job.set(job)
+        try:
+            return await node.ainvoke({"messages": [message]})
+        finally:
+            job.close()
+            job.cleanup()
+
+    ids = [f"bench-tools-{uuid.uuid4().hex[:6]}" for _ in range(2)]
+    if use_async:
+        async def both():
+            return await asyncio.gather(*(achain(job_id) for job_id in ids))
+
+        asyncio.run(both())
+        return
+    threads = [threading.Thread(target=chain, args=(job_id,)) for job_id in ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delay-ms", type=float, default=300, help="emulated server latency per request")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run the nodes with ainvoke")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    prefetch.PREFETCH_ENABLED = False
+    check = Checks()
+
+    with LocalServer() as server, tempfile.TemporaryDirectory() as tmp:
+        pages = Gauge()
+        routes = _routes(server, args.delay_ms / 1000, pages)
+        outcome = {}
+        calls = tool_node.ToolCalls(agent.TOOLS)
+        nodes = {
+            "ToolNode": single_node(ToolNode(agent.TOOLS)),
+            "tools node": single_node(RunnableLambda(calls.invoke, afunc=calls.ainvoke, name="tools")),
+        }
+        for name, node in nodes.items():
+            # Fresh download cache per node, so neither profits from the other's downloads
+            downloader.download_cache = prefetch.download_cache = DownloadCache(Path(tmp) / name)
+            outcome[name] = run(node, server.base_url, routes, f"bench-tools-{uuid.uuid4().hex[:6]}", args.use_async)
+
+        old, new = outcome["ToolNode"], outcome["tools node"]
+        print(f"{'turn':<36} {'ToolNode s':>10} {'hits':>5} {'tools node s':>12} {'hits':>5}")
+        for (label, old_s, old_hits, _), (_, new_s, new_hits, _) in zip(old, new):
+            print(f"{label:<36} {old_s:>10.2f} {sum(old_hits.values()):>5} {new_s:>12.2f} {sum(new_hits.values()):>5}")
+        old_total, new_total = sum(r[1] for r in old), sum(r[1] for r in new)
+        print(f"{'total':<36} {old_total:>10.2f} {'':>5} {new_total:>12.2f}")
+        print(f"tool stats: {tool_node.tool_stats()}")
+
+        check("every turn returns the same tool results", all(o[3] == n[3] for o, n in zip(old, new)),
+              str([(o[0], o[3], n[3]) for o, n in zip(old, new) if o[3] != n[3]]))
+        check("a duplicate call in one turn runs once", new[0][2].get("/a.csv") == 1, str(new[0][2]))
+        check("a repeated scrape and download reuse the earlier results",
+              "/quiz" not in new[1][2] and "/a.csv" not in new[1][2], str(new[1][2]))
+        check("a download whose file changed runs again", new[3][2].get("/a.csv") == 1, str(new[3][2]))
+        check("identical send_post calls all reach the server", new[4][2].get("/submit") == 2, str(new[4][2]))
+        waves = -(-PAGES // TOOL_CONCURRENCY["scrape_page"])
+        check("scrapes respect the per-tool concurrency limit",
+              new[5][1] >= waves * args.delay_ms / 1000 * 0.9, f"{new[5][1]:.2f}s for {waves} waves")
+        stats = tool_node.tool_stats()
+        check("time saved is recorded", stats.get("saved_memo_s", 0) > 0 and stats.get("saved_duplicate_s", 0) > 0
+              and stats.get("saved_parallel_s", 0) > 0, str(stats))
+        old_reuse, new_reuse = sum(r[1] for r in old[:4]), sum(r[1] for r in new[:4])
+        check("reuse makes the scrape and download turns faster", new_reuse < old_reuse,
+              f"{new_reuse:.2f}s vs {old_reuse:.2f}s")
+
+        pages.peak = 0
+        two_chains(nodes["tools node"], server.base_url, args.use_async)
+        check("the scrape limit holds across chains", pages.peak <= TOOL_CONCURRENCY["scrape_page"],
+              f"{pages.peak} pages served at once")
+    if check.failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
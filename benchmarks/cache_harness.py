@@ -0,0 +1,182 @@
+"""Check the download cache against a local HTTP server and report its metrics.
+
+Covers conditional revalidation (ETag and Last-Modified), changed content,
+SHA-256 dedup across URLs, LRU eviction, tampered cache files and the
+async download path, then compares streaming throughput with 8 KB chunks
+against the adaptive chunk size.
+
+Usage: python -m benchmarks.cache_harness [--large-mb 64]
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import requests
+
+import tools.downloader as downloader
+from benchmarks.server import LocalServer
+from config import TEMP_DIR
+from tools.download_cache import DownloadCache, chunk_size
+
+
+class VersionedFile:
+    """Route serving a body with validators and honouring conditional GETs."""
+
+    def __init__(self, body: bytes, etag: bool = True, last_modified: bool = False):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.version = 1
+        self.requests = Counter()
+
+    def update(self, body: bytes):
+        self.body = body
+        self.version += 1
+
+    def _validators(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers["ETag"] = f'"v{self.version}-{hashlib.sha1(self.body).hexdigest()[:8]}"'
+        if self.last_modified:
+            headers["Last-Modified"] = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(1_700_000_000 + self.version))
+        return headers
+
+    def __call__(self, handler):
+        validators = self._validators()
+        matches = (
+            (self.etag and handler.headers.get("If-None-Match") == validators.get("ETag"))
+            or (not self.etag and self.last_modified
+                and handler.headers.get("If-Modified-Since") == validators.get("Last-Modified"))
+        )
+        self.requests["304" if matches else "200"] += 1
+        handler.send_response(304 if matches else 200)
+        for name, value in validators.items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Type", "application/octet-stream")
+        handler.send_header("Content-Length", "0" if matches else str(len(self.body)))
+        handler.end_headers()
+        if not matches:
+            handler.wfile.write(self.body)
+
+
+class Checks:
+    def __init__(self):
+        self.failures = 0
+
+    def __call__(self, name: str, ok: bool, detail: str = ""):
+        print(f"{'✓' if ok else '❌'} {name}" + (f" ({detail})" if detail and not ok else ""))
+        self.failures += 0 if ok else 1
+
+
+def download(url: str, name: str) -> bytes:
+    result = downloader.download_file.invoke({"url": url, "filename": name})
+    assert result == name, result
+    return (TEMP_DIR / name).read_bytes()
+
+
+def functional_checks(server: LocalServer, cache: DownloadCache, check: Checks):
+    data = os.urandom(256 * 1024)
+    etag_file = VersionedFile(data)
+    url = server.add("/data.csv", etag_file)
+
+    check("first download fetches the body", download(url, "h1.bin") == data and etag_file.requests["200"] == 1)
+    check("repeat download revalidates with If-None-Match -> 304",
+          download(url, "h2.bin") == data and etag_file.requests["304"] == 1 and cache.metrics["hits"] == 1)
+
+    etag_file.update(os.urandom(1024))
+    check("changed content is fetched again", download(url, "h3.bin") == etag_file.body)
+
+    mirror = server.add("/mirror/data.csv", VersionedFile(etag_file.body))
+    blobs_before = cache.stats()["blobs"]
+    download(mirror, "h4.bin")
+    check("identical payload from another URL is deduplicated",
+          cache.stats()["blobs"] == blobs_before and cache.metrics["deduplicated"] == 1)
+
+    with open(TEMP_DIR / "h4.bin", "r+b") as f:
+        f.write(b"edited by a snippet")
+    check("a downloaded file is the caller's own copy: editing it leaves the cache intact",
+          os.stat(TEMP_DIR / "h3.bin").st_ino != os.stat(TEMP_DIR / "h4.bin").st_ino
+          and cache.lookup(mirror) is not None and download(mirror, "h4b.bin") == etag_file.body)
+
+    dated = VersionedFile(os.urandom(4096), etag=False, last_modified=True)
+    dated_url = server.add("/dated.json", dated)
+    download(dated_url, "h5.bin")
+    download(dated_url, "h6.bin")
+    check("Last-Modified revalidation -> 304", dated.requests["304"] == 1)
+
+    plain = server.add("/plain.txt", (200, "text/plain", b"no validators here"))
+    download(plain, "h7.bin")
+    download(plain, "h8.bin")
+    check("responses without validators are re-downloaded but stored once",
+          cache.metrics["deduplicated"] == 2)
+
+    blob = cache.blob_dir / cache.lookup(url)["sha256"]
+    os.chmod(blob, 0o644)
+    with open(blob, "r+b") as f:
+        f.write(b"tampered")
+    check("a cache file modified in place is not served", download(url, "h9.bin") == etag_file.body
+          and etag_file.requests["200"] == 3)
+
+    async def async_download():
+        return await downloader.download_file.ainvoke({"url": url, "filename": "h10.bin"})
+
+    hits = cache.metrics["hits"]
+    asyncio.run(async_download())
+    check("async path revalidates too", cache.metrics["hits"] == hits + 1
+          and (TEMP_DIR / "h10.bin").read_bytes() == etag_file.body)
+
+    cache.max_bytes = 600 * 1024
+    big = [server.add(f"/big{i}.bin", VersionedFile(os.urandom(256 * 1024))) for i in range(3)]
+    for i, big_url in enumerate(big):
+        download(big_url, f"big{i}.bin")
+    check("LRU eviction keeps the cache under its size limit",
+          cache.stats()["cached_mb"] * 1024 * 1024 <= cache.max_bytes and cache.metrics["evictions"] >= 1
+          and cache.lookup(big[-1]) is not None)
+
+    for i in range(1, 11):
+        (TEMP_DIR / f"h{i}.bin").unlink(missing_ok=True)
+    (TEMP_DIR / "h4b.bin").unlink(missing_ok=True)
+    for i in range(3):
+        (TEMP_DIR / f"big{i}.bin").unlink(missing_ok=True)
+
+
+def throughput(url: str, size: int, chunk: int) -> float:
+    start = time.perf_counter()
+    with requests.get(url, stream=True, timeout=30) as response:
+        for _ in response.iter_content(chunk_size=chunk):
+            pass
+    return size / (time.perf_counter() - start) / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--large-mb", type=int, default=64)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory, LocalServer() as server:
+        cache = DownloadCache(Path(directory))
+        downloader.download_cache = cache
+        check = Checks()
+        functional_checks(server, cache, check)
+        print(f"metrics: {cache.stats()}")
+
+        size = args.large_mb * 1024 * 1024
+        large = server.add("/large.bin", (200, "application/octet-stream", os.urandom(size)))
+        adaptive = chunk_size(size)
+        for label, chunk in (("8 KB chunks", 8192), (f"{adaptive // 1024} KB chunks", adaptive)):
+            rate = max(throughput(large, size, chunk) for _ in range(3))
+            print(f"{label:>16}: {rate:8.1f} MB/s")
+
+    if check.failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Report how much page extraction shrinks what the LLM receives.
+
+Runs extract_page over a corpus of saved pages: the bundled samples in
+benchmarks/pages and, by default, every page scrape_page has stored
+under TEMP_DIR/pages.
+
+Usage: python -m benchmarks.extraction_report [DIR ...]
+"""
+import argparse
+from pathlib import Path
+
+from tools.extractor import PAGES_DIR, extract_page
+
+SAMPLES_DIR = Path(__file__).parent / "pages"
+CHARS_PER_TOKEN = 4  # rough estimate, good enough for relative numbers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("dirs", nargs="*", type=Path, default=[SAMPLES_DIR, PAGES_DIR])
+    args = parser.parse_args()
+
+    files = sorted(f for d in args.dirs if d.is_dir() for f in d.glob("*.html"))
+    if not files:
+        print("No saved pages found")
+        return
+
+    total_raw = total_compact = 0
+    print(f"{'page':<40} {'raw chars':>10} {'compact':>10} {'saved':>7}")
+    for path in files:
+        raw = path.read_text(encoding="utf-8", errors="replace")
+        compact = extract_page(raw, f"https://example.com/{path.stem}")
+        total_raw += len(raw)
+        total_compact += len(compact)
+        print(f"{path.name[:40]:<40} {len(raw):>10} {len(compact):>10} {1 - len(compact) / max(len(raw), 1):>7.0%}")
+
+    print("-" * 70)
+    print(f"{'total (' + str(len(files)) + ' pages)':<40} {total_raw:>10} {total_compact:>10} "
+          f"{1 - total_compact / max(total_raw, 1):>7.0%}")
+    print(f"~tokens per page: {total_raw / len(files) / CHARS_PER_TOKEN:.0f} raw -> "
+          f"{total_compact / len(files) / CHARS_PER_TOKEN:.0f} compact")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Fake quiz server and scripted chat model for offline end-to-end runs."""
+import asyncio
+import json
+import re
+import time
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+from benchmarks.server import LocalServer, html
+from compaction import SUMMARY_PREFIX
+
+_QUESTION = re.compile(r"What is (\d+) (?:\+|plus) (\d+)\?")
+_SUBMIT = re.compile(r"POST the answer to (\S+) ")
+_PAGE_URL = re.compile(r"^URL: (\S+)", re.MULTILINE)
+_NEXT_URL = re.compile(r"next url: (\S+)")
+
+
+class FakeQuizServer(LocalServer):
+    """
+    Quiz chains of `levels` questions each, at /quiz/<chain>/<level>.
+
+    Every page asks for the sum of two numbers and /submit answers like
+    the real quiz server: {"correct": ..., "url": next question or absent}.
+    Every `worded_every`-th level spells the operator out ("plus"), which
+    no built-in solver recognises, so the agent has to answer it.
+    """
+
+    def __init__(self, levels: int = 3, worded_every: int = 0):
+        super().__init__()
+        self.levels = levels
+        self.worded_every = worded_every
+        self.submissions = 0
+        self.routes["/submit"] = self._submit
+
+    @staticmethod
+    def _numbers(chain: str, level: int) -> tuple:
+        return level * 7, sum(map(ord, chain)) % 100
+
+    def _page(self, handler):
+        _, _, chain, level = handler.path.split("?")[0].split("/")
+        a, b = self._numbers(chain, int(level))
+        operator = "plus" if self.worded_every and int(level) % self.worded_every == 0 else "+"
+        return html(
+            f"<html><head><title>Quiz {chain}</title></head><body>"
+            f"<h1>Question {level}</h1><p>What is {a} {operator} {b}? "
+            f"POST the answer to {self.base_url}/submit as JSON with email, secret, url and answer.</p>"
+            "</body></html>"
+        )
+
+    def _submit(self, handler):
+        self.submissions += 1
+        data = json.loads(handler.read_body() or b"{}")
+        _, _, chain, level = data.get("url", "").rsplit("/", 3)[-4:] if data.get("url") else ("", "", "", "0")
+        correct = data.get("answer") == sum(self._numbers(chain, int(level)))
+        response = {"correct": correct, "reason": None if correct else "Wrong answer"}
+        if correct and int(level) < self.levels:
+            response["url"] = f"{self.base_url}/quiz/{chain}/{int(level) + 1}"
+        return 200, "application/json", json.dumps(response).encode()
+
+    def new_chain(self) -> str:
+        """Register a fresh chain and return the URL of its first question."""
+        chain = uuid.uuid4().hex[:8]
+        for level in range(1, self.levels + 1):
+            self.routes[f"/quiz/{chain}/{level}"] = self._page
+        return f"{self.base_url}/quiz/{chain}/1"
+
+
+def _call(name: str, args: dict) -> AIMessage:
+    return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}"}])
+
+
+def _content(msg) -> str:
+    return msg.get("content", "") if isinstance(msg, dict) else str(msg.content)
+
+
+def scripted_quiz_llm(latency: float = 0.0) -> RunnableLambda:
+    """
+    Chat model stand-in that solves FakeQuizServer chains with tool calls.
+
+    It scrapes the URL it was given, answers the sum with send_post,
+    follows the next url and says END at the end. `latency` emulates the
+    time a real model spends per call.
+    """
+
+    def respond(inputs):
+        if latency:
+            time.sleep(latency)
+        return decide(inputs)
+
+    async def arespond(inputs):
+        if latency:
+            await asyncio.sleep(latency)
+        return decide(inputs)
+
+    def decide(inputs):
+        last = inputs["messages"][-1]
+        text = _content(last)
+
+        if isinstance(last, ToolMessage) and last.name == "scrape_page":
+            a, b = _QUESTION.search(text).groups()
+            return _call("send_post", {
+                "url": _SUBMIT.search(text).group(1),
+                "payload": {"email": "e", "secret": "s", "url": _PAGE_URL.search(text).group(1), "answer": int(a) + int(b)},
+            })
+        if isinstance(last, ToolMessage) and last.name == "send_post":
+            next_url = json.loads(text).get("url")
+            return _call("scrape_page", {"url": next_url}) if next_url else AIMessage(content="END")
+        if isinstance(last, HumanMessage) and text.startswith(SUMMARY_PREFIX):
+            return _call("scrape_page", {"url": _NEXT_URL.findall(text)[-1]})
+        # The first message is the URL, possibly followed by a note
+        return _call("scrape_page", {"url": text.split()[0]})
+
+    return RunnableLambda(respond, afunc=arespond)
@@ -0,0 +1,61 @@
+"""Throughput of the job queue at different worker counts.
+
+Runs quiz chains from a local fake quiz server through JobManager and the
+real agent graph, with a scripted LLM standing in for Gemini.
+
+Usage: python -m benchmarks.load_test [--chains 16] [--workers 1 4 16] [--async]
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import agent
+import solvers
+from benchmarks.fakes import FakeQuizServer, scripted_quiz_llm
+from jobs import FINISHED, SUCCEEDED, JobManager
+from llm_cache import LLMCache
+from ratelimit import RateLimiter
+
+
+async def run_load(server: FakeQuizServer, chains: int, workers: int, use_async: bool) -> tuple:
+    runner = agent.run_agent_async if use_async else agent.run_agent
+    manager = JobManager(runner, workers=workers, queue_size=chains)
+    await manager.start()
+    try:
+        start = time.perf_counter()
+        jobs = [manager.submit(server.new_chain()) for _ in range(chains)]
+        while any(job.status not in FINISHED for job in jobs):
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - start
+    finally:
+        await manager.stop()
+    ok = sum(job.status == SUCCEEDED for job in jobs)
+    return elapsed, ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chains", type=int, default=16)
+    parser.add_argument("--levels", type=int, default=3)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake LLM call")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run chains with ainvoke on the event loop")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # Every fake question is one the solvers answer; measure the agent itself
+    solvers.SOLVERS_ENABLED = False
+    agent.llm_with_prompt = scripted_quiz_llm(args.llm_latency)
+    agent.llm_cache = LLMCache(path=None, mode="0")
+    agent.llm_limiter = RateLimiter(requests_per_second=1e9, burst=10**9, tokens_per_minute=10**12)
+
+    with FakeQuizServer(levels=args.levels) as server:
+        print(f"{'workers':>8} {'chains':>7} {'ok':>4} {'seconds':>8} {'chains/s':>9}")
+        for workers in args.workers:
+            elapsed, ok = asyncio.run(run_load(server, args.chains, workers, args.use_async))
+            print(f"{workers:>8} {args.chains:>7} {ok:>4} {elapsed:>8.2f} {args.chains / elapsed:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Check parallel Range downloads, resume and extraction against a local server.
+
+The server honours Range/If-Range, can cap the bandwidth of each connection
+(as a remote host usually does) and can cut responses short to simulate
+dropped connections. After the checks, one large file is downloaded in a
+single stream and in parallel segments and the throughput of both reported.
+
+Usage: python -m benchmarks.range_harness [--large-mb 64] [--rate-mb 25]
+"""
+import argparse
+import asyncio
+import gzip
+import io
+import logging
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from collections import Counter
+from pathlib import Path
+
+import tools.downloader as downloader
+import tools.transfer as transfer
+from benchmarks.cache_harness import Checks
+from benchmarks.server import LocalServer
+from config import TEMP_DIR
+from tools.deadline import Deadline, current_deadline
+from tools.download_cache import DownloadCache
+
+BLOCK = 64 * 1024
+
+
+class RangeFile:
+    """Route serving `body` with optional Range support, throttling and dropped connections."""
+
+    def __init__(self, body: bytes, ranges: bool = True, rate_mb: float = 0, drops: int = 0, drop_after: int = 0):
+        self.body = body
+        self.ranges = ranges
+        self.rate = rate_mb * 1024 * 1024
+        self.drops = drops
+        self.drop_after = drop_after
+        self.version = 1
+        self.requests = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def etag(self) -> str:
+        return f'"v{self.version}"'
+
+    def update(self, body: bytes):
+        self.body = body
+        self.version += 1
+
+    def __call__(self, handler):
+        body = self.body
+        start, end, status = 0, len(body) - 1, 200
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", handler.headers.get("Range", ""))
+        if_range = handler.headers.get("If-Range")
+        if self.ranges and match and if_range in (None, self.etag):
+            start = int(match[1])
+            end = min(int(match[2]) if match[2] else end, end)
+            status = 206
+        payload = memoryview(body)[start:end + 1]
+
+        limit = len(payload)
+        with self._lock:
+            self.requests[status] += 1
+            if self.drops and limit > self.drop_after:
+                self.drops -= 1
+                limit = self.drop_after
+
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/octet-stream")
+        handler.send_header("ETag", self.etag)
+        if self.ranges:
+            handler.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            handler.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+        handler.send_header("Content-Length", str(len(payload)))
+        handler.end_headers()
+        try:
+            for offset in range(0, limit, BLOCK):
+                handler.wfile.write(payload[offset:min(offset + BLOCK, limit)])
+                if self.rate:
+                    time.sleep(BLOCK / self.rate)
+        except ConnectionError:
+            # The downloader hangs up on the first response to switch to segments
+            limit = 0
+        if limit < len(payload):
+            handler.close_connection = True
+
+
+def download(url: str, name: str, extract: bool = False) -> str:
+    return downloader.download_file.invoke({"url": url, "filename": name, "extract": extract})
+
+
+def archives() -> dict:
+    files = {"a.csv": b"x,y\n1,2\n", "nested/b.json": b'{"k": 1}'}
+    zipped = io.BytesIO()
+    with zipfile.ZipFile(zipped, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+        archive.writestr("../escape.txt", b"outside")
+    tarred = io.BytesIO()
+    with tarfile.open(fileobj=tarred, mode="w:gz") as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return {"zip": zipped.getvalue(), "tar": tarred.getvalue(), "gz": gzip.compress(b"col\n" * 1000)}
+
+
+def functional_checks(server: LocalServer, check: Checks):
+    mb = 1024 * 1024
+    transfer.DOWNLOAD_PARALLEL_MIN_MB = 1
+
+    small = RangeFile(os.urandom(200 * 1024))
+    result = download(server.add("/small.bin", small), "r1.bin")
+    check("small file is fetched in one request", result == "r1.bin" and small.requests == Counter({200: 1})
+          and (TEMP_DIR / "r1.bin").read_bytes() == small.body)
+
+    large = RangeFile(os.urandom(4 * mb + 123))
+    download(server.add("/large.bin", large), "r2.bin")
+    check("large file is fetched as parallel Range segments",
+          large.requests[206] == transfer.DOWNLOAD_SEGMENTS and (TEMP_DIR / "r2.bin").read_bytes() == large.body,
+          str(large.requests))
+
+    # The first drop hits the initial response, which the downloader abandons anyway
+    flaky = RangeFile(os.urandom(4 * mb), drops=2, drop_after=300 * 1024)
+    download(server.add("/flaky.bin", flaky), "r3.bin")
+    check("dropped segments resume from where they broke", (TEMP_DIR / "r3.bin").read_bytes() == flaky.body
+          and flaky.requests[206] == transfer.DOWNLOAD_SEGMENTS + 1, str(flaky.requests))
+
+    stream = RangeFile(os.urandom(512 * 1024), drops=1, drop_after=100 * 1024)
+    download(server.add("/stream.bin", stream), "r4.bin")
+    check("a dropped single stream resumes with a Range request",
+          (TEMP_DIR / "r4.bin").read_bytes() == stream.body and stream.requests == Counter({200: 1, 206: 1}),
+          str(stream.requests))
+
+    no_ranges = RangeFile(os.urandom(512 * 1024), ranges=False, drops=1, drop_after=100 * 1024)
+    result = download(server.add("/no-ranges.bin", no_ranges), "r5.bin")
+    check("without Accept-Ranges a dropped stream is reported, not resumed",
+          result.startswith("Error") and no_ranges.requests == Counter({200: 1}), result)
+
+    class Changing(RangeFile):
+        def __call__(self, handler):
+            if "Range" in handler.headers and self.version == 1:
+                self.update(os.urandom(len(self.body)))
+            super().__call__(handler)
+
+    changing = Changing(os.urandom(2 * mb))
+    download(server.add("/changing.bin", changing), "r6.bin")
+    check("a file changing mid-download falls back to a full fetch of the new version",
+          (TEMP_DIR / "r6.bin").read_bytes() == changing.body, str(changing.requests))
+
+    def adownload(url: str, name: str) -> str:
+        return asyncio.run(downloader.download_file.ainvoke({"url": url, "filename": name}))
+
+    for label, fetch, name in (("sync", download, "r6s.bin"), ("async", adownload, "r6a.bin")):
+        changed = Changing(os.urandom(512 * 1024), drops=1, drop_after=100 * 1024)
+        result = fetch(server.add(f"/{name}", changed), name)
+        check(f"a single stream resuming into a changed file starts over ({label})",
+              result == name and (TEMP_DIR / name).read_bytes() == changed.body, f"{result} {changed.requests}")
+
+    # The first drop hits the initial response, which the downloader abandons anyway
+    async_file = RangeFile(os.urandom(3 * mb), drops=2, drop_after=200 * 1024)
+    url = server.add("/async.bin", async_file)
+    asyncio.run(downloader.download_file.ainvoke({"url": url, "filename": "r7.bin"}))
+    check("async path downloads segments and resumes too", (TEMP_DIR / "r7.bin").read_bytes() == async_file.body
+          and async_file.requests[206] == transfer.DOWNLOAD_SEGMENTS + 1, str(async_file.requests))
+
+    class Stalling(RangeFile):
+        def __init__(self, body: bytes, stall: float):
+            super().__init__(body)
+            self.stall = stall
+
+        def __call__(self, handler):
+            with self._lock:
+                stall, self.stall = (self.stall, 0) if "Range" in handler.headers else (0, self.stall)
+            time.sleep(stall)
+            super().__call__(handler)
+
+    stalling = Stalling(os.urandom(2 * mb), stall=12)
+    url = server.add("/stalling.bin", stalling)
+    deadline = Deadline()
+    deadline.scraped(url)
+    deadline.started -= deadline.limit - 15  # FINAL phase: 15 seconds left
+    token = current_deadline.set(deadline)
+    start = time.perf_counter()
+    try:
+        download(url, "r8.bin")
+    finally:
+        current_deadline.reset(token)
+    seconds = time.perf_counter() - start
+    check("a stalled segment gives up within the question's time left",
+          (TEMP_DIR / "r8.bin").read_bytes() == stalling.body and seconds < 10, f"{seconds:.1f}s")
+
+    payloads = archives()
+    result = download(server.add("/data.zip", RangeFile(payloads["zip"])), "data.zip", extract=True)
+    check("zip archives are extracted and listed", (TEMP_DIR / "data" / "nested" / "b.json").exists()
+          and "data/a.csv" in result and not (TEMP_DIR / "escape.txt").exists(), result)
+    result = download(server.add("/data.tar.gz", RangeFile(payloads["tar"])), "bundle.tar.gz", extract=True)
+    check("tar.gz archives are extracted", (TEMP_DIR / "bundle" / "a.csv").read_bytes() == b"x,y\n1,2\n", result)
+    result = download(server.add("/col.csv.gz", RangeFile(payloads["gz"])), "col.csv.gz", extract=True)
+    check("gzip files are decompressed next to the download",
+          (TEMP_DIR / "col.csv").read_bytes() == b"col\n" * 1000 and "col.csv" in result, result)
+    result = download(server.add("/col.csv.gz", RangeFile(payloads["gz"])), "col.csv.gz", extract=True)
+    check("extracting again replaces the earlier output", (TEMP_DIR / "col.csv").stat().st_size == 4000, result)
+
+
+def timed_download(url: str, name: str, segments: int) -> float:
+    transfer.DOWNLOAD_SEGMENTS = segments
+    start = time.perf_counter()
+    download(url, name)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--large-mb", type=int, default=64)
+    parser.add_argument("--rate-mb", type=float, default=25, help="bandwidth cap per connection")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory, LocalServer() as server:
+        cache = DownloadCache(Path(directory))
+        downloader.download_cache = cache
+        check = Checks()
+        segments = transfer.DOWNLOAD_SEGMENTS
+        functional_checks(server, check)
+
+        size = args.large_mb * 1024 * 1024
+        body = os.urandom(size)
+        print(f"{args.large_mb} MB file, {args.rate_mb:.0f} MB/s per connection")
+        for label, count in (("single stream", 1), (f"{segments} segments", segments)):
+            # A fresh URL each time so the cache can't answer
+            url = server.add(f"/timed-{count}.bin", RangeFile(body, rate_mb=args.rate_mb))
+            seconds = timed_download(url, f"timed-{count}.bin", count)
+            print(f"{label:>14}: {size / seconds / 1024 / 1024:8.1f} MB/s ({seconds:.2f}s)")
+        print(f"metrics: {cache.stats()}")
+
+        for pattern in ("r[0-9].bin", "r6?.bin", "timed-*.bin", "data.zip", "bundle.tar.gz", "col.csv*"):
+            for path in TEMP_DIR.glob(pattern):
+                path.unlink()
+        for name in ("data", "bundle"):
+            shutil.rmtree(TEMP_DIR / name, ignore_errors=True)
+
+    if check.failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
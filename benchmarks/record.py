@@ -0,0 +1,84 @@
+"""Record a quiz chain for offline replay with `benchmarks.replay`.
+
+Runs the real agent on URL and saves every LLM reply, HTTP exchange
+(pages, downloads, submissions) and browser-rendered page under --out.
+Export EMAIL, SECRET and GOOGLE_API_KEY first: the benchmarks package
+fills in dummy credentials before .env is read. With --fake, a chain of
+the local fake quiz server is recorded with the scripted LLM instead,
+which needs neither network nor credentials.
+
+Usage: python -m benchmarks.record URL --out benchmarks/recordings/<name> [--async]
+       python -m benchmarks.record --fake --out benchmarks/recordings/<name> [--levels 3]
+"""
+import argparse
+import logging
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import agent
+import solvers
+import tools.scraper as scraper
+from benchmarks.fakes import FakeQuizServer, scripted_quiz_llm
+from benchmarks.recording import (
+    Recording,
+    RecordingTransport,
+    arecording_browser,
+    isolate,
+    recording_browser,
+    recording_llm,
+    run_chain,
+)
+from ratelimit import RateLimiter
+from tools import http_client
+
+
+def record(url: str, out: Path, use_async: bool, meta: dict) -> Recording:
+    recording = Recording(out, {"url": url, "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                                "solvers": solvers.SOLVERS_ENABLED, **meta})
+    http_client.wrap_transports(lambda transport: RecordingTransport(transport, recording))
+    scraper._fetch_browser = recording_browser(scraper._fetch_browser, recording)
+    scraper._afetch_browser = arecording_browser(scraper._afetch_browser, recording)
+    agent.llm_with_prompt = recording_llm(agent.llm_with_prompt, recording)
+
+    with tempfile.TemporaryDirectory() as directory:
+        isolate(Path(directory))
+        recording.meta["chain_seconds"] = round(run_chain(url, "record", use_async), 3)
+    http_client.wrap_transports(None)
+
+    if out.exists():
+        shutil.rmtree(out)
+    recording.save()
+    return recording
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url", nargs="?")
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run the chain with ainvoke")
+    parser.add_argument("--fake", action="store_true", help="record a fake quiz server chain offline")
+    parser.add_argument("--levels", type=int, default=3, help="questions in the --fake chain")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per scripted LLM call with --fake")
+    args = parser.parse_args()
+    if not args.fake and not args.url:
+        parser.error("give a quiz URL or --fake")
+
+    if args.fake:
+        # The fake questions are all ones the solvers answer; record the agent doing it
+        solvers.SOLVERS_ENABLED = False
+        agent.llm_with_prompt = scripted_quiz_llm(args.llm_latency)
+        agent.llm_limiter = RateLimiter(requests_per_second=1e9, burst=10**9, tokens_per_minute=10**12)
+        with FakeQuizServer(levels=args.levels) as server:
+            recording = record(server.new_chain(), args.out, args.use_async, {"fake": True})
+    else:
+        logging.getLogger().setLevel(logging.INFO)
+        recording = record(args.url, args.out, args.use_async, {"fake": False})
+
+    print(f"Recorded {len(recording.llm)} LLM replies, {len(recording.exchanges)} HTTP exchanges and "
+          f"{len(recording.rendered)} rendered pages in {recording.meta['chain_seconds']}s to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
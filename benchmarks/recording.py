@@ -0,0 +1,443 @@
+"""Recordings of quiz chains: what the LLM, the pages and the quiz server answered.
+
+A recording is a directory holding recording.json plus bodies/<sha256>
+files. It is written by `benchmarks.record` and served back by
+`benchmarks.replay`. Every HTTP exchange of the shared client is
+captured below the client (raw, still content-encoded bodies, one entry
+per redirect hop), browser-rendered pages are captured at the scraper
+tier and LLM replies at `agent.llm_with_prompt`.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import message_to_dict
+from langchain_core.runnables import RunnableLambda
+
+import agent
+import solvers
+import tools.downloader as downloader
+import tools.prefetch as prefetch
+import tools.requester as requester
+import tools.scraper as scraper
+from benchmarks.server import LocalServer
+from compaction import estimate_tokens
+from llm_cache import LLMCache, cache_key, revive
+from tools.context import JobContext, current_job
+from tools.download_cache import DownloadCache
+from tools.submissions import SubmissionLog
+
+# Hop-by-hop headers that describe the recorded connection, not the body
+_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-length"}
+REPLAY_HEADER = "X-Replay-URL"
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class Recording:
+    """Exchanges, rendered pages and LLM replies of one chain, kept in memory until `save`."""
+
+    def __init__(self, directory: Path, meta: Optional[dict] = None):
+        self.directory = Path(directory)
+        self.meta = dict(meta or {})
+        self.exchanges = []
+        self.rendered = {}
+        self.llm = []
+        self._bodies = {}
+        self._lock = threading.Lock()
+
+    # --- Writing ------------------------------------------------------------
+
+    def _body(self, data: bytes) -> Optional[str]:
+        if not data:
+            return None
+        sha = _sha256(data)
+        with self._lock:
+            self._bodies[sha] = data
+        return sha
+
+    def add_exchange(self, request: httpx.Request, request_body: bytes, response: httpx.Response,
+                     body: bytes, seconds: float):
+        entry = {
+            "method": request.method,
+            "url": str(request.url),
+            "range": request.headers.get("Range"),
+            "request_body": self._body(request_body),
+            "status": response.status_code,
+            "headers": [[name, value] for name, value in response.headers.multi_items()
+                        if name.lower() not in _HOP_HEADERS],
+            "body": self._body(body),
+            "seconds": round(seconds, 4),
+        }
+        with self._lock:
+            self.exchanges.append(entry)
+
+    def add_rendered(self, url: str, content: str, seconds: float):
+        sha = self._body(content.encode())
+        with self._lock:
+            self.rendered[url] = {"body": sha, "seconds": round(seconds, 4)}
+
+    def add_llm(self, key: str, message, seconds: float):
+        with self._lock:
+            self.llm.append({"key": key, "message": message_to_dict(message), "seconds": round(seconds, 4)})
+
+    def save(self):
+        bodies = self.directory / "bodies"
+        bodies.mkdir(parents=True, exist_ok=True)
+        for sha, data in self._bodies.items():
+            (bodies / sha).write_bytes(data)
+        document = {**self.meta, "exchanges": self.exchanges, "rendered": self.rendered, "llm": self.llm}
+        (self.directory / "recording.json").write_text(json.dumps(document, indent=1, default=str))
+
+    # --- Reading ------------------------------------------------------------
+
+    @classmethod
+    def load(cls, directory: Path) -> "Recording":
+        directory = Path(directory)
+        document = json.loads((directory / "recording.json").read_text())
+        recording = cls(directory)
+        recording.exchanges = document.pop("exchanges")
+        recording.rendered = document.pop("rendered")
+        recording.llm = document.pop("llm")
+        recording.meta = document
+        return recording
+
+    def body(self, sha: Optional[str]) -> bytes:
+        if sha is None:
+            return b""
+        if sha not in self._bodies:
+            self._bodies[sha] = (self.directory / "bodies" / sha).read_bytes()
+        return self._bodies[sha]
+
+
+# --- Recording --------------------------------------------------------------
+
+class RecordingTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Wraps a default transport and copies every exchange into a Recording."""
+
+    def __init__(self, inner, recording: Recording):
+        self.inner = inner
+        self.recording = recording
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        request_body = request.read()
+        response = self.inner.handle_request(request)
+        body = b"".join(response.iter_raw())
+        self.recording.add_exchange(request, request_body, response, body, time.perf_counter() - start)
+        return httpx.Response(response.status_code, headers=response.headers, content=body,
+                              extensions=response.extensions)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        request_body = await request.aread()
+        response = await self.inner.handle_async_request(request)
+        body = b"".join([chunk async for chunk in response.aiter_raw()])
+        self.recording.add_exchange(request, request_body, response, body, time.perf_counter() - start)
+        return httpx.Response(response.status_code, headers=response.headers, content=body,
+                              extensions=response.extensions)
+
+    def close(self):
+        self.inner.close()
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+def recording_browser(fetch, recording: Recording):
+    """Wrap scraper._fetch_browser so rendered pages are recorded."""
+
+    def fetch_and_record(url: str) -> str:
+        start = time.perf_counter()
+        content = fetch(url)
+        recording.add_rendered(url, content, time.perf_counter() - start)
+        return content
+
+    return fetch_and_record
+
+
+def arecording_browser(afetch, recording: Recording):
+    """Wrap scraper._afetch_browser so rendered pages are recorded."""
+
+    async def fetch_and_record(url: str) -> str:
+        start = time.perf_counter()
+        content = await afetch(url)
+        recording.add_rendered(url, content, time.perf_counter() - start)
+        return content
+
+    return fetch_and_record
+
+
+def recording_llm(llm, recording: Recording) -> RunnableLambda:
+    """Wrap agent.llm_with_prompt so every reply is recorded with its prompt-state key."""
+
+    def respond(inputs):
+        key = cache_key(agent.PROMPT_FINGERPRINT, inputs["messages"])
+        start = time.perf_counter()
+        result = llm.invoke(inputs)
+        recording.add_llm(key, result, time.perf_counter() - start)
+        return result
+
+    async def arespond(inputs):
+        key = cache_key(agent.PROMPT_FINGERPRINT, inputs["messages"])
+        start = time.perf_counter()
+        result = await llm.ainvoke(inputs)
+        recording.add_llm(key, result, time.perf_counter() - start)
+        return result
+
+    return RunnableLambda(respond, afunc=arespond)
+
+
+# --- Replay -----------------------------------------------------------------
+
+class ReplayServer(LocalServer):
+    """
+    Serves a recording's exchanges over HTTP on 127.0.0.1.
+
+    Requests arrive through RedirectTransport, which keeps the original URL
+    in the X-Replay-URL header. An exchange with the same method, URL,
+    Range and request body is preferred (each served once before any is
+    repeated), then one with the same method and URL, so a replay that
+    submits a different answer still gets the recorded verdict.
+    `realtime` sleeps for the recorded latency before answering.
+    """
+
+    def __init__(self, recording: Recording, realtime: bool = False):
+        super().__init__()
+        self.recording = recording
+        self.realtime = realtime
+        self.served = Counter()
+        self._by_url = defaultdict(list)
+        for i, exchange in enumerate(recording.exchanges):
+            self._by_url[(exchange["method"], exchange["url"])].append(i)
+            self.routes[urlsplit(exchange["url"]).path] = self._serve
+        self._used = Counter()
+        self._lock = threading.Lock()
+
+    def _match(self, method: str, url: str, range_header: Optional[str], body_sha: Optional[str]) -> Optional[dict]:
+        candidates = self._by_url.get((method, url), [])
+        exact = [i for i in candidates if self.recording.exchanges[i]["range"] == range_header
+                 and self.recording.exchanges[i]["request_body"] == body_sha]
+        with self._lock:
+            for pool, kind in ((exact, "exact"), (candidates, "approximate")):
+                if pool:
+                    choice = min(pool, key=lambda i: (self._used[i], i))
+                    self._used[choice] += 1
+                    self.served[kind] += 1
+                    return self.recording.exchanges[choice]
+            self.served["missing"] += 1
+        return None
+
+    def _serve(self, handler):
+        body = handler.read_body()
+        url = handler.headers.get(REPLAY_HEADER, "")
+        exchange = self._match(handler.command, url, handler.headers.get("Range"), _sha256(body) if body else None)
+        if exchange is None:
+            return 404, "text/plain", f"not in the recording: {handler.command} {url}".encode()
+        if self.realtime:
+            time.sleep(exchange["seconds"])
+        payload = self.recording.body(exchange["body"])
+        handler.send_response(exchange["status"])
+        for name, value in exchange["headers"]:
+            handler.send_header(name, value)
+        handler.send_header("Content-Length", str(len(payload)))
+        handler.end_headers()
+        if handler.command != "HEAD":
+            handler.wfile.write(payload)
+
+
+class RedirectTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Sends every request to a ReplayServer instead of the original host."""
+
+    def __init__(self, inner, base_url: str):
+        self.inner = inner
+        self.base = httpx.URL(base_url)
+
+    def _redirect(self, request: httpx.Request, content: bytes) -> httpx.Request:
+        headers = request.headers.copy()
+        headers[REPLAY_HEADER] = str(request.url)
+        headers["Host"] = self.base.netloc.decode()
+        headers.pop("Content-Length", None)
+        url = self.base.copy_with(raw_path=request.url.raw_path)
+        return httpx.Request(request.method, url, headers=headers, content=content, extensions=request.extensions)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        return self.inner.handle_request(self._redirect(request, request.read()))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.inner.handle_async_request(self._redirect(request, await request.aread()))
+
+    def close(self):
+        self.inner.close()
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class ReplayLLM:
+    """
+    Fake chat model answering with the recorded replies.
+
+    A reply recorded for the same prompt-state key is used first; when the
+    replay has diverged (e.g. a tool output changed) the next unused reply
+    in recording order is served instead and counted in `diverged`.
+    """
+
+    def __init__(self, recording: Recording, realtime: bool = False):
+        self.recording = recording
+        self.realtime = realtime
+        self._unused = list(range(len(recording.llm)))
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+    def _next(self, inputs) -> tuple:
+        key = cache_key(agent.PROMPT_FINGERPRINT, inputs["messages"])
+        with self._lock:
+            if not self._unused:
+                raise RuntimeError("The replay asked the LLM more often than the recording did")
+            match = next((i for i in self._unused if self.recording.llm[i]["key"] == key), None)
+            if match is None:
+                match = self._unused[0]
+                self.stats["diverged"] += 1
+            self._unused.remove(match)
+        entry = self.recording.llm[match]
+        message = revive(entry["message"])
+        usage = message.usage_metadata
+        if not usage:
+            # Scripted recordings carry no usage; fall back to the limiter's estimate
+            usage = {"input_tokens": agent.PROMPT_TOKENS + estimate_tokens(inputs["messages"]),
+                     "output_tokens": estimate_tokens([message]), "estimated": 1}
+        with self._lock:
+            self.stats.update(calls=1, input_tokens=usage.get("input_tokens", 0),
+                              output_tokens=usage.get("output_tokens", 0),
+                              estimated_tokens=1 if usage.get("estimated") else 0)
+        return message, entry["seconds"] if self.realtime else 0
+
+    def _respond(self, inputs):
+        message, delay = self._next(inputs)
+        time.sleep(delay)
+        return message
+
+    async def _arespond(self, inputs):
+        message, delay = self._next(inputs)
+        await asyncio.sleep(delay)
+        return message
+
+    def runnable(self) -> RunnableLambda:
+        return RunnableLambda(self._respond, afunc=self._arespond)
+
+
+def replay_browser(recording: Recording, realtime: bool = False):
+    """Stand-ins for scraper._fetch_browser / _afetch_browser serving recorded renders."""
+
+    def render(url: str) -> tuple:
+        page = recording.rendered.get(url)
+        if page is None:
+            raise RuntimeError(f"No rendered page recorded for {url}")
+        return recording.body(page["body"]).decode(), page["seconds"] if realtime else 0
+
+    def fetch(url: str) -> str:
+        content, delay = render(url)
+        time.sleep(delay)
+        return content
+
+    async def afetch(url: str) -> str:
+        content, delay = render(url)
+        await asyncio.sleep(delay)
+        return content
+
+    return fetch, afetch
+
+
+# --- Profiling --------------------------------------------------------------
+
+class StepProfiler(BaseCallbackHandler):
+    """Graph callback timing every agent step and tool call of a chain."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.steps = []
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, kind: str, name: str):
+        with self._lock:
+            self._started[run_id] = (kind, name, time.perf_counter())
+
+    def _end(self, run_id, error: bool = False):
+        with self._lock:
+            started = self._started.pop(run_id, None)
+            if started is None:
+                return
+            kind, name, start = started
+            self.steps.append({"kind": kind, "name": name, "seconds": round(time.perf_counter() - start, 4),
+                               "error": error})
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        # The node and the callable it wraps are both named "agent": time the outer one
+        if kwargs.get("name") == "agent" and parent_run_id not in self._started:
+            self._start(run_id, "llm", "agent")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, "tool", (serialized or {}).get("name") or kwargs.get("name", "tool"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+
+# --- Running chains ---------------------------------------------------------
+
+def isolate(directory: Path):
+    """Give the tools a fresh download cache and submission log, and no LLM cache or scraper tier memory."""
+    downloader.download_cache = prefetch.download_cache = DownloadCache(Path(directory) / "downloads")
+    agent.llm_cache = LLMCache(path=None, mode="0")
+    requester.submission_log = solvers.submission_log = SubmissionLog(path=None)
+    scraper._tier_memory.clear()
+    scraper._http_failures.clear()
+
+
+def run_chain(url: str, job_id: str, use_async: bool = False, profiler: Optional[StepProfiler] = None) -> float:
+    """Run one chain in its own job context; returns its wall time in seconds."""
+    run_config = agent._run_config
+
+    def profiled_config(counter, *args):
+        config = run_config(counter, *args)
+        if profiler is not None:
+            config["callbacks"] = config["callbacks"] + [profiler]
+        return config
+
+    job = JobContext(job_id)
+    token = current_job.set(job)
+    agent._run_config = profiled_config
+    start = time.perf_counter()
+    try:
+        if use_async:
+            asyncio.run(agent.run_agent_async(url))
+        else:
+            agent.run_agent(url)
+        return time.perf_counter() - start
+    finally:
+        agent._run_config = run_config
+        current_job.reset(token)
+        job.close()
+        job.cleanup()
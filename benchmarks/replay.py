@@ -0,0 +1,169 @@
+"""Replay a recorded quiz chain offline and report where its time goes, as JSON.
+
+Pages, downloads and submissions are served from the recording by a local
+server (every request of the shared HTTP client is redirected to it),
+rendered pages stand in for Chromium and a fake chat model returns the
+recorded LLM replies. By default neither the network nor the LLM latency
+is replayed, so the numbers measure the solver's own overhead; --realtime
+adds the recorded latencies back.
+
+The report has per-step latencies, time split by tool, LLM calls and
+tokens, peak RSS and total chain time for each run plus medians. With
+--baseline, medians are compared against an earlier report and the run
+fails if one regressed by more than --tolerance.
+
+Usage: python -m benchmarks.replay benchmarks/recordings/<name> [--runs 3] [--async]
+       [--realtime] [--json report.json] [--baseline old.json] [--tolerance 0.25]
+"""
+import argparse
+import json
+import logging
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+import agent
+import solvers
+import tools.scraper as scraper
+from benchmarks.recording import (
+    RedirectTransport,
+    Recording,
+    ReplayLLM,
+    ReplayServer,
+    StepProfiler,
+    isolate,
+    replay_browser,
+    run_chain,
+)
+from ratelimit import RateLimiter
+from tools import http_client
+
+# Regressions smaller than this many seconds are noise, whatever the ratio
+MIN_REGRESSION_SECONDS = 0.05
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _peak_rss_mb() -> dict:
+    # ru_maxrss is in KiB on Linux (bytes on macOS)
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def replay_once(recording: Recording, server: ReplayServer, run: int, use_async: bool, realtime: bool) -> dict:
+    llm = ReplayLLM(recording, realtime)
+    agent.llm_with_prompt = llm.runnable()
+    profiler = StepProfiler()
+    served = server.served.copy()
+    with tempfile.TemporaryDirectory() as directory:
+        isolate(Path(directory))
+        seconds = run_chain(recording.meta["url"], f"replay-{run}", use_async, profiler)
+
+    tools = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "errors": 0})
+    for step in profiler.steps:
+        if step["kind"] == "tool":
+            totals = tools[step["name"]]
+            totals["calls"] += 1
+            totals["seconds"] = round(totals["seconds"] + step["seconds"], 4)
+            totals["errors"] += step["error"]
+    llm_steps = [step["seconds"] for step in profiler.steps if step["kind"] == "llm"]
+    return {
+        "chain_seconds": round(seconds, 4),
+        "steps": profiler.steps,
+        "tools": dict(tools),
+        "llm": {**llm.stats, "calls": len(llm_steps), "seconds": round(sum(llm_steps), 4)},
+        "http": dict(server.served - served),
+    }
+
+
+def summarize(runs: list) -> dict:
+    names = {name for run in runs for name in run["tools"]}
+    return {
+        "chain_seconds": round(statistics.median(run["chain_seconds"] for run in runs), 4),
+        "llm_seconds": round(statistics.median(run["llm"]["seconds"] for run in runs), 4),
+        "tool_seconds": {
+            name: round(statistics.median(run["tools"].get(name, {}).get("seconds", 0.0) for run in runs), 4)
+            for name in sorted(names)
+        },
+        "llm_calls": runs[-1]["llm"]["calls"],
+        "input_tokens": runs[-1]["llm"].get("input_tokens", 0),
+        "output_tokens": runs[-1]["llm"].get("output_tokens", 0),
+        "diverged": max(run["llm"].get("diverged", 0) for run in runs),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def regressions(summary: dict, baseline: dict, tolerance: float) -> list:
+    """Medians that grew by more than `tolerance` (and MIN_REGRESSION_SECONDS) since the baseline."""
+    pairs = [("chain_seconds", summary["chain_seconds"], baseline.get("chain_seconds")),
+             ("llm_seconds", summary["llm_seconds"], baseline.get("llm_seconds"))]
+    pairs += [(f"tool_seconds.{name}", seconds, baseline.get("tool_seconds", {}).get(name))
+              for name, seconds in summary["tool_seconds"].items()]
+    found = []
+    for name, now, before in pairs:
+        if before is not None and now > before * (1 + tolerance) and now - before > MIN_REGRESSION_SECONDS:
+            found.append(f"{name}: {before:.3f}s -> {now:.3f}s")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", type=Path)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run the chain with ainvoke")
+    parser.add_argument("--realtime", action="store_true", help="replay recorded network, browser and LLM latency")
+    parser.add_argument("--json", type=Path, help="write the report here instead of stdout")
+    parser.add_argument("--baseline", type=Path, help="earlier report to compare the medians with")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    recording = Recording.load(args.recording)
+    solvers.SOLVERS_ENABLED = recording.meta.get("solvers", True)
+    agent.llm_limiter = RateLimiter(requests_per_second=1e9, burst=10**9, tokens_per_minute=10**12)
+    scraper._fetch_browser, scraper._afetch_browser = replay_browser(recording, args.realtime)
+
+    with ReplayServer(recording, args.realtime) as server:
+        http_client.wrap_transports(lambda transport: RedirectTransport(transport, server.base_url))
+        runs = [replay_once(recording, server, i, args.use_async, args.realtime) for i in range(args.runs)]
+        http_client.wrap_transports(None)
+
+    report = {
+        "recording": str(args.recording),
+        "commit": _git_commit(),
+        "mode": "async" if args.use_async else "sync",
+        "realtime": args.realtime,
+        "recorded_chain_seconds": recording.meta.get("chain_seconds"),
+        "summary": summarize(runs),
+        "runs": runs,
+    }
+    if args.baseline:
+        report["regressions"] = regressions(report["summary"], json.loads(args.baseline.read_text())["summary"],
+                                            args.tolerance)
+
+    text = json.dumps(report, indent=2)
+    if args.json:
+        args.json.write_text(text)
+        print(json.dumps(report["summary"], indent=2))
+    else:
+        print(text)
+    if report.get("regressions"):
+        print("Regressions:\n  " + "\n  ".join(report["regressions"]), file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Local HTTP server used by the benchmarks."""
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Tuple
+
+# path -> (status, content type, body)
+Route = Tuple[int, str, bytes]
+
+
+class LocalServer:
+    """
+    Threaded HTTP server on 127.0.0.1 serving an in-memory route table.
+
+    Routes can be static tuples or callables taking the request handler,
+    which lets benchmarks emulate quiz endpoints.
+    """
+
+    def __init__(self, routes: Dict[str, object] = None):
+        self.routes = dict(routes or {})
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this,
+            # keep-alive clients stall on delayed ACKs (~40 ms per request)
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def handle(self):
+                try:
+                    super().handle()
+                except ConnectionError:
+                    # Clients may hang up mid-response (e.g. abandoned downloads)
+                    pass
+
+            def _dispatch(self):
+                route = server.routes.get(self.path.split("?")[0])
+                if route is None:
+                    return self._send(404, "text/plain", b"not found")
+                if callable(route):
+                    route = route(self)
+                    if route is None:
+                        return
+                self._send(*route)
+
+            def _send(self, status: int, content_type: str, body: bytes):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def read_body(self) -> bytes:
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length) if length else b""
+
+            do_GET = do_POST = do_HEAD = _dispatch
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def add(self, path: str, route) -> str:
+        """Register a route and return its absolute URL."""
+        self.routes[path] = route
+        return self.base_url + path
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def html(body: str, status: int = 200) -> Route:
+    return status, "text/html; charset=utf-8", body.encode()
@@ -0,0 +1,160 @@
+"""Run many concurrent run_code snippets in separate chains and check for cross-talk.
+
+Every simulated chain gets its own JobContext, writes a file whose name is
+shared by all chains, sleeps, reads it back and prints it. Any output that
+is not the chain's own token means two chains touched the same file. The
+script also checks that the sandbox limits hold in warm and cold runs, that
+a timed-out cold run takes its child processes with it, that warm forks run
+with BLAS threads capped, and that workdirs are removed afterwards.
+
+Usage: python -m benchmarks.stress_sandbox [--chains 32] [--snippets 3]
+"""
+import argparse
+import contextvars
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tools.executor as executor
+from config import CODE_MAX_OPEN_FILES
+from tools.context import JobContext, current_job
+from tools.executor import run_code
+from tools.interpreter import InterpreterPool, interpreter_pool
+
+SNIPPET = """
+import time
+with open("shared_name.txt", "w") as f:
+    f.write("{token}")
+time.sleep({delay})
+with open("shared_name.txt") as f:
+    print(f.read())
+"""
+
+LIMIT_CHECKS = {
+    "open files": (
+        f"handles = [open('f%d.txt' % i, 'w') for i in range({CODE_MAX_OPEN_FILES + 50})]",
+        "Too many open files",
+    ),
+    "file size": (
+        "open('big.bin', 'wb').write(b'0' * (1024 * 1024 * 1024))",
+        "File too large",
+    ),
+    "memory": ("blob = bytearray(8 * 1024 ** 3)", "MemoryError"),
+}
+
+
+def run_chain(index: int, snippets: int) -> list:
+    job = JobContext(f"stress-{index}")
+    current_job.set(job)
+    errors = []
+    try:
+        for n in range(snippets):
+            token = f"chain-{index}-snippet-{n}"
+            result = run_code.invoke({"code": SNIPPET.format(token=token, delay=random.uniform(0, 0.2))})
+            if result["stdout"].strip() != token:
+                errors.append(f"{token}: got {result['stdout'].strip()!r} {result['stderr'][-200:]}")
+    finally:
+        job.cleanup()
+    if job.workdir.exists():
+        errors.append(f"workdir of chain {index} was not removed")
+    return errors
+
+
+ORPHAN = """
+import subprocess, time
+print(subprocess.Popen(["sleep", "60"]).pid, flush=True)
+time.sleep(60)
+"""
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # A killed child the snippet never reaped is a zombie until init collects it
+    with open(f"/proc/{pid}/stat") as f:
+        return f.read().split(")")[-1].split()[0] != "Z"
+
+
+def check_limits(mode: str) -> list:
+    job = JobContext(f"stress-limits-{mode}")
+    current_job.set(job)
+    errors = []
+    try:
+        for name, (code, expected) in LIMIT_CHECKS.items():
+            result = run_code.invoke({"code": code})
+            ok = result["return_code"] != 0 and expected in result["stderr"]
+            print(f"limit {name:<11} {mode:<4} {'enforced' if ok else 'NOT ENFORCED'}")
+            if not ok:
+                errors.append(f"{name} ({mode}): {result}")
+    finally:
+        job.cleanup()
+    return errors
+
+
+def check_cold() -> list:
+    """Limits and timeouts of cold runs: python3 per snippet, no warm pool."""
+    pool, timeout = executor.interpreter_pool, executor.CODE_TIMEOUT
+    executor.interpreter_pool = InterpreterPool(size=0)
+    try:
+        errors = contextvars.copy_context().run(check_limits, "cold")
+        executor.CODE_TIMEOUT = 2
+        result = run_code.invoke({"code": ORPHAN})
+    finally:
+        executor.interpreter_pool, executor.CODE_TIMEOUT = pool, timeout
+    child = int(result["stdout"].split()[0])
+    time.sleep(0.2)
+    ok = "timeout" in result["stderr"] and not _alive(child)
+    print(f"timed-out cold run's children {'killed' if ok else 'STILL RUNNING'}")
+    return errors if ok else errors + [f"child {child} of a timed-out cold run survived: {result}"]
+
+
+def check_threads() -> list:
+    """Warm snippets are forked from an interpreter that preloaded numpy without BLAS threads."""
+    code = "import os\nprint(os.environ.get('OMP_NUM_THREADS'), os.environ.get('OPENBLAS_NUM_THREADS'))"
+    result = run_code.invoke({"code": code})
+    ok = result["stdout"].strip() == "1 1"
+    print(f"warm pool BLAS threads {'single' if ok else 'NOT CAPPED'}")
+    return [] if ok else [f"BLAS threads in a warm fork: {result}"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chains", type=int, default=32)
+    parser.add_argument("--snippets", type=int, default=3)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    interpreter_pool.start()
+    try:
+        errors = contextvars.copy_context().run(check_limits, "warm")
+        errors += check_cold()
+        errors += check_threads()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.chains) as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, run_chain, i, args.snippets)
+                for i in range(args.chains)
+            ]
+            for future in futures:
+                errors.extend(future.result())
+        elapsed = time.perf_counter() - start
+    finally:
+        interpreter_pool.stop()
+
+    total = args.chains * args.snippets
+    print(f"{total} snippets in {args.chains} concurrent chains: {elapsed:.2f}s, "
+          f"warm pool {interpreter_pool.stats()}")
+    if errors:
+        print(f"❌ {len(errors)} problem(s):")
+        for error in errors[:20]:
+            print(f"  {error}")
+        raise SystemExit(1)
+    print("✓ No cross-talk between chains")
+
+
+if __name__ == "__main__":
+    main()
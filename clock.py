@@ -0,0 +1,59 @@
+"""Clocks used for rate limiting and deadlines (real and virtual)."""
+import asyncio
+import threading
+import time
+
+POLL_INTERVAL = 0.25  # Back-off for callers waiting on someone else
+
+
+class MonotonicClock:
+    """Wall-clock time from time.monotonic()."""
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    async def asleep(self, seconds: float):
+        await asyncio.sleep(max(seconds, 0))
+
+    def pause(self):
+        """Short back-off while waiting on another caller."""
+        time.sleep(POLL_INTERVAL)
+
+    async def apause(self):
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+class VirtualClock:
+    """Manually driven clock for tests: sleeping advances time instantly."""
+
+    def __init__(self, start: float = 0.0):
+        self._now = start
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        return self._now
+
+    def advance(self, seconds: float):
+        with self._lock:
+            self._now += max(seconds, 0)
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+
+    async def asleep(self, seconds: float):
+        self.advance(seconds)
+        await asyncio.sleep(0)
+
+    def pause(self):
+        # Waiting on another caller must not move virtual time
+        time.sleep(0.001)
+
+    async def apause(self):
+        await asyncio.sleep(0)
+
+
+default_clock = MonotonicClock()
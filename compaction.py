@@ -0,0 +1,183 @@
+"""Message-history compaction for the agent state."""
+import json
+import logging
+from typing import List
+
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, ToolMessage
+
+from config import (
+    TEMP_DIR,
+    COMPACT_KEEP_TURNS,
+    COMPACT_HEAD_CHARS,
+    COMPACT_TAIL_CHARS,
+    COMPACT_TOKEN_BUDGET,
+)
+from tools.context import workdir
+from tools.tracing import span
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DIR = TEMP_DIR / "history"
+SUMMARY_PREFIX = "[Summary of finished questions]"
+CHARS_PER_TOKEN = 4
+
+
+def _text(content) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part.get("text", "") if isinstance(part, dict) else str(part) for part in content
+        )
+    return json.dumps(content, default=str)
+
+
+def estimate_tokens(messages: List) -> int:
+    """Cheap token estimate (chars / 4) including tool-call arguments."""
+    chars = 0
+    for msg in messages:
+        if isinstance(msg, dict):
+            chars += len(_text(msg.get("content", "")))
+            continue
+        chars += len(_text(msg.content))
+        for call in getattr(msg, "tool_calls", None) or []:
+            chars += len(json.dumps(call.get("args", {}), default=str))
+    return chars // CHARS_PER_TOKEN
+
+
+def _parse_json(content) -> dict:
+    try:
+        data = json.loads(_text(content))
+    except (TypeError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _spill(msg: ToolMessage) -> str:
+    """Write a tool output to disk and return its workdir-relative path."""
+    directory = workdir() / HISTORY_DIR.name
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"{msg.tool_call_id or msg.id}.txt"
+    path = directory / name
+    if not path.exists():
+        path.write_text(_text(msg.content), encoding="utf-8")
+    return f"{HISTORY_DIR.name}/{name}"
+
+
+def _shorten(msg: ToolMessage, head: int, tail: int) -> ToolMessage:
+    text = _text(msg.content)
+    pointer = _spill(msg)
+    omitted = len(text) - head - tail
+    content = f"{text[:head]}\n... [{omitted} chars omitted, full output in {pointer}] ...\n{text[-tail:] if tail else ''}"
+    return msg.model_copy(update={"content": content})
+
+
+def _question_boundaries(messages: List) -> List[int]:
+    """Indices of the last message of each question that got a new `url`."""
+    boundaries = []
+    for i, msg in enumerate(messages):
+        if not isinstance(msg, ToolMessage) or msg.name != "send_post":
+            continue
+        if not _parse_json(msg.content).get("url"):
+            continue
+        end = i
+        while end + 1 < len(messages) and isinstance(messages[end + 1], ToolMessage):
+            end += 1
+        boundaries.append(end)
+    return boundaries
+
+
+def _summarize(segment: List) -> str:
+    """One line per submission in a finished stretch of history."""
+    lines = []
+    calls = {}
+    for msg in segment:
+        if isinstance(msg, HumanMessage):
+            text = _text(msg.content)
+            if text.startswith(SUMMARY_PREFIX):
+                lines.extend(text[len(SUMMARY_PREFIX):].strip().splitlines())
+            else:
+                lines.append(f"Start: {text[:300]}")
+        elif isinstance(msg, AIMessage):
+            for call in msg.tool_calls or []:
+                calls[call.get("id")] = call
+        elif isinstance(msg, ToolMessage) and msg.name == "send_post":
+            call = calls.get(msg.tool_call_id, {})
+            payload = call.get("args", {}).get("payload", {})
+            answer = json.dumps(payload.get("answer"), default=str)[:200] if isinstance(payload, dict) else "?"
+            quiz = payload.get("url", "?") if isinstance(payload, dict) else "?"
+            response = _parse_json(msg.content)
+            verdict = "correct" if response.get("correct") else "wrong"
+            reason = f" ({response['reason']})" if response.get("reason") else ""
+            lines.append(f"- {quiz}: answer {answer} -> {verdict}{reason}; next url: {response.get('url', 'none')}")
+    return "\n".join([SUMMARY_PREFIX] + lines)
+
+
+def compact_messages(
+    messages: List,
+    keep_turns: int = COMPACT_KEEP_TURNS,
+    head_chars: int = COMPACT_HEAD_CHARS,
+    tail_chars: int = COMPACT_TAIL_CHARS,
+    token_budget: int = COMPACT_TOKEN_BUDGET,
+) -> List:
+    """
+    Return `add_messages` updates that shrink the history.
+
+    1. Everything up to the last submission that returned a new `url` is
+       collapsed into one summary message (it reuses the first message id,
+       so it stays at the top of the history).
+    2. Tool outputs older than `keep_turns` agent turns are cut to head and
+       tail, with the full text spilled under <workdir>/history.
+    3. If the estimate is still over `token_budget`, the oldest tool
+       outputs are replaced by their pointer only.
+    """
+    updates = {}
+    removed = set()
+
+    boundaries = _question_boundaries(messages)
+    if boundaries and boundaries[-1] > 0:
+        end = boundaries[-1]
+        segment = messages[: end + 1]
+        summary = HumanMessage(content=_summarize(segment), id=segment[0].id)
+        updates[summary.id] = summary
+        removed = {msg.id for msg in segment[1:]}
+        logger.info(f"Compacted {len(segment)} messages of finished questions into a summary")
+
+    live = [msg for msg in messages if msg.id not in removed and msg.id not in updates]
+
+    # Agent turn index of every live message, counted from the end
+    turn = 0
+    turn_of = {}
+    for msg in reversed(live):
+        turn_of[msg.id] = turn
+        if isinstance(msg, AIMessage):
+            turn += 1
+
+    limit = head_chars + tail_chars + 200
+    for msg in live:
+        if isinstance(msg, ToolMessage) and turn_of[msg.id] >= keep_turns and len(_text(msg.content)) > limit:
+            updates[msg.id] = _shorten(msg, head_chars, tail_chars)
+
+    current = [updates.get(msg.id, msg) for msg in messages if msg.id not in removed]
+    tokens = estimate_tokens(current)
+    if tokens > token_budget:
+        for msg in current[:-1]:
+            if tokens <= token_budget:
+                break
+            if not isinstance(msg, ToolMessage) or turn_of.get(msg.id, 0) == 0:
+                continue
+            if _text(msg.content).startswith("[tool output evicted"):
+                continue
+            before = len(_text(msg.content)) // CHARS_PER_TOKEN
+            evicted = msg.model_copy(update={"content": f"[tool output evicted, full output in {_spill(msg)}]"})
+            updates[msg.id] = evicted
+            tokens -= before - len(_text(evicted.content)) // CHARS_PER_TOKEN
+        logger.info(f"History over token budget, evicted tool outputs down to ~{tokens} tokens")
+
+    return [RemoveMessage(id=msg_id) for msg_id in removed] + list(updates.values())
+
+
+def compaction_node(state):
+    """Graph node: shrink the message history before the next LLM call."""
+    with span("compact", messages=len(state["messages"])):
+        return {"messages": compact_messages(state["messages"])}
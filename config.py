@@ -20,11 +20,134 @@ if not all([EMAIL, SECRET, GOOGLE_API_KEY]):
 RECURSION_LIMIT = 200  # Max steps for quiz chain
 AGENT_TIMEOUT = 600  # 10 minutes max per quiz chain
 LLM_RATE_LIMIT = 9 / 60  # 9 requests per minute for Gemini
+LLM_BURST = 2  # Requests that may go out back-to-back before throttling
+LLM_TOKENS_PER_MINUTE = 1_000_000  # Gemini input+output token budget
+LLM_MAX_RETRIES = 2  # LangChain-level retries on top of the client-side limiter
+QUESTION_TIME_LIMIT = 180  # Seconds the quiz server allows per question
+AGENT_ASYNC = os.getenv("AGENT_ASYNC", "1") != "0"  # Run chains on the event loop (ainvoke + async tools)
+SOLVERS_ENABLED = os.getenv("SOLVERS", "1") != "0"  # Answer recognised question templates without the LLM
+
+# Deadline settings (per question, counted from its first scrape)
+DEADLINE_HURRY_SECONDS = 60  # Below this much time left: fast model, no verification
+DEADLINE_FINAL_SECONDS = 20  # Below this: no retries, submit the best-known answer and move on
+DEADLINE_SUBMIT_RESERVE = 10  # Seconds tool timeouts leave for submitting the answer
+DEADLINE_MIN_TIMEOUT = 5  # Shortest timeout a tool gets, even past the deadline
+
+# Job queue settings
+JOB_WORKERS = 4  # Quiz chains solved concurrently
+JOB_QUEUE_SIZE = 32  # Waiting chains before /solve answers 429
+JOB_CANCEL_GRACE = 15  # Seconds a cancelled chain gets to wind down
+JOB_HISTORY = 200  # Finished jobs kept for GET /jobs/{id}
+JOB_KEEP_WORKDIRS = os.getenv("JOB_KEEP_WORKDIRS", "0") == "1"  # Keep temp_files/jobs/<id> for debugging
+
+# History compaction (keeps LLM input size flat over long chains)
+COMPACT_KEEP_TURNS = 4  # Tool outputs from the last N agent turns stay intact
+COMPACT_HEAD_CHARS = 1500  # Kept from the start of an older tool output
+COMPACT_TAIL_CHARS = 500  # Kept from the end of an older tool output
+COMPACT_TOKEN_BUDGET = 24000  # Evict old tool outputs beyond this estimate
+
+# Tool execution settings (one agent turn's tool calls)
+TOOL_MEMO_TOOLS = ("scrape_page", "download_file", "install_package")  # Idempotent tools whose results a chain reuses (never send_post)
+TOOL_MEMO_TTL = 120  # Seconds an identical call of those tools returns the earlier result
+TOOL_MEMO_SIZE = 64  # Results remembered per chain
+TOOL_CONCURRENCY = {"scrape_page": 4, "download_file": 4, "run_code": 2, "install_package": 1, "send_post": 1}  # Calls of one tool running at once (send_post: in the order given)
 
 # File settings
 TEMP_DIR = Path("temp_files")
 TEMP_DIR.mkdir(exist_ok=True)
 
+# LLM response cache settings
+LLM_CACHE = os.getenv("LLM_CACHE", "0")  # "1" read and write, "0" off, "replay" read only (a miss is an error); for re-runs and offline benchmarks
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", TEMP_DIR / "cache" / "llm.sqlite3"))  # SQLite store of responses
+LLM_CACHE_TTL = 24 * 3600  # Seconds a cached response stays valid
+LLM_CACHE_MEMORY_MB = 64  # In-process LRU in front of the SQLite store
+LLM_CACHE_DISK_MB = 512  # Evict least recently used responses on disk beyond this
+
+# Submission log settings (verdicts per question, see tools/submissions.py)
+SUBMISSION_LOG = os.getenv("SUBMISSION_LOG", "1") != "0"  # Never resend a rejected answer within a chain; replay correct ones when it resumes
+SUBMISSION_LOG_PATH = Path(os.getenv("SUBMISSION_LOG_PATH", TEMP_DIR / "cache" / "submissions.sqlite3"))  # SQLite store of verdicts
+SUBMISSION_LOG_TTL = 60 * 60  # Seconds a verdict is remembered (a chain and its resumptions end well within this)
+SUBMISSION_REPLAY = os.getenv("SUBMISSION_REPLAY", "0") == "1"  # Also replay answers accepted in other chains (only if the quiz data never changes)
+
+# Job store settings (several processes sharing one queue, see job_store.py)
+JOB_PROCESSES = int(os.getenv("JOB_PROCESSES", "1"))  # uvicorn worker processes `python main.py` starts, each running JOB_WORKERS chains
+JOB_STORE = os.getenv("JOB_STORE", "1" if JOB_PROCESSES > 1 else "0") == "1"  # Queue chains in SQLite shared by processes (needed by worker.py)
+JOB_STORE_PATH = Path(os.getenv("JOB_STORE_PATH", TEMP_DIR / "jobs.sqlite3"))  # Jobs, leases and LangGraph checkpoints
+JOB_LEASE_SECONDS = 30  # A chain whose process stopped renewing its lease this long is resumed by another one
+JOB_HEARTBEAT_SECONDS = 10  # Lease renewal interval (also how soon a cancellation reaches the owning process)
+JOB_MAX_ATTEMPTS = 3  # Give a chain up once it lost its process this many times
+JOB_POLL_INTERVAL = 0.5  # Seconds an idle worker waits before looking for queued chains again
+
+# Code execution settings
+CODE_TIMEOUT = 120  # Seconds a run_code snippet may take
+CODE_MEMORY_LIMIT_MB = 2048  # Address-space limit per snippet (RLIMIT_AS; Linux ignores RLIMIT_RSS)
+CODE_MAX_OPEN_FILES = 256  # File descriptors per snippet
+CODE_MAX_FILE_MB = 256  # Largest file (and captured output) a snippet may write
+CODE_OUTPUT_MAX_CHARS = 4000  # stdout/stderr beyond this reach the agent summarized (full text spilled to outputs/)
+CODE_OUTPUT_SCAN_KB = 256  # Read at most this much from each end of a large capture
+WARM_WORKERS = 4  # Warm interpreters run_code forks snippets from (0 = cold python3 per call)
+WARM_MAX_RUNS = 100  # Replace a warm interpreter after this many snippets
+# Imported once per warm interpreter. Forking workers import them with OMP/OpenBLAS/MKL
+# capped at one thread (see interpreter_worker.py): forking after those pools start can deadlock
+WARM_PRELOAD = ("numpy", "pandas")
+SESSION_IDLE_TIMEOUT = 300  # Drop a stateful run_code session unused for this long
+SESSION_MEMORY_MB = 1024  # Reset a session whose RSS grows past this
+
+# Package settings (install_package installs into a per-job overlay venv)
+PACKAGE_WHEELHOUSE = Path(os.getenv("PACKAGE_WHEELHOUSE", "wheelhouse"))  # Local wheels (filled at image build); installs only read from here
+PACKAGE_OFFLINE = os.getenv("PACKAGE_OFFLINE", "0") == "1"  # Never fetch missing packages into the wheelhouse from PyPI
+PACKAGE_TIMEOUT = 120  # Seconds an install_package call may take
+
+# Shared HTTP client settings (tools/http_client.py)
+HTTP_HTTP2 = os.getenv("HTTP_HTTP2", "0") == "1"  # Negotiate HTTP/2 (needs the optional 'h2' package: pip install '.[http2]')
+HTTP_MAX_CONNECTIONS = 100  # Open connections across all hosts
+HTTP_MAX_KEEPALIVE = 20  # Idle connections kept for reuse
+HTTP_KEEPALIVE_EXPIRY = 30  # Seconds an idle connection stays open
+HTTP_RETRIES = 3  # Retries for idempotent requests (POSTs only on failed connects)
+HTTP_BACKOFF = 0.5  # Base of the exponential backoff between retries, seconds
+HTTP_DNS_TTL = 300  # Seconds a DNS answer is reused by the tools' clients (0 disables the cache)
+HTTP_DNS_CACHE_SIZE = 256  # Host names remembered (least recently used dropped first)
+
+# Download cache settings
+DOWNLOAD_CACHE_MAX_MB = 2048  # Evict least recently used downloads beyond this
+DOWNLOAD_MIN_CHUNK = 64 * 1024  # Smallest read size while streaming a download
+DOWNLOAD_MAX_CHUNK = 4 * 1024 * 1024  # Largest read size while streaming a download
+DOWNLOAD_SEGMENTS = 4  # Parallel Range requests per large download (1 disables splitting)
+DOWNLOAD_PARALLEL_MIN_MB = 8  # Only split downloads at least this large
+DOWNLOAD_RESUME_RETRIES = 3  # Times a broken transfer is resumed from where it stopped
+DOWNLOAD_MAX_EXTRACT_MB = 2048  # Refuse to decompress archives beyond this size
+
+# Prefetch settings (linked files and pages fetched while the LLM thinks)
+PREFETCH_ENABLED = os.getenv("PREFETCH", "1") != "0"  # Fetch a scraped page's links in the background
+PREFETCH_WORKERS = 4  # Concurrent background fetches across all chains
+PREFETCH_MAX_MB = 50  # Skip linked files larger than this
+PREFETCH_MAX_FILES = 8  # Linked files prefetched per scraped page
+PREFETCH_MAX_PAGES = 4  # Same-origin pages prefetched per scraped page
+PREFETCH_FRESH_SECONDS = 120  # Prefetched results are used without revalidation for this long
+PREFETCH_WAIT = 30  # Seconds a tool waits for an in-flight prefetch of the same URL
+
+# Tracing settings (GET /metrics, Chrome traces per chain)
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "0") == "1"  # Write temp_files/traces/<job>.json when a chain ends
+TRACE_DIR = TEMP_DIR / "traces"  # Open the files in chrome://tracing or ui.perfetto.dev
+TRACE_MAX_SPANS = 20000  # Spans kept per chain; later ones are only counted
+
+# Browser pool settings
+BROWSER_POOL_SIZE = 2  # Chromium instances kept warm for scrape_page
+BROWSER_MAX_PAGES = 50  # Recycle a browser context after this many pages
+BROWSER_MEMORY_CEILING_MB = 256  # Recycle a context once its JS heap exceeds this
+BROWSER_LEASE_TIMEOUT = 90  # Max seconds to wait for a pooled page
+
+# Scraper settings
+SCRAPE_HTTP_FIRST = True  # Try a plain GET before rendering in Chromium
+SCRAPE_MIN_TEXT_CHARS = 40  # Less visible text than this means JS must render it
+SCRAPE_BROWSER_AFTER = 2  # HTTP failures in a row before a route goes straight to the browser
+SCRAPE_BROWSER_TTL = 600  # Seconds such a route skips HTTP before it is given another try
+
+# Page extraction limits (what scrape_page hands to the LLM)
+EXTRACT_MAX_TEXT_CHARS = 8000  # Visible text kept per page
+EXTRACT_MAX_LINKS = 60  # Links listed per page
+EXTRACT_MAX_TABLE_ROWS = 40  # Rows kept per table
+
 # Logging configuration
 logging.basicConfig(
     level=logging.INFO,
@@ -0,0 +1,74 @@
+"""Append-only message history for the agent state."""
+import uuid
+from typing import List
+
+from langchain_core.messages import (
+    BaseMessage,
+    RemoveMessage,
+    convert_to_messages,
+    message_chunk_to_message,
+)
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+
+class MessageHistory(list):
+    """
+    List of messages plus an id -> position index.
+
+    `append_messages` grows it in place, so a step that adds one message
+    costs O(1) instead of copying and re-indexing the whole history.
+    """
+
+    def __init__(self, messages=()):
+        super().__init__(messages)
+        self.reindex()
+
+    def reindex(self):
+        self.index_by_id = {msg.id: i for i, msg in enumerate(self)}
+
+
+def _coerce(messages) -> List[BaseMessage]:
+    if not isinstance(messages, list):
+        messages = [messages]
+    coerced = [message_chunk_to_message(m) for m in convert_to_messages(messages)]
+    for msg in coerced:
+        if msg.id is None:
+            msg.id = str(uuid.uuid4())
+    return coerced
+
+
+def append_messages(left, right) -> MessageHistory:
+    """
+    State reducer with the semantics of `add_messages`, applied in place.
+
+    New ids are appended, known ids replace the stored message and
+    `RemoveMessage` deletes one (or all, with REMOVE_ALL_MESSAGES). Only
+    removals rebuild the list. Because the list is mutated, earlier state
+    snapshots share it: graphs compiled with a checkpointer must persist
+    with durability="sync".
+    """
+    if not isinstance(left, MessageHistory):
+        left = MessageHistory(_coerce(left))
+
+    index = left.index_by_id
+    removed = False
+    for msg in _coerce(right):
+        if isinstance(msg, RemoveMessage):
+            if msg.id == REMOVE_ALL_MESSAGES:
+                left.clear()
+                index.clear()
+                continue
+            if msg.id not in index:
+                raise ValueError(f"Attempting to delete a message with an ID that doesn't exist ('{msg.id}')")
+            left[index[msg.id]] = None
+            removed = True
+        elif msg.id in index:
+            left[index[msg.id]] = msg
+        else:
+            index[msg.id] = len(left)
+            left.append(msg)
+
+    if removed:
+        left[:] = [msg for msg in left if msg is not None]
+        left.reindex()
+    return left
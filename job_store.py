@@ -0,0 +1,428 @@
+"""Quiz chains, leases and LangGraph checkpoints in SQLite, shared by several processes."""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_serializable_checkpoint_metadata,
+)
+
+from config import JOB_STORE_PATH, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_QUEUE_SIZE, JOB_HISTORY
+from jobs import QUEUED, RUNNING, FAILED, CANCELLED, FINISHED, QueueFull
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    client TEXT NOT NULL,
+    status TEXT NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    slots INTEGER NOT NULL,
+    seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    parent_id TEXT,
+    type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata TEXT NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB NOT NULL,
+    task_path TEXT NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+_COLUMNS = "id, url, client, status, worker, attempts, created_at, started_at, finished_at, result, error"
+_FINISHED = tuple(sorted(FINISHED))
+
+
+def _record(row) -> dict:
+    keys = ("job_id", "url", "client", "status", "worker", "attempts",
+            "created_at", "started_at", "finished_at", "result", "error")
+    record = dict(zip(keys, row))
+    record["result"] = json.loads(record["result"]) if record["result"] else None
+    return record
+
+
+def _thread_range(job_id: str) -> Tuple[str, str]:
+    # Checkpoint threads of a job are "<job_id>:<run>"; ";" sorts right after ":"
+    return f"{job_id}:", f"{job_id};"
+
+
+class JobStore:
+    """
+    Queue of quiz chains that the API processes and worker processes share.
+
+    A process claims a chain only while it has a free worker, so chains
+    spread by free capacity; among waiting chains the submitter with the
+    fewest running ones goes first, then the oldest chain. A claimed chain
+    is leased to its process, which renews the lease with `heartbeat`.
+    When the lease runs out (the process died) the chain is claimed again,
+    up to `max_attempts` times, and resumes from its last checkpoint in
+    `checkpointer`. The file is in WAL mode: readers never wait for the
+    writer, and claims are serialized with BEGIN IMMEDIATE.
+    """
+
+    def __init__(self, path: Path = JOB_STORE_PATH, lease: float = JOB_LEASE_SECONDS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.path = Path(path)
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            self._db.executescript(_SCHEMA)
+        self.checkpointer = SqliteCheckpointer(self)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """The connection inside BEGIN IMMEDIATE ... COMMIT (rolled back on error)."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _query(self, sql: str, args: Sequence = ()) -> list:
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def submit(self, job_id: str, url: str, client: str = "", created_at: Optional[float] = None,
+               queue_size: int = JOB_QUEUE_SIZE) -> dict:
+        """Queue a chain; raises QueueFull when `queue_size` chains are already waiting."""
+        created_at = created_at or time.time()
+        with self.transaction() as db:
+            (waiting,) = db.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()
+            if waiting >= queue_size:
+                raise QueueFull(f"{waiting} jobs already waiting")
+            db.execute(
+                "INSERT INTO jobs (id, url, client, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, url, client or "", QUEUED, created_at),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        rows = self._query(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,))
+        return _record(rows[0]) if rows else None
+
+    def claim(self, worker: str) -> Optional[dict]:
+        """Lease the next chain to `worker`: a queued one, or one whose process stopped renewing its lease."""
+        now = time.time()
+        with self.transaction() as db:
+            self._expire(db, now)
+            row = db.execute(
+                "SELECT id FROM jobs AS j "
+                "WHERE status = :queued OR (status = :running AND lease_until < :now) "
+                "ORDER BY (SELECT COUNT(*) FROM jobs AS r WHERE r.client = j.client AND r.status = :running "
+                "          AND r.lease_until >= :now), created_at "
+                "LIMIT 1",
+                {"queued": QUEUED, "running": RUNNING, "now": now},
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1, "
+                "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (RUNNING, worker, now + self.lease, now, row[0]),
+            )
+        return self.get(row[0])
+
+    def _expire(self, db: sqlite3.Connection, now: float):
+        """Settle chains whose lease ran out but that must not run again."""
+        stale = db.execute(
+            "SELECT id, attempts, cancel_requested FROM jobs WHERE status = ? AND lease_until < ? "
+            "AND (attempts >= ? OR cancel_requested = 1)",
+            (RUNNING, now, self.max_attempts),
+        ).fetchall()
+        for job_id, attempts, cancel_requested in stale:
+            status, error = (CANCELLED, None) if cancel_requested else (FAILED, f"Worker lost {attempts} times")
+            db.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?, worker = NULL WHERE id = ?",
+                (status, error, now, job_id),
+            )
+            self._drop_checkpoints(db, job_id)
+            logger.warning(f"❌ Job {job_id} given up: {error or 'cancelled'}")
+
+    def heartbeat(self, worker: str, slots: int, job_ids: List[str]) -> Tuple[List[str], int]:
+        """
+        Renew the leases of `worker`'s running chains.
+
+        Returns the ids among them it must stop (cancellation requested, or
+        the chain now belongs to another process) and the number of live
+        processes sharing the store.
+        """
+        now = time.time()
+        with self.transaction() as db:
+            db.execute("INSERT OR REPLACE INTO workers (id, slots, seen) VALUES (?, ?, ?)", (worker, slots, now))
+            db.execute("DELETE FROM workers WHERE seen < ?", (now - self.lease,))
+            stop = []
+            for job_id in job_ids:
+                row = db.execute("SELECT status, worker, cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is None or row[0] != RUNNING or row[1] != worker or row[2]:
+                    stop.append(job_id)
+                    continue
+                db.execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (now + self.lease, job_id))
+            (live,) = db.execute("SELECT COUNT(*) FROM workers").fetchone()
+        return stop, live
+
+    def leave(self, worker: str):
+        """Unregister a process that shuts down."""
+        with self._lock:
+            self._db.execute("DELETE FROM workers WHERE id = ?", (worker,))
+
+    def finish(self, job_id: str, worker: str, status: str, result: Optional[dict] = None,
+               error: Optional[str] = None, history: int = JOB_HISTORY):
+        """Record how `worker`'s chain ended and drop its checkpoints; ignored if the chain is no longer its."""
+        now = time.time()
+        with self.transaction() as db:
+            updated = db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                (status, json.dumps(result) if result is not None else None, error, now, job_id, worker, RUNNING),
+            ).rowcount
+            if updated:
+                self._drop_checkpoints(db, job_id)
+                self._trim(db, history)
+        return bool(updated)
+
+    def release(self, job_id: str, worker: str):
+        """Hand a chain back to the queue (its process shuts down); the next claim resumes it."""
+        with self.transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, lease_until = NULL, attempts = MAX(attempts - 1, 0) "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                (QUEUED, job_id, worker, RUNNING),
+            )
+        logger.info(f"Job {job_id} handed back to the queue")
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        """Cancel a waiting chain, or ask the process running it to stop at its next heartbeat."""
+        now = time.time()
+        with self.transaction() as db:
+            db.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                       (CANCELLED, now, job_id, QUEUED))
+            db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING))
+        return self.get(job_id)
+
+    def _drop_checkpoints(self, db: sqlite3.Connection, job_id: str):
+        low, high = _thread_range(job_id)
+        for table in ("checkpoints", "writes"):
+            db.execute(f"DELETE FROM {table} WHERE thread_id >= ? AND thread_id < ?", (low, high))
+
+    def _trim(self, db: sqlite3.Connection, history: int):
+        placeholders = ", ".join("?" * len(_FINISHED))
+        db.execute(
+            f"DELETE FROM jobs WHERE status IN ({placeholders}) AND id NOT IN "
+            f"(SELECT id FROM jobs WHERE status IN ({placeholders}) ORDER BY finished_at DESC LIMIT ?)",
+            (*_FINISHED, *_FINISHED, history),
+        )
+
+    def stats(self) -> dict:
+        now = time.time()
+        counts = dict(self._query("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+        processes, slots = self._query(
+            "SELECT COUNT(*), COALESCE(SUM(slots), 0) FROM workers WHERE seen >= ?", (now - self.lease,)
+        )[0]
+        (resumed,) = self._query("SELECT COUNT(*) FROM jobs WHERE attempts > 1")[0]
+        (threads,) = self._query("SELECT COUNT(DISTINCT thread_id) FROM checkpoints")[0]
+        return {
+            "jobs": counts,
+            "waiting": counts.get(QUEUED, 0),
+            "processes": processes,
+            "workers": slots,
+            "resumed": resumed,
+            "checkpoint_threads": threads,
+        }
+
+
+class SqliteCheckpointer(BaseCheckpointSaver):
+    """
+    LangGraph checkpointer on the job store's SQLite file.
+
+    Only the latest checkpoint of a thread and its parent are kept: enough
+    to resume a chain whose process died, not to replay its history. A
+    thread's checkpoints go away with its job (see JobStore.finish).
+    """
+
+    def __init__(self, store: JobStore):
+        super().__init__()
+        self.store = store
+
+    def _tuple(self, row) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_id, type_, checkpoint, metadata = row
+        writes = self.store._query(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        )
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                     "checkpoint_id": checkpoint_id}},
+            checkpoint=self.serde.loads_typed((type_, checkpoint)),
+            metadata=json.loads(metadata),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, value))) for task_id, channel, t, value in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        configurable = config["configurable"]
+        args = [configurable["thread_id"], configurable.get("checkpoint_ns", "")]
+        sql = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata "
+               "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?")
+        if checkpoint_id := get_checkpoint_id(config):
+            sql += " AND checkpoint_id = ?"
+            args.append(checkpoint_id)
+        rows = self.store._query(sql + " ORDER BY checkpoint_id DESC LIMIT 1", args)
+        return self._tuple(rows[0]) if rows else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        where, args = [], []
+        if config:
+            where.append("thread_id = ?")
+            args.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                where.append("checkpoint_ns = ?")
+                args.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                args.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id < ?")
+            args.append(before_id)
+        for key, value in (filter or {}).items():
+            where.append("json_extract(metadata, ?) = ?")
+            args.extend([f"$.{key}", value])
+        sql = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata FROM checkpoints"
+               + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY checkpoint_id DESC")
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        for row in self.store._query(sql, args):
+            yield self._tuple(row)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        type_, data = self.serde.dumps_typed(checkpoint)
+        metadata = json.dumps(get_serializable_checkpoint_metadata(config, metadata), default=str)
+        keep = (checkpoint["id"], parent_id or checkpoint["id"])
+        with self.store.transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO checkpoints "
+                "(thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], parent_id, type_, data, metadata),
+            )
+            for table in ("checkpoints", "writes"):
+                db.execute(
+                    f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN (?, ?)",
+                    (thread_id, checkpoint_ns, *keep),
+                )
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                 "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        configurable = config["configurable"]
+        key = (configurable["thread_id"], configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"])
+        with self.store.transaction() as db:
+            for idx, (channel, value) in enumerate(writes):
+                idx = WRITES_IDX_MAP.get(channel, idx)
+                type_, data = self.serde.dumps_typed(value)
+                # Regular writes are kept from their first save; special ones (errors, interrupts) replaced
+                db.execute(
+                    f"INSERT OR {'IGNORE' if idx >= 0 else 'REPLACE'} INTO writes "
+                    "(thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (*key, task_id, idx, channel, type_, data, task_path),
+                )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.store.transaction() as db:
+            for table in ("checkpoints", "writes"):
+                db.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter=None, before=None, limit=None):
+        for item in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
@@ -0,0 +1,430 @@
+"""Bounded job queue and worker pool for quiz chains."""
+import asyncio
+import contextvars
+import inspect
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from config import (
+    AGENT_TIMEOUT,
+    JOB_WORKERS,
+    JOB_QUEUE_SIZE,
+    JOB_CANCEL_GRACE,
+    JOB_HISTORY,
+    JOB_KEEP_WORKDIRS,
+    JOB_HEARTBEAT_SECONDS,
+    JOB_POLL_INTERVAL,
+)
+from tools.context import JobContext, JobCancelled, current_job
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+FINISHED = {SUCCEEDED, FAILED, CANCELLED, TIMED_OUT}
+
+
+class QueueFull(Exception):
+    """Raised by `JobManager.submit` when no more chains can be queued."""
+
+
+class Job:
+    """One quiz chain and its lifecycle."""
+
+    def __init__(self, url: str, client: str = "", job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.url = url
+        self.client = client  # Submitter (the /solve email); the job store shares workers fairly among them
+        self.status = QUEUED
+        self.context = JobContext(self.id)
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.worker: Optional[str] = None
+
+    @classmethod
+    def from_record(cls, record: dict) -> "Job":
+        """A job as the shared job store returns it."""
+        job = cls(record["url"], record["client"], record["job_id"])
+        for key in ("status", "created_at", "started_at", "finished_at", "result", "error", "attempts", "worker"):
+            setattr(job, key, record[key])
+        return job
+
+    def finish(self, status: str, result: Optional[dict] = None, error: Optional[str] = None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "url": self.url,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+            "attempts": self.attempts,
+            "worker": self.worker,
+        }
+
+
+def summarize_result(result: Any) -> dict:
+    """Small JSON-friendly view of the final agent state."""
+    messages = result.get("messages", []) if isinstance(result, dict) else []
+    last = messages[-1] if messages else None
+    content = getattr(last, "content", "") if last is not None else ""
+    return {"steps": len(messages), "final_message": str(content)[:500]}
+
+
+class JobManager:
+    """
+    Runs quiz chains on a fixed number of workers fed by a bounded queue.
+
+    `submit` raises QueueFull instead of queueing without limit, each chain
+    gets its own JobContext (cancellation, child processes and a working
+    directory that is removed when the chain ends), and a chain that
+    exceeds `timeout` is cancelled rather than left running.
+
+    A coroutine `runner` runs as a task on the event loop; a plain function
+    runs on a thread pool of `workers` threads.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[str], Any],
+        workers: int = JOB_WORKERS,
+        queue_size: int = JOB_QUEUE_SIZE,
+        timeout: float = AGENT_TIMEOUT,
+    ):
+        self.runner = runner
+        self.is_async = inspect.iscoroutinefunction(runner)
+        self.workers = workers
+        self.timeout = timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._queue_size = queue_size
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._tasks = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        if not self.is_async:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="quiz-job")
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        mode = "async" if self.is_async else "threaded"
+        logger.info(f"✓ Job manager started ({self.workers} {mode} workers, queue size {self._queue_size})")
+
+    async def stop(self):
+        for job in self._jobs.values():
+            if job.status not in FINISHED:
+                job.context.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, url: str, client: str = "") -> Job:
+        job = Job(url, client)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull(f"{self._queue_size} jobs already waiting")
+        self._jobs[job.id] = job
+        self._trim_history()
+        logger.info(f"Queued job {job.id} for {url} ({self._queue.qsize()} waiting)")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        job.context.cancel()
+        if job.status == QUEUED:
+            job.finish(CANCELLED)
+        logger.info(f"Cancellation requested for job {job_id}")
+        return job
+
+    def stats(self) -> dict:
+        counts = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.workers, "waiting": self._queue.qsize() if self._queue else 0, "jobs": counts}
+
+    # Async variants for the API handlers; in memory nothing blocks the loop
+    async def asubmit(self, url: str, client: str = "") -> Job:
+        return self.submit(url, client)
+
+    async def aget(self, job_id: str) -> Optional[Job]:
+        return self.get(job_id)
+
+    async def acancel(self, job_id: str) -> Optional[Job]:
+        return self.cancel(job_id)
+
+    async def astats(self) -> dict:
+        return self.stats()
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED]
+        for job_id in finished[: max(0, len(finished) - JOB_HISTORY)]:
+            del self._jobs[job_id]
+
+    def _run_in_thread(self, job: Job):
+        current_job.set(job.context)
+        return self.runner(job.url)
+
+    async def _run_in_task(self, job: Job):
+        current_job.set(job.context)
+        return await self.runner(job.url)
+
+    def _launch(self, job: Job, loop: asyncio.AbstractEventLoop) -> asyncio.Future:
+        ctx = contextvars.copy_context()
+        if self.is_async:
+            return asyncio.create_task(self._run_in_task(job), context=ctx)
+        return loop.run_in_executor(self._executor, ctx.run, self._run_in_thread, job)
+
+    async def _worker(self, index: int):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status != QUEUED:
+                    continue
+                job.status = RUNNING
+                job.started_at = time.time()
+                job.attempts = 1
+                await self._await_job(job, self._launch(job, loop))
+            finally:
+                await asyncio.to_thread(job.context.close)
+                if not JOB_KEEP_WORKDIRS:
+                    await asyncio.to_thread(job.context.cleanup)
+                self._queue.task_done()
+
+    async def _await_job(self, job: Job, future: asyncio.Future):
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+            job.finish(SUCCEEDED, summarize_result(result))
+            logger.info(f"✅ Job {job.id} finished")
+        except asyncio.TimeoutError:
+            logger.error(f"❌ Job {job.id} exceeded {self.timeout}s - cancelling")
+            job.context.cancel()
+            job.finish(TIMED_OUT, error=f"Timed out after {self.timeout}s")
+            if isinstance(future, asyncio.Task):
+                future.cancel()
+            await self._wind_down(job, future)
+        except JobCancelled:
+            job.finish(CANCELLED)
+        except asyncio.CancelledError:
+            # Server shutdown: stop the chain before the worker goes away
+            job.context.cancel()
+            if isinstance(future, asyncio.Task):
+                future.cancel()
+            job.finish(CANCELLED, error="Server shutting down")
+            raise
+        except Exception as e:
+            job.finish(CANCELLED if job.context.cancelled else FAILED, error=str(e))
+
+    async def _wind_down(self, job: Job, future: asyncio.Future):
+        """Keep the worker slot busy until the cancelled chain has really stopped."""
+        done, _ = await asyncio.wait([future], timeout=JOB_CANCEL_GRACE)
+        if not done:
+            logger.warning(f"Job {job.id} still running {JOB_CANCEL_GRACE}s after cancellation")
+
+
+class StoreJobManager(JobManager):
+    """
+    JobManager whose queue is a JobStore shared with other processes.
+
+    The process runs `workers` chains and claims a queued one whenever a
+    worker is free (see JobStore for the order). Every `heartbeat` seconds
+    it renews the leases of its chains, stops those cancelled through any
+    process and gives `limiter` its share of the LLM budget. A chain whose
+    process died is resumed by another one from its last LangGraph
+    checkpoint; chains still running when this process stops are handed
+    back to the queue.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[str], Any],
+        store,
+        workers: int = JOB_WORKERS,
+        queue_size: int = JOB_QUEUE_SIZE,
+        timeout: float = AGENT_TIMEOUT,
+        heartbeat: float = JOB_HEARTBEAT_SECONDS,
+        limiter=None,
+    ):
+        super().__init__(runner, workers, queue_size, timeout)
+        self.store = store
+        self.heartbeat = heartbeat
+        self.limiter = limiter
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._running: Dict[str, Job] = {}
+        self._stopped = set()  # Chains cancelled, or now owned by another process: never handed back
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        if not self.is_async:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="quiz-job")
+        await asyncio.to_thread(self._beat)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+        mode = "async" if self.is_async else "threaded"
+        logger.info(f"✓ Job manager started ({self.workers} {mode} workers, job store {self.store.path}, "
+                    f"process {self.worker_id})")
+
+    async def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        for job in list(self._running.values()):
+            job.context.cancel()
+        workers = self._tasks[:-1]
+        if workers:
+            await asyncio.wait(workers, timeout=JOB_CANCEL_GRACE)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        await asyncio.to_thread(self.store.leave, self.worker_id)
+
+    def submit(self, url: str, client: str = "") -> Job:
+        job = Job(url, client)
+        self.store.submit(job.id, url, client, job.created_at, self._queue_size)
+        return self._queued(job)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        record = self.store.get(job_id)
+        return Job.from_record(record) if record else None
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        return self._cancelled(job_id, self.store.cancel(job_id))
+
+    def stats(self) -> dict:
+        return self._with_process(self.store.stats())
+
+    # The store is SQLite with a busy timeout: the async variants wait for it off the loop
+    async def asubmit(self, url: str, client: str = "") -> Job:
+        job = Job(url, client)
+        await asyncio.to_thread(self.store.submit, job.id, url, client, job.created_at, self._queue_size)
+        return self._queued(job)
+
+    async def aget(self, job_id: str) -> Optional[Job]:
+        record = await asyncio.to_thread(self.store.get, job_id)
+        return Job.from_record(record) if record else None
+
+    async def acancel(self, job_id: str) -> Optional[Job]:
+        return self._cancelled(job_id, await asyncio.to_thread(self.store.cancel, job_id))
+
+    async def astats(self) -> dict:
+        return self._with_process(await asyncio.to_thread(self.store.stats))
+
+    def _queued(self, job: Job) -> Job:
+        if self._wakeup:
+            self._wakeup.set()
+        logger.info(f"Queued job {job.id} for {job.url} in the job store")
+        return job
+
+    def _cancelled(self, job_id: str, record: Optional[dict]) -> Optional[Job]:
+        if record is None:
+            return None
+        job = self._running.get(job_id)
+        if job is not None:
+            self._stopped.add(job_id)
+            job.context.cancel()
+        logger.info(f"Cancellation requested for job {job_id}")
+        return Job.from_record(record)
+
+    def _with_process(self, stats: dict) -> dict:
+        stats.update(process=self.worker_id, process_workers=self.workers, process_running=len(self._running))
+        return stats
+
+    def _beat(self) -> List[str]:
+        stop, processes = self.store.heartbeat(self.worker_id, self.workers, list(self._running))
+        if self.limiter is not None:
+            self.limiter.share(1 / max(1, processes))
+        return stop
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            try:
+                stop = await asyncio.to_thread(self._beat)
+            except Exception as e:
+                logger.warning(f"Job store heartbeat failed: {e}")
+                continue
+            for job_id in stop:
+                job = self._running.get(job_id)
+                if job is not None and job_id not in self._stopped:
+                    logger.warning(f"Stopping job {job_id}: cancelled, or taken over by another process")
+                    self._stopped.add(job_id)
+                    job.context.cancel()
+
+    async def _claim(self) -> Optional[Job]:
+        record = await asyncio.to_thread(self.store.claim, self.worker_id)
+        if record is None:
+            return None
+        job = Job.from_record(record)
+        job.context.checkpointer = self.store.checkpointer
+        if job.attempts > 1:
+            logger.info(f"Resuming job {job.id} (attempt {job.attempts})")
+        return job
+
+    async def _idle(self):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    def _settle(self, job: Job, handed_back: bool) -> bool:
+        """Write the outcome to the store; False if the chain belongs to another process by now."""
+        if handed_back:
+            self.store.release(job.id, self.worker_id)
+            return True
+        return self.store.finish(job.id, self.worker_id, job.status, job.result, job.error)
+
+    async def _worker(self, index: int):
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            job = await self._claim()
+            if job is None:
+                await self._idle()
+                continue
+            self._running[job.id] = job
+            try:
+                await self._await_job(job, self._launch(job, loop))
+            finally:
+                del self._running[job.id]
+                # Stopped by the shutdown rather than by a cancellation: another process resumes it
+                handed_back = self._stopping and job.status == CANCELLED and job.id not in self._stopped
+                self._stopped.discard(job.id)
+                await asyncio.to_thread(job.context.close)
+                owned = await asyncio.to_thread(self._settle, job, handed_back)
+                # A chain handed back or taken over still needs its working directory
+                if owned and not handed_back and not JOB_KEEP_WORKDIRS:
+                    await asyncio.to_thread(job.context.cleanup)
@@ -0,0 +1,286 @@
+"""Cache of LLM responses keyed by the normalized prompt state."""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from langchain_core.messages import (
+    AIMessage,
+    convert_to_messages,
+    message_to_dict,
+    messages_from_dict,
+)
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from config import LLM_CACHE, LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MEMORY_MB, LLM_CACHE_DISK_MB
+from tools.context import current_job
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+"""
+
+
+class CacheMiss(LookupError):
+    """Replay mode found no recorded response for this prompt state."""
+
+
+def _text(content):
+    if isinstance(content, list) and all(
+        isinstance(part, str) or (isinstance(part, dict) and part.get("type") == "text") for part in content
+    ):
+        # Gemini returns text as a list of parts; the same reply as a string must hash alike
+        return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+    return content
+
+
+def normalize_messages(messages: Sequence) -> List[dict]:
+    """
+    The parts of a history that decide the model's reply, in a stable form.
+
+    Message ids, response metadata and usage are dropped, tool-call ids are
+    renumbered in order of appearance and the chain's workdir is replaced by
+    a placeholder, so a restarted chain reaching the same state hashes alike.
+    """
+    job = current_job.get()
+    workdirs = [str(job.workdir.resolve()), str(job.workdir)] if job else []
+    call_ids = {}
+
+    def call_id(raw):
+        return call_ids.setdefault(raw, f"call-{len(call_ids)}")
+
+    def scrub(content):
+        if isinstance(content, str):
+            for path in workdirs:
+                content = content.replace(path, "<workdir>")
+        return content
+
+    normalized = []
+    for msg in convert_to_messages(list(messages)):
+        entry = {"type": msg.type, "content": scrub(_text(msg.content))}
+        if getattr(msg, "tool_calls", None):
+            entry["tool_calls"] = [
+                {"name": call["name"], "args": call["args"], "id": call_id(call.get("id"))}
+                for call in msg.tool_calls
+            ]
+        if msg.type == "tool":
+            entry["tool_call_id"] = call_id(msg.tool_call_id)
+            entry["name"] = msg.name
+        normalized.append(entry)
+    return normalized
+
+
+def prompt_fingerprint(model: str, system_prompt: str, tools: Sequence) -> str:
+    """Hash of everything sent with every call: model, system prompt and tool schemas."""
+    payload = {
+        "model": model,
+        "system": system_prompt,
+        "tools": [convert_to_openai_tool(tool) for tool in tools],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def revive(data: dict) -> AIMessage:
+    """Rebuild a stored reply (message_to_dict form) with fresh message and tool-call ids."""
+    message = messages_from_dict([data])[0]
+    # Ids must stay unique within a history that may replay the same reply twice
+    message.id = str(uuid.uuid4())
+    for call in message.tool_calls:
+        call["id"] = f"call_{uuid.uuid4().hex[:12]}"
+    return message
+
+
+def cache_key(fingerprint: str, messages: Sequence) -> str:
+    history = json.dumps(normalize_messages(messages), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{fingerprint}\n{history}".encode()).hexdigest()
+
+
+class MemoryBackend:
+    """In-process LRU of serialized responses, bounded by their total size."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self.size = 0
+
+    def get(self, key: str, now: float) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, response = entry
+        if expires < now:
+            self.delete(key)
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    def put(self, key: str, response: str, expires: float) -> int:
+        """Store an entry; returns how many were evicted to make room."""
+        self.delete(key)
+        if len(response) > self.max_bytes:
+            return 0
+        self._entries[key] = (expires, response)
+        self.size += len(response)
+        evicted = 0
+        while self.size > self.max_bytes:
+            _, (_, old) = self._entries.popitem(last=False)
+            self.size -= len(old)
+            evicted += 1
+        return evicted
+
+    def delete(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """Responses on disk, so they survive restarts and can be replayed offline."""
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        # WAL and a busy timeout: worker processes sharing the job store share this file too
+        self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def get(self, key: str, now: float) -> Optional[tuple]:
+        """(response, expires) for a live entry."""
+        row = self._db.execute("SELECT response, expires FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+        self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        self._db.commit()
+        return row
+
+    def put(self, key: str, response: str, expires: float, now: float) -> int:
+        self._db.execute(
+            "INSERT OR REPLACE INTO responses (key, response, size, expires, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, response, len(response), expires, now),
+        )
+        evicted = self._db.execute("DELETE FROM responses WHERE expires < ?", (now,)).rowcount
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            rows = self._db.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+            for old, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM responses WHERE key = ?", (old,))
+                total -= size
+                evicted += 1
+        self._db.commit()
+        return evicted
+
+    def stats(self) -> dict:
+        count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"entries": count, "bytes": size}
+
+
+class LLMCache:
+    """
+    Responses of the chat model, keyed by a hash of the prompt state.
+
+    The key covers the model, system prompt, tool schemas and the
+    normalized message history, so a re-run or a restarted chain that
+    reaches the same state gets the same reply without calling the LLM
+    (the agent skips it once an answer was rejected, to get a new sample).
+    Lookups go through a memory LRU, then SQLite (if given). `mode` is
+    "1" (read and write), "0" (off) or "replay" (read only; a miss raises
+    CacheMiss so an offline run never silently reaches the network).
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = LLM_CACHE_PATH,
+        mode: str = LLM_CACHE,
+        ttl: float = LLM_CACHE_TTL,
+        memory_bytes: int = LLM_CACHE_MEMORY_MB * 1024 * 1024,
+        disk_bytes: int = LLM_CACHE_DISK_MB * 1024 * 1024,
+    ):
+        self.mode = mode
+        self.ttl = ttl
+        self.memory = MemoryBackend(memory_bytes)
+        self.disk = SQLiteBackend(path, disk_bytes) if path is not None and mode != "0" else None
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "memory_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "skipped": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "0"
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self.metrics[key] += value
+
+    def get(self, key: str) -> Optional[AIMessage]:
+        """The cached reply for `key`, with fresh message and tool-call ids."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            response = self.memory.get(key, now)
+            memory_hit = response is not None
+            if response is None and self.disk is not None:
+                row = self.disk.get(key, now)
+                if row is not None:
+                    response = row[0]
+                    self.memory.put(key, response, row[1])
+        if response is None:
+            self._count(misses=1)
+            if self.mode == "replay":
+                raise CacheMiss(f"No recorded LLM response for prompt state {key[:12]}")
+            return None
+        self._count(hits=1, memory_hits=1 if memory_hit else 0)
+        return revive(json.loads(response))
+
+    def put(self, key: str, message):
+        """Remember a reply; empty replies and replay runs are not stored."""
+        if self.mode != "1":
+            return
+        if not isinstance(message, AIMessage) or not (message.content or message.tool_calls):
+            self._count(skipped=1)
+            return
+        response = json.dumps(message_to_dict(message), default=str)
+        now = time.time()
+        expires = now + self.ttl
+        with self._lock:
+            evicted = self.memory.put(key, response, expires)
+            if self.disk is not None:
+                evicted += self.disk.put(key, response, expires, now)
+        self._count(stores=1, evictions=evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.metrics)
+            stats["memory_entries"] = len(self.memory)
+            stats["memory_bytes"] = self.memory.size
+            if self.disk is not None:
+                stats["disk"] = self.disk.stats()
+        stats["mode"] = self.mode
+        return stats
+
+
+llm_cache = LLMCache()
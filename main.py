@@ -4,12 +4,24 @@ import time
 import logging
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Request, BackgroundTasks, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from config import SECRET, AGENT_TIMEOUT
-from agent import run_agent
+from config import SECRET, JOB_STORE, JOB_PROCESSES
+from jobs import QueueFull
+from llm_cache import llm_cache
+from ratelimit import llm_limiter
+from services import job_manager, start_services, stop_services
+from solvers import solver_stats
+from tool_node import tool_stats
+from tools.http_client import get_http_stats
+from tools.interpreter import interpreter_pool, session_manager
+from tools.download_cache import download_cache
+from tools.prefetch import prefetcher
+from tools.scraper import get_tier_stats
+from tools.submissions import submission_log
+from tools.tracing import JOBS, render_metrics
 
 logger = logging.getLogger(__name__)
 START_TIME = time.time()
@@ -19,8 +31,12 @@ START_TIME = time.time()
 async def lifespan(app: FastAPI):
     """Lifecycle management for the app."""
     logger.info("🚀 Quiz Solver API starting up...")
+    await start_services()
+    await job_manager().start()
     yield
     logger.info("👋 Quiz Solver API shutting down...")
+    await job_manager().stop()
+    await stop_services()
 
 
 app = FastAPI(
@@ -40,35 +56,50 @@ app.add_middleware(
 )
 
 
+def _service_stats() -> dict:
+    """Stats of the process's caches and pools; the SQLite-backed ones block."""
+    return {
+        "scraper": get_tier_stats(),
+        "interpreters": interpreter_pool.stats(),
+        "sessions": session_manager.stats(),
+        "downloads": download_cache.stats(),
+        "prefetch": prefetcher.stats(),
+        "http": get_http_stats(),
+        "solvers": solver_stats(),
+        "tools": tool_stats(),
+        "llm_cache": llm_cache.stats(),
+        "submissions": submission_log.stats(),
+        "llm_limiter": llm_limiter.stats(),
+    }
+
+
 @app.get("/healthz")
 async def health_check():
     """Health check endpoint."""
     uptime = int(time.time() - START_TIME)
+    # Off the event loop, which the async chains share
+    services = await asyncio.to_thread(_service_stats)
     return {
         "status": "ok",
-        "uptime_seconds": uptime
+        "uptime_seconds": uptime,
+        **services,
+        "jobs": await job_manager().astats(),
     }
 
 
-async def run_agent_with_timeout(url: str):
-    """Run agent with timeout protection."""
-    try:
-        logger.info(f"Starting agent for URL: {url}")
-        await asyncio.wait_for(
-            asyncio.to_thread(run_agent, url),
-            timeout=AGENT_TIMEOUT
-        )
-        logger.info(f"✅ Agent completed successfully for {url}")
-    except asyncio.TimeoutError:
-        logger.error(f"❌ Agent timeout ({AGENT_TIMEOUT}s) exceeded for {url}")
-    except Exception as e:
-        logger.error(f"❌ Agent error: {e}", exc_info=True)
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: step durations, byte sizes, LLM tokens, submissions and jobs."""
+    stats = await job_manager().astats()
+    for status, count in stats["jobs"].items():
+        JOBS.set(count, status=status)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 @app.post("/solve")
-async def solve_quiz(request: Request, background_tasks: BackgroundTasks):
+async def solve_quiz(request: Request):
     """
-    Receive quiz task and start solving in background.
+    Receive quiz task and queue it for a background worker.
     
     Expected payload:
     {
@@ -97,14 +128,45 @@ async def solve_quiz(request: Request, background_tasks: BackgroundTasks):
         logger.warning(f"Invalid secret received from {data.get('email', 'unknown')}")
         raise HTTPException(status_code=403, detail="Invalid secret")
     
-    # Start background task
+    # Queue for a worker
     logger.info(f"✓ Secret verified, queuing quiz: {url}")
-    background_tasks.add_task(run_agent_with_timeout, url)
+    try:
+        job = await job_manager().asubmit(url, client=data.get("email") or "")
+    except QueueFull as e:
+        logger.warning(f"Rejecting quiz, queue full: {e}")
+        raise HTTPException(status_code=429, detail="Too many quizzes in progress, retry later")
+    
+    return JSONResponse(status_code=200, content={"status": "ok", "job_id": job.id})
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and result summary of a queued quiz chain."""
+    job = await job_manager().aget(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.to_dict()
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, request: Request):
+    """Stop a quiz chain and kill its child processes. Requires the secret."""
+    try:
+        data = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    if data.get("secret") != SECRET:
+        raise HTTPException(status_code=403, detail="Invalid secret")
     
-    return JSONResponse(status_code=200, content={"status": "ok"})
+    job = await job_manager().acancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.to_dict()
 
 
 if __name__ == "__main__":
     import uvicorn
-    logger.info("Starting server on http://0.0.0.0:7860")
-    uvicorn.run(app, host="0.0.0.0", port=7860)
+    logger.info(f"Starting server on http://0.0.0.0:7860 ({JOB_PROCESSES} process(es))")
+    if JOB_PROCESSES > 1 and not JOB_STORE:
+        raise SystemExit("JOB_PROCESSES > 1 needs the shared job store (JOB_STORE=1)")
+    uvicorn.run("main:app", host="0.0.0.0", port=7860, workers=JOB_PROCESSES)
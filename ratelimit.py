@@ -0,0 +1,173 @@
+"""Client-side token-bucket scheduler for LLM calls."""
+import heapq
+import itertools
+import logging
+import math
+import threading
+from typing import Optional
+
+from clock import default_clock
+from config import LLM_RATE_LIMIT, LLM_BURST, LLM_TOKENS_PER_MINUTE
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Refills at `rate` units per second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available (amount is capped at capacity)."""
+        missing = min(amount, self.capacity) - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budgets shared by all chains.
+
+    Callers queue by deadline (earliest first, no deadline last) and only
+    the head of the queue may take from the buckets, so a chain close to
+    its time limit is never starved by newer ones. Works from threads
+    (`acquire`) and coroutines (`aacquire`); pass a VirtualClock to test
+    without real sleeps.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float = LLM_RATE_LIMIT,
+        burst: int = LLM_BURST,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+        clock=default_clock,
+    ):
+        self.clock = clock
+        now = clock.now()
+        self._requests = TokenBucket(requests_per_second, burst, now)
+        self._tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute, now)
+        # Bucket, full rate and full capacity, for `share`
+        self._budgets = ((self._requests, requests_per_second, burst),
+                         (self._tokens, tokens_per_minute / 60, tokens_per_minute))
+        self._share = 1.0
+        self._queue = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._granted = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _enqueue(self, deadline: Optional[float]) -> list:
+        ticket = [deadline if deadline is not None else math.inf, next(self._seq), True]
+        with self._lock:
+            heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def _cancel(self, ticket: list):
+        with self._lock:
+            ticket[2] = False
+            while self._queue and not self._queue[0][2]:
+                heapq.heappop(self._queue)
+
+    def _try_take(self, ticket: list, tokens: int) -> Optional[float]:
+        """
+        Take from both buckets if `ticket` is at the head of the queue.
+
+        Returns 0 when granted, the seconds the head must wait otherwise,
+        or None when another caller is ahead.
+        """
+        with self._lock:
+            while self._queue and not self._queue[0][2]:
+                heapq.heappop(self._queue)
+            if self._queue[0] is not ticket:
+                return None
+
+            now = self.clock.now()
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            wait = max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+            if wait > 1e-6:  # ignore float dust left by refill arithmetic
+                return wait
+
+            self._requests.tokens -= 1
+            self._tokens.tokens -= tokens
+            ticket[2] = False
+            heapq.heappop(self._queue)
+            return 0.0
+
+    def _granted_after(self, started: float) -> float:
+        waited = self.clock.now() - started
+        with self._lock:
+            self._granted += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        return waited
+
+    def acquire(self, tokens: int = 0, deadline: Optional[float] = None) -> float:
+        """Block until a request of ~`tokens` may be sent; returns seconds waited."""
+        started = self.clock.now()
+        ticket = self._enqueue(deadline)
+        try:
+            while (wait := self._try_take(ticket, tokens)) != 0:
+                if wait is None:
+                    self.clock.pause()
+                else:
+                    self.clock.sleep(wait)
+        finally:
+            if ticket[2]:
+                self._cancel(ticket)
+        return self._granted_after(started)
+
+    async def aacquire(self, tokens: int = 0, deadline: Optional[float] = None) -> float:
+        """Async variant of `acquire`."""
+        started = self.clock.now()
+        ticket = self._enqueue(deadline)
+        try:
+            while (wait := self._try_take(ticket, tokens)) != 0:
+                if wait is None:
+                    await self.clock.apause()
+                else:
+                    await self.clock.asleep(wait)
+        finally:
+            if ticket[2]:
+                self._cancel(ticket)
+        return self._granted_after(started)
+
+    def record_usage(self, estimated: int, actual: int):
+        """Correct the token bucket once the real usage of a call is known."""
+        with self._lock:
+            self._tokens.tokens -= actual - estimated
+
+    def share(self, fraction: float):
+        """Keep to `fraction` of the budgets; the rest belongs to other processes using the same API key."""
+        with self._lock:
+            if fraction == self._share:
+                return
+            now = self.clock.now()
+            for bucket, rate, capacity in self._budgets:
+                bucket.refill(now)
+                bucket.rate = rate * fraction
+                bucket.capacity = max(1.0, capacity * fraction)
+                bucket.tokens = min(bucket.tokens, bucket.capacity)
+            self._share = fraction
+        logger.info(f"LLM rate limits now at {fraction:.0%} of the budget")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "share": round(self._share, 3),
+                "granted": self._granted,
+                "queued": sum(1 for t in self._queue if t[2]),
+                "avg_wait_seconds": round(self._total_wait / self._granted, 3) if self._granted else 0.0,
+                "max_wait_seconds": round(self._max_wait, 3),
+            }
+
+
+llm_limiter = RateLimiter()
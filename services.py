@@ -0,0 +1,55 @@
+"""Process-wide services shared by the API (main.py) and worker.py: warm pools and the job manager."""
+import asyncio
+import logging
+from typing import Optional
+
+from config import AGENT_ASYNC, JOB_STORE
+from agent import run_agent, run_agent_async
+from job_store import JobStore
+from jobs import JobManager, StoreJobManager
+from ratelimit import llm_limiter
+from tools.browser import browser_pool, async_browser_pool
+from tools.http_client import aclose_async_client, close_client
+from tools.interpreter import interpreter_pool, session_manager
+from tools.prefetch import prefetcher
+
+logger = logging.getLogger(__name__)
+
+_job_manager: Optional[JobManager] = None
+
+
+def job_manager() -> JobManager:
+    """
+    The process's job manager, built on first use: uvicorn imports main
+    once more per worker process, so nothing is opened at import time.
+    """
+    global _job_manager
+    if _job_manager is None:
+        runner = run_agent_async if AGENT_ASYNC else run_agent
+        _job_manager = StoreJobManager(runner, JobStore(), limiter=llm_limiter) if JOB_STORE else JobManager(runner)
+    return _job_manager
+
+
+async def start_services():
+    """Warm the browser and interpreter pools chains share."""
+    try:
+        if AGENT_ASYNC:
+            await async_browser_pool.start()
+        else:
+            await asyncio.to_thread(browser_pool.start)
+    except Exception as e:
+        logger.warning(f"Browser pool unavailable, scraping will launch per call: {e}")
+    if interpreter_pool.available:
+        await asyncio.to_thread(interpreter_pool.start)
+
+
+async def stop_services():
+    if AGENT_ASYNC:
+        await async_browser_pool.stop()
+    else:
+        await asyncio.to_thread(browser_pool.stop)
+    await asyncio.to_thread(interpreter_pool.stop)
+    await asyncio.to_thread(session_manager.close_all)
+    prefetcher.shutdown()
+    await aclose_async_client()
+    await asyncio.to_thread(close_client)
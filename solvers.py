@@ -0,0 +1,419 @@
+"""Deterministic solvers that answer recognised question templates without the LLM."""
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import operator
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urljoin, urlsplit
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import ToolMessage
+
+from config import EMAIL, SECRET, SOLVERS_ENABLED
+from tools import download_file, send_post
+from tools.context import current_job, resolve_in_workdir
+from tools.extractor import parse_page
+from tools.scraper import fetch_page, afetch_page
+from tools.submissions import submission_log
+from tools.tracing import current_span, span
+
+logger = logging.getLogger(__name__)
+
+_NUMBER = r"-?\d[\d,]*(?:\.\d+)?"
+_QUOTE = "\"'“”‘’"
+_SUBMIT_URL = re.compile(r"\b(?:post|submit|send)\b[^\n]{0,120}?(https?://[^\s\"'<>]+|\s/[\w./-]+)", re.IGNORECASE)
+_PAYLOAD_URL = re.compile(r"\"url\"\s*:\s*\"([^\"]+)\"")
+
+
+def _number(text: str) -> float:
+    return float(text.replace(",", ""))
+
+
+def _plain(value) -> Any:
+    """JSON-friendly answer: numpy scalars unwrapped, integral floats as int."""
+    value = value.item() if hasattr(value, "item") else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+@dataclass
+class Question:
+    """A quiz page as the solvers see it."""
+
+    url: str
+    text: str
+    links: List[tuple] = field(default_factory=list)
+    forms: List[dict] = field(default_factory=list)
+    tables: List[list] = field(default_factory=list)
+
+    @classmethod
+    def from_page(cls, url: str, content: str) -> "Question":
+        page = parse_page(content, url)
+        return cls(url, page["text"], page["links"], page["forms"], page["tables"])
+
+    def submit_url(self) -> Optional[str]:
+        """Endpoint the answer goes to: named in the text, else a POST form."""
+        match = _SUBMIT_URL.search(self.text)
+        if match:
+            return urljoin(self.url, match[1].strip().rstrip(".,;:)"))
+        for form in self.forms:
+            if form["method"] == "POST" and form["action"]:
+                return form["action"]
+        return None
+
+    def payload_url(self) -> str:
+        """The "url" the page asks for in its example payload, else the page URL."""
+        match = _PAYLOAD_URL.search(self.text)
+        return urljoin(self.url, match[1]) if match else self.url
+
+    @cached_property
+    def data(self):
+        """The question's data as a DataFrame: a linked CSV, else the first table on the page."""
+        try:
+            import pandas as pd
+        except ImportError:
+            logger.info("pandas is not installed, data solvers are disabled")
+            return None
+
+        for href, _ in self.links:
+            name = os.path.basename(urlsplit(href).path)
+            if not name.lower().endswith(".csv"):
+                continue
+            if download_file.invoke({"url": href, "filename": name}) != name:
+                return None
+            path = resolve_in_workdir(name)
+            frame = pd.read_csv(path)
+            if all(_is_number(str(column)) for column in frame.columns):
+                # No header row: the first line is data
+                frame = pd.read_csv(path, header=None)
+            return frame
+
+        if not self.tables or len(self.tables[0]) < 2:
+            return None
+        header, *rows = self.tables[0]
+        frame = pd.DataFrame([row[:len(header)] for row in rows], columns=[" ".join(h.split()) for h in header])
+        for column in frame.columns:
+            numbers = pd.to_numeric(frame[column].str.replace(",", "", regex=False), errors="coerce")
+            if numbers.notna().all():
+                frame[column] = numbers
+        return frame
+
+    def column(self, name: str):
+        """Column of `data` matching `name` (case-insensitive), or None."""
+        frame = self.data
+        if frame is None:
+            return None
+        wanted = " ".join(name.split()).lower()
+        for column in frame.columns:
+            if str(column).strip().lower() == wanted:
+                return frame[column]
+        return None
+
+
+def _is_number(text: str) -> bool:
+    try:
+        _number(text)
+        return True
+    except ValueError:
+        return False
+
+
+# --- Registry ---------------------------------------------------------------
+
+@dataclass
+class Solver:
+    name: str
+    pattern: re.Pattern
+    solve: Callable[[Question, re.Match], Any]
+
+
+SOLVERS: List[Solver] = []
+REPLAY = "replay"  # Stats name of answers replayed from the submission log
+
+
+def solver(name: str, pattern: str):
+    """
+    Register `fn(question, match)` for pages whose text matches `pattern`.
+
+    The function returns the answer, or None when the page only looked like
+    its template; the next matching solver (and finally the agent) gets it.
+    """
+    def register(fn):
+        SOLVERS.append(Solver(name, re.compile(pattern, re.IGNORECASE), fn))
+        return fn
+    return register
+
+
+_lock = threading.Lock()
+_per_solver: Dict[str, Counter] = defaultdict(Counter)
+_totals = Counter()
+
+
+def _count(solver_name: Optional[str] = None, **deltas):
+    with _lock:
+        target = _per_solver[solver_name] if solver_name else _totals
+        target.update(deltas)
+
+
+def solve(question: Question) -> Optional[tuple]:
+    """(solver name, answer) from the first registered solver that answers, else None."""
+    for entry in SOLVERS:
+        match = entry.pattern.search(question.text)
+        if not match:
+            continue
+        try:
+            answer = entry.solve(question, match)
+        except Exception as e:
+            logger.warning(f"Solver {entry.name} failed on {question.url}: {e}")
+            _count(entry.name, errors=1)
+            continue
+        if answer is not None:
+            _count(entry.name, matched=1)
+            return entry.name, answer
+    return None
+
+
+# --- Built-in solvers -------------------------------------------------------
+
+_OPERATORS = {"+": operator.add, "-": operator.sub, "*": operator.mul, "x": operator.mul, "×": operator.mul, "/": operator.truediv}
+
+
+@solver("arithmetic", rf"\bwhat is ({_NUMBER})\s*([-+*/×x])\s*({_NUMBER})\s*\?")
+def _arithmetic(question: Question, match: re.Match):
+    a, op, b = _number(match[1]), match[2].lower(), _number(match[3])
+    if op == "/" and b == 0:
+        return None
+    return _plain(_OPERATORS[op](a, b))
+
+
+@solver("base64", r"\bdecode\b[^\n]*\bbase64\b|\bbase64\b[^\n]*\bdecode")
+def _base64(question: Question, match: re.Match):
+    for candidate in re.findall(r"[A-Za-z0-9+/]{8,}={0,2}", question.text[match.start():]):
+        try:
+            decoded = base64.b64decode(candidate, validate=True).decode("utf-8")
+        except (binascii.Error, UnicodeDecodeError):
+            continue
+        if decoded.strip() and decoded.isprintable():
+            return decoded.strip()
+    return None
+
+
+@solver(
+    "column_sum",
+    rf"\bsum of (?:the )?(?:values in )?(?:the )?[{_QUOTE}]?(?P<column>[\w ]+?)[{_QUOTE}]? column"
+    rf"(?:,? for rows where [{_QUOTE}]?(?P<where>[\w ]+?)[{_QUOTE}]? (?:is|=|equals) "
+    rf"[{_QUOTE}]?(?P<value>[^{_QUOTE}?\n]+?)[{_QUOTE}]?)?\s*[?.]",
+)
+def _column_sum(question: Question, match: re.Match):
+    values = question.column(match["column"])
+    if values is None:
+        return None
+    import pandas as pd
+    if match["where"]:
+        keys = question.column(match["where"])
+        if keys is None:
+            return None
+        values = values[keys.astype(str).str.strip() == match["value"].strip()]
+    return _plain(pd.to_numeric(values, errors="raise").sum())
+
+
+_COMPARISONS = {
+    "above": operator.gt, "over": operator.gt, "greater than": operator.gt, "more than": operator.gt,
+    "below": operator.lt, "under": operator.lt, "less than": operator.lt,
+    "at least": operator.ge, "at most": operator.le, "equal to": operator.eq, "exactly": operator.eq,
+}
+
+
+@solver(
+    "count_rows",
+    rf"\bcount\b[\w ]*?\b(?:where|whose|with) (?:the |a )?[{_QUOTE}]?(?P<column>[\w ]+?)[{_QUOTE}]? "
+    rf"(?:is |are |value is )?(?P<op>{'|'.join(_COMPARISONS)}) (?P<value>{_NUMBER})",
+)
+def _count_rows(question: Question, match: re.Match):
+    values = question.column(match["column"])
+    if values is None:
+        return None
+    import pandas as pd
+    numbers = pd.to_numeric(values.astype(str).str.replace(",", "", regex=False), errors="raise")
+    return _plain(_COMPARISONS[match["op"].lower()](numbers, _number(match["value"])).sum())
+
+
+# --- Fast path --------------------------------------------------------------
+
+def _prepare(url: str, content: str) -> Optional[tuple]:
+    """(solver name, answer, submit URL, payload) for a page a solver can answer."""
+    question = Question.from_page(url, content)
+    submit = question.submit_url()
+    if submit is None:
+        return None
+    known = submission_log.correct_answer(submit, question.payload_url())
+    # An answer the server already accepted (e.g. before a restart) needs no solving
+    solved = (REPLAY, known[0]) if known else solve(question)
+    if solved is None:
+        return None
+    name, answer = solved
+    payload = {"email": EMAIL, "secret": SECRET, "url": question.payload_url(), "answer": answer}
+    return name, answer, submit, payload
+
+
+def _handoff(url: str, answer: Any = None) -> str:
+    """First message for the agent taking over at `url`."""
+    if answer is None:
+        return url
+    return f"{url}\n\nNote: the answer {answer!r} was already submitted for this question and was wrong."
+
+
+def _settle(url: str, prepared: Optional[tuple], response: Optional[dict], started: float) -> tuple:
+    """Record one fast-path step; returns (next URL or None, agent handoff or None)."""
+    _count(questions=1)
+    if prepared is None:
+        _count(fallbacks=1)
+        return None, _handoff(url)
+    name, answer, _, _ = prepared
+    current_span().set(solver=name)
+    seconds = time.perf_counter() - started
+    _count(fast_seconds=seconds, fast_submissions=1)
+    if response.get("correct"):
+        _count(name, correct=1)
+        _count(solved=1)
+        logger.info(f"✓ Solver {name} answered {url} in {seconds:.2f}s without the LLM")
+        return response.get("url"), None
+    if "error" not in response and response.get("url"):
+        # send_post's retry policy kept the next URL: no time left for another attempt
+        return response["url"], None
+    _count(name, rejected=1)
+    _count(fallbacks=1)
+    logger.info(f"❌ Solver {name} answer {answer!r} rejected for {url}, handing over to the agent")
+    return None, _handoff(url, answer)
+
+
+def fast_path(url: str) -> Optional[str]:
+    """
+    Answer questions with the registered solvers for as long as they can.
+
+    Returns the first message for the agent, i.e. the URL of the question
+    it must take over (noting a rejected answer), or None when the solvers
+    finished the chain themselves.
+    """
+    if not SOLVERS_ENABLED:
+        return url
+    job = current_job.get()
+    seen = set()
+    while url and url not in seen:
+        seen.add(url)
+        if job:
+            job.raise_if_cancelled()
+        started = time.perf_counter()
+        with span("solver", url=url):
+            try:
+                prepared = _prepare(url, fetch_page(url))
+            except Exception as e:
+                logger.warning(f"Solvers skipped {url}: {e}")
+                prepared = None
+            response = send_post.invoke({"url": prepared[2], "payload": prepared[3]}) if prepared else None
+            url, handoff = _settle(url, prepared, response, started)
+        if handoff:
+            return handoff
+    return url
+
+
+async def afast_path(url: str) -> Optional[str]:
+    """Async `fast_path`; solving (which may download and parse data) runs in a thread."""
+    if not SOLVERS_ENABLED:
+        return url
+    job = current_job.get()
+    seen = set()
+    while url and url not in seen:
+        seen.add(url)
+        if job:
+            job.raise_if_cancelled()
+        started = time.perf_counter()
+        with span("solver", url=url):
+            try:
+                prepared = await asyncio.to_thread(_prepare, url, await afetch_page(url))
+            except Exception as e:
+                logger.warning(f"Solvers skipped {url}: {e}")
+                prepared = None
+            response = await send_post.ainvoke({"url": prepared[2], "payload": prepared[3]}) if prepared else None
+            url, handoff = _settle(url, prepared, response, started)
+        if handoff:
+            return handoff
+    return url
+
+
+def handback_url(messages: List) -> Optional[str]:
+    """
+    Next question URL when the agent's latest tool step moved the chain on.
+
+    send_post only keeps "url" in its result when the answer was accepted
+    (or too little time is left to retry), so the solvers can try the next
+    question before the agent spends LLM calls on it.
+    """
+    if not SOLVERS_ENABLED:
+        return None
+    for msg in reversed(messages):
+        if not isinstance(msg, ToolMessage):
+            break
+        if msg.name != send_post.name:
+            continue
+        try:
+            data = json.loads(msg.content)
+        except (TypeError, ValueError):
+            return None
+        return data.get("url") if isinstance(data, dict) else None
+    return None
+
+
+class SubmissionCounter(BaseCallbackHandler):
+    """Counts the agent's send_post calls, to compare its time per answer with the solvers'."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.count = 0
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        if (serialized or {}).get("name") == send_post.name:
+            self.count += 1
+
+
+def record_agent(seconds: float, submissions: int):
+    """Account for a chain (or its remainder) solved by the agent."""
+    _count(agent_seconds=seconds, agent_submissions=submissions)
+
+
+def solver_stats() -> dict:
+    """Per-solver hit rates and the latency the fast path saved."""
+    with _lock:
+        per_solver = {name: dict(_per_solver[name]) for name in [REPLAY] + [entry.name for entry in SOLVERS]}
+        totals = dict(_totals)
+    questions = totals.get("questions", 0)
+    for counts in per_solver.values():
+        for key in ("matched", "correct", "rejected", "errors"):
+            counts.setdefault(key, 0)
+        counts["hit_rate"] = round(counts["correct"] / questions, 3) if questions else 0.0
+
+    fast = totals.get("fast_seconds", 0) / totals["fast_submissions"] if totals.get("fast_submissions") else None
+    agent = totals.get("agent_seconds", 0) / totals["agent_submissions"] if totals.get("agent_submissions") else None
+    saved = totals.get("solved", 0) * (agent - fast) if fast is not None and agent is not None else None
+    return {
+        "enabled": SOLVERS_ENABLED,
+        "questions": questions,
+        "solved": totals.get("solved", 0),
+        "fallbacks": totals.get("fallbacks", 0),
+        "hit_rate": round(totals.get("solved", 0) / questions, 3) if questions else 0.0,
+        "solvers": per_solver,
+        "fast_seconds_per_answer": round(fast, 3) if fast is not None else None,
+        "agent_seconds_per_answer": round(agent, 3) if agent is not None else None,
+        "estimated_seconds_saved": round(saved, 1) if saved is not None else None,
+    }
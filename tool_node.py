@@ -0,0 +1,308 @@
+"""Tool execution for one agent turn: parallel calls, shared results, per-tool limits."""
+import asyncio
+import json
+import logging
+import threading
+import time
+import weakref
+from collections import Counter, OrderedDict
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import get_executor_for_config
+from pydantic import ValidationError
+
+from config import TOOL_MEMO_TOOLS, TOOL_MEMO_TTL, TOOL_MEMO_SIZE, TOOL_CONCURRENCY
+from tools.context import current_job, resolve_in_workdir
+from tools.deadline import question_deadline
+from tools.tracing import TOOLS_SAVED, span
+
+logger = logging.getLogger(__name__)
+
+NEVER_SHARED = ("send_post",)  # Every submission must reach the quiz server
+
+_lock = threading.Lock()
+_stats = Counter()
+
+
+def _file_stamp(args: dict) -> Optional[tuple]:
+    """Size and mtime of a downloaded file: a memoized download is stale once the file changed."""
+    try:
+        stat = resolve_in_workdir(str(args["filename"])).stat()
+    except (KeyError, ValueError, OSError):
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+# Per tool: what must still hold for an earlier result to stand in for a new call
+STAMPS = {"download_file": _file_stamp}
+
+
+def _reuse_scrape(args: dict):
+    # A reused scrape still counts as the question's first look at the page
+    question_deadline().scraped(str(args.get("url", "")))
+
+
+# Per tool: side effects a reused result must still have
+ON_REUSE = {"scrape_page": _reuse_scrape}
+
+
+@dataclass
+class _Result:
+    content: object
+    status: str
+    seconds: float
+    stamp: Optional[tuple] = None
+    stored: float = 0.0
+
+
+class ToolMemo:
+    """A chain's recent results of idempotent tools, keyed by tool name and arguments."""
+
+    def __init__(self, ttl: float = TOOL_MEMO_TTL, size: int = TOOL_MEMO_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self._entries: "OrderedDict[str, _Result]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, name: str, args: dict) -> Optional[_Result]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.stored > self.ttl:
+                del self._entries[key]
+                return None
+        stamp = STAMPS.get(name)
+        if stamp is not None and stamp(args) != entry.stamp:
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+        return entry
+
+    def put(self, key: str, name: str, args: dict, result: _Result):
+        stamp = STAMPS.get(name)
+        result.stamp = stamp(args) if stamp is not None else None
+        result.stored = time.monotonic()
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+_memos: Dict[Optional[str], ToolMemo] = {}
+
+
+def _memo() -> ToolMemo:
+    """The running chain's memo (dropped when its job closes)."""
+    job = current_job.get()
+    key = job.job_id if job else None
+    with _lock:
+        memo = _memos.get(key)
+        if memo is None:
+            memo = _memos[key] = ToolMemo()
+            if job:
+                job.on_close(lambda: _memos.pop(key, None))
+    return memo
+
+
+def _call_key(call: dict) -> Optional[str]:
+    """Identity of a call whose result another identical call may share; None if it must run."""
+    name, args = call["name"], call.get("args") or {}
+    if name in NEVER_SHARED or (name == "run_code" and (args.get("session") or args.get("reset"))):
+        return None
+    return f"{name}:{json.dumps(args, sort_keys=True, default=str)}"
+
+
+def _failed(message: ToolMessage) -> bool:
+    content = message.content
+    return message.status == "error" or (
+        isinstance(content, str) and content.lstrip().startswith(("Error", "Installation failed"))
+    )
+
+
+def _count(**deltas):
+    with _lock:
+        _stats.update(deltas)
+
+
+def tool_stats() -> dict:
+    """Calls run, results reused and the seconds that saved."""
+    with _lock:
+        stats = dict(_stats)
+    for key in ("saved_memo_s", "saved_duplicate_s", "saved_parallel_s"):
+        stats[key] = round(stats.get(key, 0.0), 3)
+    return stats
+
+
+class _Turn:
+    """The tool calls of one AIMessage: which run, which share a result, and the bookkeeping."""
+
+    def __init__(self, calls: List[dict]):
+        self.calls = calls
+        self.memo = _memo()
+        self.pending: List[dict] = []
+        self.reused: Dict[str, _Result] = {}
+        self.shares: Dict[str, str] = {}  # call id -> id of the identical call that runs
+        first: Dict[str, str] = {}
+        for call in calls:
+            key = _call_key(call)
+            if key is not None and call["name"] in TOOL_MEMO_TOOLS:
+                hit = self.memo.get(key, call["name"], call.get("args") or {})
+                if hit is not None:
+                    self.reused[call["id"]] = hit
+                    continue
+            if key is not None and key in first:
+                self.shares[call["id"]] = first[key]
+                continue
+            if key is not None:
+                first[key] = call["id"]
+            self.pending.append(call)
+
+    def finish(self, outputs: List[tuple], wall: float, current) -> List[ToolMessage]:
+        """ToolMessages in call order; records what running in parallel and reuse saved."""
+        ran = {call["id"]: output for call, output in zip(self.pending, outputs)}
+        saved = Counter()
+        for call in self.pending:
+            message, seconds = ran[call["id"]]
+            key = _call_key(call)
+            if key is not None and call["name"] in TOOL_MEMO_TOOLS and not _failed(message):
+                self.memo.put(key, call["name"], call.get("args") or {},
+                              _Result(message.content, message.status, seconds))
+
+        messages = []
+        for call in self.calls:
+            if call["id"] in ran:
+                messages.append(ran[call["id"]][0])
+                continue
+            if call["id"] in self.reused:
+                entry = self.reused[call["id"]]
+                content, status = entry.content, entry.status
+                saved["memo"] += entry.seconds
+                ON_REUSE.get(call["name"], lambda args: None)(call.get("args") or {})
+            else:
+                message, seconds = ran[self.shares[call["id"]]]
+                content, status = message.content, message.status
+                saved["duplicate"] += seconds
+            messages.append(ToolMessage(content=content, name=call["name"], tool_call_id=call["id"], status=status))
+
+        busy = sum(seconds for _, seconds in outputs)
+        if len(outputs) > 1 and busy > wall:
+            saved["parallel"] += busy - wall
+        reused = len(self.reused) + len(self.shares)
+        for reason, seconds in saved.items():
+            TOOLS_SAVED.inc(seconds, reason=reason)
+        _count(calls=len(self.calls), ran=len(self.pending), memo_hits=len(self.reused),
+               duplicates=len(self.shares), **{f"saved_{reason}_s": seconds for reason, seconds in saved.items()})
+        current.set(ran=len(self.pending), reused=reused, saved_s=round(sum(saved.values()), 3))
+        if reused or saved:
+            logger.info(
+                f"Tools: ran {len(self.pending)} of {len(self.calls)} call(s), reused {reused}, "
+                f"saved ~{sum(saved.values()):.1f}s"
+            )
+        return messages
+
+
+# Per tool, shared by every turn of every chain in the process (asyncio ones per event loop)
+_thread_limits: Dict[str, threading.Semaphore] = {}
+_loop_limits: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _thread_limit(name: str) -> threading.Semaphore:
+    with _lock:
+        limit = _thread_limits.get(name)
+        if limit is None:
+            limit = _thread_limits[name] = threading.Semaphore(TOOL_CONCURRENCY.get(name, 4))
+    return limit
+
+
+def _loop_limit(name: str) -> asyncio.Semaphore:
+    limits = _loop_limits.setdefault(asyncio.get_running_loop(), {})
+    limit = limits.get(name)
+    if limit is None:
+        limit = limits[name] = asyncio.Semaphore(TOOL_CONCURRENCY.get(name, 4))
+    return limit
+
+
+def _invalid(call: dict, text: str) -> ToolMessage:
+    return ToolMessage(content=text, name=call["name"], tool_call_id=call["id"], status="error")
+
+
+class ToolCalls:
+    """
+    Graph node running the tool calls of the agent's last message.
+
+    Calls run in parallel (threads, or tasks under ainvoke) with at most
+    TOOL_CONCURRENCY[name] calls of one tool at a time across all chains of
+    the process (per event loop under ainvoke). Identical calls in
+    one turn run once and share the result; a chain also reuses results of
+    TOOL_MEMO_TOOLS for TOOL_MEMO_TTL seconds. send_post always runs.
+    """
+
+    def __init__(self, tools: list):
+        self.tools = {tool.name: tool for tool in tools}
+
+    def _calls(self, state) -> List[dict]:
+        return list(getattr(state["messages"][-1], "tool_calls", None) or [])
+
+    def _unknown(self, call: dict) -> ToolMessage:
+        return _invalid(call, f"Error: {call['name']} is not a valid tool, try one of [{', '.join(self.tools)}].")
+
+    def _invoke(self, call: dict, config: RunnableConfig) -> tuple:
+        tool = self.tools.get(call["name"])
+        if tool is None:
+            return self._unknown(call), 0.0
+        start = time.perf_counter()
+        try:
+            message = tool.invoke({**call, "type": "tool_call"}, config)
+        except ValidationError as e:
+            message = _invalid(call, f"Error invoking tool '{call['name']}' with kwargs {call.get('args')}: {e}")
+        return message, time.perf_counter() - start
+
+    async def _ainvoke(self, call: dict, config: RunnableConfig) -> tuple:
+        tool = self.tools.get(call["name"])
+        if tool is None:
+            return self._unknown(call), 0.0
+        start = time.perf_counter()
+        try:
+            message = await tool.ainvoke({**call, "type": "tool_call"}, config)
+        except ValidationError as e:
+            message = _invalid(call, f"Error invoking tool '{call['name']}' with kwargs {call.get('args')}: {e}")
+        return message, time.perf_counter() - start
+
+    def invoke(self, state, config: RunnableConfig):
+        calls = self._calls(state)
+        with span("tools", calls=len(calls)) as current:
+            turn = _Turn(calls)
+
+            def run(call):
+                # An unknown tool only produces an error message: nothing to limit
+                with _thread_limit(call["name"]) if call["name"] in self.tools else nullcontext():
+                    return self._invoke(call, config)
+
+            start = time.perf_counter()
+            if len(turn.pending) == 1:
+                outputs = [run(turn.pending[0])]
+            else:
+                with get_executor_for_config(config) as executor:
+                    outputs = list(executor.map(run, turn.pending))
+            return {"messages": turn.finish(outputs, time.perf_counter() - start, current)}
+
+    async def ainvoke(self, state, config: RunnableConfig):
+        calls = self._calls(state)
+        with span("tools", calls=len(calls)) as current:
+            turn = _Turn(calls)
+
+            async def run(call):
+                async with _loop_limit(call["name"]) if call["name"] in self.tools else nullcontext():
+                    return await self._ainvoke(call, config)
+
+            start = time.perf_counter()
+            outputs = await asyncio.gather(*(run(call) for call in turn.pending))
+            return {"messages": turn.finish(list(outputs), time.perf_counter() - start, current)}
@@ -0,0 +1,351 @@
+"""Persistent Playwright browser pool shared by the scraping tools."""
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+from playwright.async_api import async_playwright
+from playwright.sync_api import sync_playwright, Error as PlaywrightError
+
+from config import (
+    BROWSER_POOL_SIZE,
+    BROWSER_MAX_PAGES,
+    BROWSER_MEMORY_CEILING_MB,
+    BROWSER_LEASE_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+_HEAP_JS = "() => (performance.memory ? performance.memory.usedJSHeapSize : 0)"
+
+
+class _BrowserSlot:
+    """One Chromium instance with a single reusable context and page."""
+
+    def __init__(self, playwright, max_pages: int, memory_ceiling_mb: int):
+        self.playwright = playwright
+        self.max_pages = max_pages
+        self.memory_ceiling = memory_ceiling_mb * 1024 * 1024
+        self.browser = None
+        self.context = None
+        self.page = None
+        self.uses = 0
+        self.recycles = 0
+        self.restarts = 0
+
+    def launch(self):
+        self.browser = self.playwright.chromium.launch(headless=True)
+        self._new_context()
+
+    def _new_context(self):
+        self.context = self.browser.new_context()
+        self.page = self.context.new_page()
+        self.uses = 0
+
+    def recycle(self):
+        """Drop the current context (cookies, cache, heap) and open a fresh one."""
+        try:
+            if self.context is not None:
+                self.context.close()
+        except PlaywrightError:
+            pass
+        self.recycles += 1
+        if self.browser is not None and self.browser.is_connected():
+            self._new_context()
+
+    def lease(self):
+        """Return a healthy page, restarting or recycling as needed."""
+        if self.browser is None or not self.browser.is_connected():
+            logger.warning("Pooled browser disconnected - relaunching")
+            self.close()
+            self.restarts += 1
+            self.launch()
+        elif self.page is None or self.page.is_closed() or self.uses >= self.max_pages:
+            self.recycle()
+        self.uses += 1
+        return self.page
+
+    def release(self, failed: bool = False):
+        """Reset the page after use and recycle it if it grew too large."""
+        if failed or self.page is None:
+            try:
+                self.recycle()
+            except PlaywrightError:
+                pass
+            return
+        try:
+            heap = self.page.evaluate(_HEAP_JS) or 0
+            if heap > self.memory_ceiling:
+                logger.info(f"Recycling browser context (JS heap {heap // (1024 * 1024)} MB)")
+                self.recycle()
+                return
+            self.page.goto("about:blank")
+        except PlaywrightError:
+            self.recycle()
+
+    def close(self):
+        try:
+            if self.browser is not None:
+                self.browser.close()
+        except PlaywrightError:
+            pass
+        self.browser = self.context = self.page = None
+
+
+class BrowserPool:
+    """
+    Fixed set of warm Chromium instances for scraping.
+
+    Playwright's sync API is bound to the thread that started it, so each
+    worker thread owns one browser and callers hand work over through a
+    queue. A page is reused across calls and its context is recycled after
+    `max_pages` loads or when its JS heap passes the memory ceiling.
+    """
+
+    def __init__(
+        self,
+        size: int = BROWSER_POOL_SIZE,
+        max_pages: int = BROWSER_MAX_PAGES,
+        memory_ceiling_mb: int = BROWSER_MEMORY_CEILING_MB,
+    ):
+        self.size = size
+        self.max_pages = max_pages
+        self.memory_ceiling_mb = memory_ceiling_mb
+        self._jobs: "queue.Queue" = queue.Queue()
+        self._threads = []
+        self._slots = []
+        self._lock = threading.Lock()
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self, timeout: float = 60):
+        """Launch all browsers; raises if none of them could be started."""
+        with self._lock:
+            if self._running:
+                return
+            self._jobs = queue.Queue()
+            errors = []
+            for index in range(self.size):
+                ready = threading.Event()
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(ready, errors),
+                    name=f"browser-pool-{index}",
+                    daemon=True,
+                )
+                thread.start()
+                ready.wait(timeout)
+                self._threads.append(thread)
+
+            if not self._slots:
+                for _ in self._threads:
+                    self._jobs.put(None)
+                self._threads = []
+                raise RuntimeError(f"Browser pool failed to start: {errors[0] if errors else 'timeout'}")
+
+            self._running = True
+            logger.info(f"✓ Browser pool started with {len(self._slots)} browser(s)")
+
+    def stop(self, timeout: float = 30):
+        """Close every browser and join the worker threads."""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            for _ in self._threads:
+                self._jobs.put(None)
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+            logger.info("Browser pool stopped")
+
+    def run(self, fn: Callable[[Any], Any], timeout: Optional[float] = BROWSER_LEASE_TIMEOUT):
+        """Run `fn(page)` on a pooled page and return its result."""
+        if not self._running:
+            raise RuntimeError("Browser pool is not running")
+        future: Future = Future()
+        self._jobs.put((fn, future))
+        return future.result(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "browsers": len(self._slots),
+            "pending": self._jobs.qsize(),
+            "recycles": sum(s.recycles for s in self._slots),
+            "restarts": sum(s.restarts for s in self._slots),
+        }
+
+    def _worker(self, ready: threading.Event, errors: list):
+        try:
+            with sync_playwright() as p:
+                slot = _BrowserSlot(p, self.max_pages, self.memory_ceiling_mb)
+                try:
+                    slot.launch()
+                except Exception as e:
+                    errors.append(e)
+                    logger.error(f"Browser launch failed: {e}")
+                    ready.set()
+                    return
+
+                self._slots.append(slot)
+                ready.set()
+                try:
+                    self._serve(slot)
+                finally:
+                    self._slots.remove(slot)
+                    slot.close()
+        except Exception as e:
+            errors.append(e)
+            logger.error(f"Browser worker crashed: {e}")
+            ready.set()
+
+    def _serve(self, slot: _BrowserSlot):
+        while True:
+            item = self._jobs.get()
+            if item is None:
+                return
+            fn, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            failed = False
+            try:
+                future.set_result(fn(slot.lease()))
+            except BaseException as e:
+                failed = True
+                future.set_exception(e)
+            finally:
+                slot.release(failed)
+
+
+class AsyncBrowserPool:
+    """
+    Warm Chromium for the async agent path.
+
+    One browser on the event loop with `size` reusable contexts; a call
+    leases a context's page from a queue, so at most `size` pages load at
+    once. Recycling rules match BrowserPool.
+    """
+
+    def __init__(
+        self,
+        size: int = BROWSER_POOL_SIZE,
+        max_pages: int = BROWSER_MAX_PAGES,
+        memory_ceiling_mb: int = BROWSER_MEMORY_CEILING_MB,
+    ):
+        self.size = size
+        self.max_pages = max_pages
+        self.memory_ceiling = memory_ceiling_mb * 1024 * 1024
+        self._playwright = None
+        self._browser = None
+        self._slots: Optional[asyncio.Queue] = None
+        self._launch_lock: Optional[asyncio.Lock] = None
+        self.recycles = 0
+        self.restarts = 0
+
+    @property
+    def running(self) -> bool:
+        return self._browser is not None
+
+    async def start(self):
+        if self.running:
+            return
+        self._playwright = await async_playwright().start()
+        try:
+            self._browser = await self._playwright.chromium.launch(headless=True)
+        except Exception:
+            await self._playwright.stop()
+            self._playwright = None
+            raise
+        self._launch_lock = asyncio.Lock()
+        self._slots = asyncio.Queue()
+        for _ in range(self.size):
+            self._slots.put_nowait({"page": None, "uses": 0})
+        logger.info(f"✓ Async browser pool started ({self.size} contexts)")
+
+    async def stop(self):
+        if not self.running:
+            return
+        browser, self._browser = self._browser, None
+        try:
+            await browser.close()
+        except PlaywrightError:
+            pass
+        await self._playwright.stop()
+        self._playwright = None
+        logger.info("Async browser pool stopped")
+
+    async def _ensure_browser(self):
+        async with self._launch_lock:
+            if not self._browser.is_connected():
+                logger.warning("Pooled browser disconnected - relaunching")
+                self.restarts += 1
+                self._browser = await self._playwright.chromium.launch(headless=True)
+
+    async def _recycle(self, slot: dict):
+        page = slot["page"]
+        slot["page"], slot["uses"] = None, 0
+        if page is not None:
+            self.recycles += 1
+            try:
+                await page.context.close()
+            except PlaywrightError:
+                pass
+
+    async def _lease(self, slot: dict):
+        await self._ensure_browser()
+        page = slot["page"]
+        if page is None or page.is_closed() or slot["uses"] >= self.max_pages:
+            await self._recycle(slot)
+            context = await self._browser.new_context()
+            slot["page"] = await context.new_page()
+        slot["uses"] += 1
+        return slot["page"]
+
+    async def _release(self, slot: dict, failed: bool):
+        if failed or slot["page"] is None:
+            await self._recycle(slot)
+            return
+        try:
+            heap = await slot["page"].evaluate(_HEAP_JS) or 0
+            if heap > self.memory_ceiling:
+                logger.info(f"Recycling browser context (JS heap {heap // (1024 * 1024)} MB)")
+                await self._recycle(slot)
+                return
+            await slot["page"].goto("about:blank")
+        except PlaywrightError:
+            await self._recycle(slot)
+
+    async def run(self, fn: Callable[[Any], Any], timeout: Optional[float] = BROWSER_LEASE_TIMEOUT):
+        """Await `fn(page)` on a pooled page and return its result."""
+        if not self.running:
+            raise RuntimeError("Async browser pool is not running")
+        slot = await asyncio.wait_for(self._slots.get(), timeout)
+        failed = False
+        try:
+            return await fn(await self._lease(slot))
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            try:
+                await self._release(slot, failed)
+            finally:
+                self._slots.put_nowait(slot)
+
+    def stats(self) -> dict:
+        return {
+            "browsers": 1 if self.running else 0,
+            "idle_contexts": self._slots.qsize() if self._slots else 0,
+            "recycles": self.recycles,
+            "restarts": self.restarts,
+        }
+
+
+browser_pool = BrowserPool()
+async_browser_pool = AsyncBrowserPool()
@@ -0,0 +1,114 @@
+"""Per-job execution context shared by the agent loop and the tools."""
+import logging
+import shutil
+import threading
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+from config import TEMP_DIR
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = TEMP_DIR / "jobs"
+
+
+class JobCancelled(Exception):
+    """Raised inside a chain once its job has been cancelled."""
+
+
+class JobContext:
+    """
+    Cancellation state, child processes and working directory of one quiz chain.
+
+    The context travels with the chain through `current_job`, a ContextVar
+    that asyncio.to_thread and LangChain's tool executors copy into their
+    worker threads. Chains run from the shared job store also carry a
+    LangGraph `checkpointer`, so another process can resume them.
+    """
+
+    def __init__(self, job_id: str, checkpointer=None):
+        self.job_id = job_id
+        self.workdir = JOBS_DIR / job_id
+        self.checkpointer = checkpointer
+        self._cancelled = threading.Event()
+        self._processes = set()
+        self._closers = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def raise_if_cancelled(self):
+        if self._cancelled.is_set():
+            raise JobCancelled(f"Job {self.job_id} was cancelled")
+
+    def cancel(self):
+        """Stop the chain at its next step and kill its child processes."""
+        self._cancelled.set()
+        with self._lock:
+            processes = list(self._processes)
+        for proc in processes:
+            _kill(proc)
+        if processes:
+            logger.info(f"Killed {len(processes)} child process(es) of job {self.job_id}")
+
+    def track(self, proc):
+        """Register a child process (subprocess.Popen or asyncio Process)."""
+        with self._lock:
+            self._processes.add(proc)
+        if self._cancelled.is_set():
+            _kill(proc)
+
+    def untrack(self, proc):
+        with self._lock:
+            self._processes.discard(proc)
+
+    def on_close(self, callback):
+        """Run `callback` when the chain ends (e.g. to stop a run_code session)."""
+        with self._lock:
+            self._closers.append(callback)
+
+    def close(self):
+        """Release what the chain's tools kept alive past their call."""
+        with self._lock:
+            closers, self._closers = self._closers, []
+        for callback in closers:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Cleanup of job {self.job_id} failed: {e}")
+
+    def cleanup(self):
+        """Delete the working directory (downloads, scripts, saved pages)."""
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def _kill(proc):
+    try:
+        proc.kill()
+    except OSError:
+        pass
+
+
+current_job: ContextVar[Optional[JobContext]] = ContextVar("current_job", default=None)
+
+
+def workdir() -> Path:
+    """Working directory of the running chain (TEMP_DIR outside of a job)."""
+    job = current_job.get()
+    if job is None:
+        return TEMP_DIR
+    job.workdir.mkdir(parents=True, exist_ok=True)
+    return job.workdir
+
+
+def resolve_in_workdir(name: str) -> Path:
+    """Path for a tool-supplied file name; refuses names that escape the workdir."""
+    base = workdir().resolve()
+    path = (base / name).resolve()
+    if not path.is_relative_to(base) or path == base:
+        raise ValueError(f"'{name}' is outside the working directory")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
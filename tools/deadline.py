@@ -0,0 +1,125 @@
+"""Per-question time budget of a quiz chain."""
+import logging
+import threading
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from clock import default_clock
+from config import (
+    QUESTION_TIME_LIMIT,
+    DEADLINE_HURRY_SECONDS,
+    DEADLINE_FINAL_SECONDS,
+    DEADLINE_SUBMIT_RESERVE,
+    DEADLINE_MIN_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+NORMAL, HURRY, FINAL, EXPIRED = "normal", "hurry", "final", "expired"
+
+
+class Deadline:
+    """
+    Time left on the chain's current question.
+
+    A question's clock starts at its first scrape and is re-anchored to the
+    `delay` the quiz server reports with every verdict, since the server's
+    count is the one that decides. Tools size their timeouts with
+    `timeout`; the agent picks cheaper strategies by `phase`. Pass a
+    VirtualClock to test without waiting.
+    """
+
+    def __init__(self, limit: float = QUESTION_TIME_LIMIT, clock=default_clock):
+        self.limit = limit
+        self.clock = clock
+        self.question: Optional[str] = None
+        self.started: Optional[float] = None
+        self.best: Optional[tuple] = None  # (submit URL, payload) of the last rejected answer
+        self.forced = False  # the best-known answer was already resubmitted on the agent's behalf
+        self._lock = threading.Lock()
+
+    def begin(self, url: str):
+        """Move on to the question at `url`; its clock starts when it is first scraped."""
+        with self._lock:
+            if url == self.question:
+                return
+            self.question = url
+            self.started = None
+            self.best = None
+            self.forced = False
+
+    def scraped(self, url: str):
+        with self._lock:
+            if self.question is None:
+                self.question = url
+            if url == self.question and self.started is None:
+                self.started = self.clock.now()
+
+    def submitted(self, url: str, payload: Dict[str, Any], correct: bool, delay: Optional[float]):
+        """Remember a rejected answer and take the server's elapsed time as authoritative."""
+        with self._lock:
+            if delay is not None:
+                self.started = self.clock.now() - delay
+            self.best = None if correct else (url, payload)
+
+    @property
+    def retrying(self) -> bool:
+        """An answer to the current question was rejected: the agent is after a different one."""
+        return self.best is not None
+
+    def elapsed(self) -> Optional[float]:
+        """Seconds spent on the current question (None before its first scrape)."""
+        started = self.started
+        return None if started is None else self.clock.now() - started
+
+    def remaining(self) -> Optional[float]:
+        elapsed = self.elapsed()
+        return None if elapsed is None else self.limit - elapsed
+
+    def expires(self) -> Optional[float]:
+        """Clock time at which the current question runs out."""
+        started = self.started
+        return None if started is None else started + self.limit
+
+    def phase(self) -> str:
+        """NORMAL, HURRY (cheaper model, no verification), FINAL (submit now) or EXPIRED."""
+        remaining = self.remaining()
+        if remaining is None or remaining > DEADLINE_HURRY_SECONDS:
+            return NORMAL
+        if remaining > DEADLINE_FINAL_SECONDS:
+            return HURRY
+        return FINAL if remaining > 0 else EXPIRED
+
+    def worth_retrying(self) -> bool:
+        """Whether another attempt at a wrongly answered question can still land in time."""
+        return self.phase() in (NORMAL, HURRY)
+
+    def timeout(self, default: float) -> float:
+        """`default`, cut to what is left of the question minus time to submit the answer."""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return max(DEADLINE_MIN_TIMEOUT, min(default, remaining - DEADLINE_SUBMIT_RESERVE))
+
+    def take_best(self) -> Optional[tuple]:
+        """The best-known answer, once per question, for resubmitting when time is up."""
+        with self._lock:
+            if self.best is None or self.forced:
+                return None
+            self.forced = True
+        logger.warning(f"Out of time on {self.question}, resubmitting the best-known answer to move on")
+        return self.best
+
+
+current_deadline: ContextVar[Optional[Deadline]] = ContextVar("current_deadline", default=None)
+
+
+def question_deadline() -> Deadline:
+    """Deadline of the running chain (a detached one outside of a chain)."""
+    return current_deadline.get() or Deadline()
+
+
+def tool_timeout(default: float) -> float:
+    """Timeout for a tool step: `default`, or less when the question is running out."""
+    deadline = current_deadline.get()
+    return default if deadline is None else deadline.timeout(default)
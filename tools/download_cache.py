@@ -0,0 +1,277 @@
+"""Content-addressed cache behind download_file."""
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from config import TEMP_DIR, DOWNLOAD_CACHE_MAX_MB, DOWNLOAD_MIN_CHUNK, DOWNLOAD_MAX_CHUNK
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = TEMP_DIR / "cache"
+
+FICLONE = 0x40049409  # Linux ioctl: share the source's extents copy-on-write (btrfs, XFS, overlayfs on them)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+
+def chunk_size(content_length: Optional[int]) -> int:
+    """Read size for a response: ~1/16 of the body, within the configured bounds."""
+    if not content_length:
+        return DOWNLOAD_MIN_CHUNK * 4
+    return max(DOWNLOAD_MIN_CHUNK, min(DOWNLOAD_MAX_CHUNK, content_length // 16))
+
+
+def copy_blob(source: Path, dest: Path):
+    """
+    Give `dest` its own copy of `source`, replacing `dest`.
+
+    A reflink where the filesystem supports it (no data is copied until one
+    side is written to), a plain copy otherwise. Either way writes to `dest`
+    never reach the cached blob.
+    """
+    dest.unlink(missing_ok=True)
+    with open(source, "rb") as src, open(dest, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return
+        except OSError:
+            pass
+    shutil.copyfile(source, dest)
+
+
+class PendingBlob:
+    """
+    A body being streamed into the cache; hashes while writing.
+
+    Segmented downloads `allocate` the full size and `write_at` offsets from
+    several threads instead; the hash is then computed once on `finish`.
+    """
+
+    def __init__(self, directory: Path):
+        self.path = directory / f".part-{uuid.uuid4().hex}"
+        self._file = open(self.path, "wb")
+        self._hash = hashlib.sha256()
+        self._in_order = True
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    def allocate(self, size: int):
+        self._file.truncate(size)
+        self._in_order = False
+        self.size = size
+
+    def write_at(self, offset: int, chunk: bytes):
+        # pwrite doesn't move the shared file position, so segments can write concurrently
+        os.pwrite(self._file.fileno(), chunk, offset)
+
+    def reset(self):
+        """Throw away what was written, to start the body over."""
+        self._file.seek(0)
+        self._file.truncate()
+        self._hash = hashlib.sha256()
+        self._in_order = True
+        self.size = 0
+
+    def finish(self) -> str:
+        self._file.close()
+        if not self._in_order:
+            with open(self.path, "rb") as f:
+                while block := f.read(DOWNLOAD_MAX_CHUNK):
+                    self._hash.update(block)
+        return self._hash.hexdigest()
+
+    def discard(self):
+        self._file.close()
+        self.path.unlink(missing_ok=True)
+
+
+class DownloadCache:
+    """
+    Downloads stored once per payload and revalidated with conditional GETs.
+
+    Entries are keyed by URL and remember the response's ETag and
+    Last-Modified. Bodies live under blobs/<sha256>, so identical payloads
+    from different URLs share one file, private to the cache; callers get
+    their own copy (see copy_blob). The least recently used entries are evicted once
+    the blobs exceed `max_bytes`.
+    """
+
+    def __init__(self, directory: Path = CACHE_DIR, max_bytes: int = DOWNLOAD_CACHE_MAX_MB * 1024 * 1024):
+        self.directory = Path(directory)
+        self.blob_dir = self.directory / "blobs"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.blob_dir.chmod(0o700)
+        self.max_bytes = max_bytes
+        # Shared by the worker processes of the job store: same settings as job_store.py
+        self._db = sqlite3.connect(self.directory / "index.sqlite3", check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self.metrics = {
+            "hits": 0,
+            "misses": 0,
+            "revalidations": 0,
+            "deduplicated": 0,
+            "bytes_downloaded": 0,
+            "bytes_saved": 0,
+            "bytes_deduplicated": 0,
+            "evictions": 0,
+            "transfer_seconds": 0.0,
+        }
+
+    def _blob(self, sha256: str) -> Path:
+        return self.blob_dir / sha256
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self.metrics[key] += value
+
+    def lookup(self, url: str) -> Optional[dict]:
+        """Cached entry for `url` whose blob is still intact, else None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT e.sha256, e.size, e.etag, e.last_modified, b.mtime_ns FROM entries e "
+                "JOIN blobs b ON b.sha256 = e.sha256 WHERE e.url = ?",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        sha256, size, etag, last_modified, mtime_ns = row
+        try:
+            stat = self._blob(sha256).stat()
+        except FileNotFoundError:
+            stat = None
+        if stat is None or stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+            # Written to behind the cache's back: the blob can't be trusted
+            logger.warning(f"Cached copy of {url} changed on disk, dropping it")
+            self._drop_blob(sha256)
+            return None
+        return {"sha256": sha256, "size": size, "etag": etag, "last_modified": last_modified}
+
+    def revalidation_headers(self, entry: Optional[dict]) -> dict:
+        """Conditional-GET headers for a cached entry ({} means fetch unconditionally)."""
+        if not entry:
+            return {}
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        if headers:
+            self._count(revalidations=1)
+        return headers
+
+    def begin(self) -> PendingBlob:
+        return PendingBlob(self.blob_dir)
+
+    def serve(self, url: str, entry: dict, dest: Path):
+        """Answer from the cache (after a 304 Not Modified, or a fresh prefetch)."""
+        copy_blob(self._blob(entry["sha256"]), dest)
+        with self._lock:
+            self._db.execute("UPDATE entries SET last_used = ? WHERE url = ?", (time.time(), url))
+            self._db.commit()
+        self._count(hits=1, bytes_saved=entry["size"])
+        logger.info(f"✓ Cache hit for {url} ({entry['size']} bytes not downloaded)")
+
+    def store(self, url: str, pending: PendingBlob, headers, dest: Optional[Path], seconds: float = 0.0):
+        """File a finished download under its hash and copy it to `dest` (if given)."""
+        sha256 = pending.finish()
+        blob = self._blob(sha256)
+        with self._lock:
+            known = self._db.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+            if known and blob.exists():
+                pending.discard()
+                deduplicated = pending.size
+            else:
+                os.replace(pending.path, blob)
+                os.chmod(blob, 0o444)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO blobs (sha256, size, mtime_ns) VALUES (?, ?, ?)",
+                    (sha256, pending.size, blob.stat().st_mtime_ns),
+                )
+                deduplicated = 0
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (url, sha256, size, etag, last_modified, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, sha256, pending.size, headers.get("ETag"), headers.get("Last-Modified"), time.time()),
+            )
+            self._db.commit()
+        if dest is not None:
+            copy_blob(blob, dest)
+        self._count(
+            misses=1,
+            deduplicated=1 if deduplicated else 0,
+            bytes_downloaded=pending.size,
+            bytes_deduplicated=deduplicated,
+            transfer_seconds=seconds,
+        )
+        self.evict()
+
+    def _drop_blob(self, sha256: str):
+        with self._lock:
+            self._db.execute("DELETE FROM entries WHERE sha256 = ?", (sha256,))
+            self._db.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+            self._db.commit()
+        self._blob(sha256).unlink(missing_ok=True)
+
+    def evict(self):
+        """Drop least recently used entries until the blobs fit in `max_bytes`."""
+        with self._lock:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            # A blob's recency is that of its most recently used URL
+            candidates = self._db.execute(
+                "SELECT b.sha256, b.size FROM blobs b LEFT JOIN entries e ON e.sha256 = b.sha256 "
+                "GROUP BY b.sha256 ORDER BY COALESCE(MAX(e.last_used), 0)"
+            ).fetchall()
+        for sha256, size in candidates:
+            if total <= self.max_bytes:
+                break
+            self._drop_blob(sha256)
+            total -= size
+            self._count(evictions=1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.metrics)
+            blobs, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+            stats["urls"] = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        stats["blobs"] = blobs
+        stats["cached_mb"] = round(size / 1024 / 1024, 2)
+        requests = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / requests, 3) if requests else 0.0
+        seconds = stats.pop("transfer_seconds")
+        stats["throughput_mb_s"] = round(stats["bytes_downloaded"] / seconds / 1024 / 1024, 1) if seconds else 0.0
+        return stats
+
+
+download_cache = DownloadCache()
@@ -1,45 +1,147 @@
 """File downloader tool."""
+import asyncio
 import logging
+import time
 from pathlib import Path
-import requests
+import httpx
 from langchain_core.tools import tool
-from config import TEMP_DIR
+from . import http_client, transfer
+from .context import resolve_in_workdir, workdir
+from .deadline import tool_timeout
+from .download_cache import download_cache
+from .prefetch import prefetcher
+from .tracing import current_span, traced
 
 logger = logging.getLogger(__name__)
 
 
+def _saved(filename: str, filepath: Path, extract: bool) -> str:
+    """Tool result: the file name, plus what was unpacked from it when asked to."""
+    if not extract:
+        return filename
+    produced = transfer.extract(filepath)
+    if not produced:
+        return filename
+    base = workdir().resolve()
+    names = [str(path.relative_to(base)) for path in produced]
+    listing = ", ".join(names[:50]) + (f" ... ({len(names)} files)" if len(names) > 50 else "")
+    logger.info(f"✓ Extracted {len(names)} file(s) from {filename}")
+    return f"{filename} (extracted: {listing})"
+
+
+def _serve(url: str, entry: dict, filepath: Path, source: str):
+    """Copy the cached body of `url` to `filepath`."""
+    download_cache.serve(url, entry, filepath)
+    current_span().set(bytes=entry["size"], source=source)
+
+
+def _prefetched(url: str, filepath: Path) -> tuple:
+    """(cache entry for `url`, whether a prefetch just fetched it and it is already at `filepath`)."""
+    entry = download_cache.lookup(url)
+    if entry and prefetcher.use_file(url):
+        _serve(url, entry, filepath, "prefetch")
+        return entry, True
+    return entry, False
+
+
+def _unchanged(entry: dict, response: httpx.Response) -> bool:
+    """Whether the server confirmed the cached copy is current; raises on error statuses."""
+    if entry and response.status_code == 304:
+        return True
+    response.raise_for_status()
+    return False
+
+
+def _stored(url: str, response: httpx.Response, pending, filepath: Path, parts: int, start: float):
+    """Cache a body fetched from the network and copy it to `filepath`."""
+    seconds = time.perf_counter() - start
+    download_cache.store(url, pending, response.headers, filepath, seconds)
+    current_span().set(bytes=pending.size, source="network", parts=parts, transfer_seconds=round(seconds, 4))
+    logger.info(f"✓ Downloaded to {filepath} ({transfer.describe_rate(pending.size, seconds, parts)})")
+
+
+def _failed(e: Exception) -> str:
+    if isinstance(e, httpx.HTTPError):
+        logger.error(f"Download failed: {e}")
+        return f"Error downloading file: {str(e)}"
+    logger.error(f"Unexpected error: {e}")
+    return f"Error: {str(e)}"
+
+
 @tool
-def download_file(url: str, filename: str) -> str:
+@traced("download_file")
+def download_file(url: str, filename: str, extract: bool = False) -> str:
     """
-    Download a file from a URL and save it to the temp directory.
+    Download a file from a URL and save it to the chain's working directory.
+    
+    Files are kept in a shared cache: a URL fetched before is revalidated
+    with a conditional request and not downloaded again if unchanged, and
+    files linked from a scraped page are usually prefetched already.
+    Large files are fetched in parallel segments when the server supports it.
     
     Args:
         url: Direct URL to the file
         filename: Name to save the file as
+        extract: Unpack a .zip/.tar(.gz) archive into a folder next to it,
+            or decompress a .gz file, and list the files produced
         
     Returns:
-        The full path to the saved file
+        The saved file name (and extracted files when extract=True)
     """
     logger.info(f"Downloading {filename} from {url}")
     
     try:
-        response = requests.get(url, stream=True, timeout=30)
-        response.raise_for_status()
-        
-        filepath = TEMP_DIR / filename
-        
-        with open(filepath, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        
-        logger.info(f"✓ Downloaded to {filepath}")
-        return filename
+        filepath = resolve_in_workdir(filename)
+        prefetcher.wait(url)
+        entry, served = _prefetched(url, filepath)
+        if not served:
+            headers = download_cache.revalidation_headers(entry)
+            start = time.perf_counter()
+            with http_client.stream("GET", url, timeout=tool_timeout(30), headers=headers) as response:
+                if _unchanged(entry, response):
+                    _serve(url, entry, filepath, "revalidated")
+                else:
+                    pending = download_cache.begin()
+                    try:
+                        parts = transfer.download(url, response, pending)
+                    except BaseException:
+                        pending.discard()
+                        raise
+                    _stored(url, response, pending, filepath, parts, start)
+        return _saved(filename, filepath, extract)
         
-    except requests.RequestException as e:
-        logger.error(f"Download failed: {e}")
-        return f"Error downloading file: {str(e)}"
+    except Exception as e:
+        return _failed(e)
+
+
+@traced("download_file")
+async def _adownload_file(url: str, filename: str, extract: bool = False) -> str:
+    """Async variant of download_file."""
+    logger.info(f"Downloading {filename} from {url}")
+    
+    try:
+        filepath = resolve_in_workdir(filename)
+        await prefetcher.await_inflight(url)
+        # Cache lookups are SQLite and serving or storing copies whole files: all off the event loop
+        entry, served = await asyncio.to_thread(_prefetched, url, filepath)
+        if not served:
+            headers = download_cache.revalidation_headers(entry)
+            start = time.perf_counter()
+            async with http_client.astream("GET", url, timeout=tool_timeout(30), headers=headers) as response:
+                if _unchanged(entry, response):
+                    await asyncio.to_thread(_serve, url, entry, filepath, "revalidated")
+                else:
+                    pending = download_cache.begin()
+                    try:
+                        parts = await transfer.adownload(url, response, pending)
+                    except BaseException:
+                        pending.discard()
+                        raise
+                    await asyncio.to_thread(_stored, url, response, pending, filepath, parts, start)
+        return await asyncio.to_thread(_saved, filename, filepath, extract)
     
     except Exception as e:
-        logger.error(f"Unexpected error: {e}")
-        return f"Error: {str(e)}"
+        return _failed(e)
+
+
+download_file.coroutine = _adownload_file
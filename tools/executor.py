@@ -1,76 +1,263 @@
 """Python code execution tool."""
+import asyncio
 import logging
+import os
 import subprocess
+import uuid
 from pathlib import Path
+from typing import Optional
 from langchain_core.tools import tool
-from config import TEMP_DIR
+from config import CODE_TIMEOUT
+from .context import current_job, workdir
+from .deadline import tool_timeout
+from .interpreter import interpreter_pool, session_manager, ProcessGroup, WorkerError, limited, sandbox_limits
+from .output import collect, new_capture
+from .packages import overlay_paths
+from .tracing import current_span, traced
 
 logger = logging.getLogger(__name__)
 
 
+def _write_script(code: str) -> Path:
+    # Unique name: parallel tool calls of one chain share the workdir
+    script_path = workdir() / f"runner_{uuid.uuid4().hex[:8]}.py"
+    with open(script_path, "w", encoding="utf-8") as f:
+        f.write(code)
+    return script_path
+
+
+def _timeout_result(stdout: str, timeout: float) -> dict:
+    return {
+        "stdout": stdout,
+        "stderr": f"Execution timeout after {timeout:g} seconds",
+        "return_code": -1
+    }
+
+
+def _collect_outputs(out_path: Path, err_path: Path, script_path: Path) -> tuple:
+    """(stdout, stderr) of a cold run, bounded and summarized for the agent."""
+    cwd = script_path.parent
+    return collect(out_path, cwd, "stdout", script_path.name), collect(err_path, cwd, "stderr", script_path.name)
+
+
+def _snippet_env(cwd: Path) -> Optional[dict]:
+    """Environment of a cold run: the job's installed packages ahead of the system ones."""
+    paths = overlay_paths(cwd)
+    if not paths:
+        return None
+    return {**os.environ, "PYTHONPATH": os.pathsep.join(paths + [os.environ.get("PYTHONPATH", "")]).rstrip(os.pathsep)}
+
+
+def _result(stdout: str, stderr: str, return_code: int) -> dict:
+    result = {
+        "stdout": stdout,
+        "stderr": stderr,
+        "return_code": return_code
+    }
+    
+    if return_code == 0:
+        logger.info(f"✓ Code executed successfully")
+        logger.info(f"Output: {stdout[:200]}")
+    else:
+        logger.warning(f"Code execution failed with code {return_code}")
+        logger.error(f"STDERR: {stderr}")
+        logger.error(f"STDOUT: {stdout}")
+    
+    return result
+
+
+def _run_warm(script_path: Path, job, timeout: float) -> Optional[dict]:
+    """Run the script in a fork of a warm interpreter; None if none is free."""
+    if not interpreter_pool.available:
+        return None
+    try:
+        stdout, stderr, return_code, timed_out = interpreter_pool.run(script_path, script_path.parent, timeout, job)
+    except WorkerError as e:
+        logger.info(f"Cold interpreter for this snippet: {e}")
+        return None
+    if timed_out:
+        return _timeout_result(stdout, timeout)
+    return _result(stdout, stderr, return_code)
+
+
+def _run_session(script_path: Path, job, reset: bool, timeout: float) -> dict:
+    """Run the script in the chain's stateful session."""
+    key = job.job_id if job else "local"
+    if reset and session_manager.close(key):
+        logger.info(f"Session {key} reset on request")
+    try:
+        stdout, stderr, return_code, timed_out, info = session_manager.run(
+            key, script_path, script_path.parent, timeout, job
+        )
+    except WorkerError as e:
+        session_manager.close(key)
+        return {"stdout": "", "stderr": f"Session unavailable: {e}", "return_code": -1}
+    result = _timeout_result(stdout, timeout) if timed_out else _result(stdout, stderr, return_code)
+    result["session"] = info
+    return result
+
+
+def _cold_timeout(out_path: Path, err_path: Path, script_path: Path, timeout: float) -> dict:
+    """Result of a cold run killed at the timeout: whatever it printed so far."""
+    err_path.unlink(missing_ok=True)
+    return _timeout_result(collect(out_path, script_path.parent, "stdout", script_path.name), timeout)
+
+
+def _cold_command(script_path: Path, timeout: float) -> list:
+    return limited(["python3", script_path.name], sandbox_limits(timeout))
+
+
+def _cold_options(script_path: Path) -> dict:
+    """Process options of a cold run, the same for subprocess and asyncio."""
+    return {
+        "cwd": str(script_path.parent),
+        "env": _snippet_env(script_path.parent),
+        # Own process group: a timeout or cancel kills whatever the snippet started too
+        "start_new_session": True,
+    }
+
+
+def _prepare(code: str) -> tuple:
+    """(script path, job, timeout) of a run_code call."""
+    # Never run past the question's deadline
+    timeout = tool_timeout(CODE_TIMEOUT)
+    current_span().set(timeout=timeout)
+    return _write_script(code), current_job.get(), timeout
+
+
+def _failed(e: Exception) -> dict:
+    logger.error(f"Code execution error: {e}")
+    return {
+        "stdout": "",
+        "stderr": str(e),
+        "return_code": -1
+    }
+
+
 @tool
-def run_code(code: str) -> dict:
+@traced("run_code")
+def run_code(code: str, session: bool = False, reset: bool = False) -> dict:
     """
     Execute Python code and return the output.
     
-    The code is written to a temporary file and executed in isolation.
-    Working directory is set to TEMP_DIR so downloaded files are accessible.
+    The code is written to a temporary file and executed in isolation, in a
+    fresh fork of a warm interpreter (numpy and pandas already imported)
+    when one is free, under CPU, memory, open-file and file-size limits.
+    Working directory is the chain's own directory, so downloaded files
+    are accessible by name.
+    
+    With session=True the code runs in this chain's persistent session
+    instead: variables from earlier session calls (loaded DataFrames,
+    parsed files) are still defined, so a fix-and-retry does not reload
+    the data. reset=True discards the session's variables first.
     
     Args:
         code: Python source code to execute
+        session: Keep variables between calls that also pass session=True
+        reset: Start the session from scratch before running the code
         
     Returns:
-        Dictionary with stdout, stderr, and return_code
+        Dictionary with stdout, stderr, and return_code; session calls
+        also list the variables the session holds and its memory use
     """
     logger.info("Executing Python code")
+    script_path = None
     
     try:
-        # Write code to temp file
-        script_path = TEMP_DIR / "runner.py"
-        with open(script_path, "w", encoding="utf-8") as f:
-            f.write(code)
+        script_path, job, timeout = _prepare(code)
+        if session or reset:
+            current_span().set(mode="session")
+            return _run_session(script_path, job, reset, timeout)
+        result = _run_warm(script_path, job, timeout)
+        if result is not None:
+            current_span().set(mode="warm")
+            return result
+        current_span().set(mode="cold")
         
-        # Execute with subprocess (timeout in communicate, not Popen)
-        proc = subprocess.Popen(
-            ["python3", "runner.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            cwd=str(TEMP_DIR)
-        )
+        # Execute with subprocess; output streams to capture files, not into memory
+        out_path, err_path = new_capture()
+        with open(out_path, "wb") as out, open(err_path, "wb") as err:
+            proc = subprocess.Popen(
+                _cold_command(script_path, timeout),
+                stdout=out,
+                stderr=err,
+                **_cold_options(script_path)
+            )
+        group = ProcessGroup(proc.pid)
+        if job:
+            job.track(group)
         
-        # Timeout is applied here in communicate()
         try:
-            stdout, stderr = proc.communicate(timeout=120)
+            proc.wait(timeout=timeout)
         except subprocess.TimeoutExpired:
-            proc.kill()
-            stdout, stderr = proc.communicate()
-            return {
-                "stdout": stdout,
-                "stderr": "Execution timeout after 120 seconds",
-                "return_code": -1
-            }
+            group.kill()
+            proc.wait()
+            return _cold_timeout(out_path, err_path, script_path, timeout)
+        finally:
+            if job:
+                job.untrack(group)
         
-        result = {
-            "stdout": stdout,
-            "stderr": stderr,
-            "return_code": proc.returncode
-        }
+        stdout, stderr = _collect_outputs(out_path, err_path, script_path)
+        return _result(stdout, stderr, proc.returncode)
+        
+    except Exception as e:
+        return _failed(e)
+    
+    finally:
+        if script_path:
+            script_path.unlink(missing_ok=True)
+
+
+@traced("run_code")
+async def _arun_code(code: str, session: bool = False, reset: bool = False) -> dict:
+    """Async variant of run_code (asyncio subprocess, no blocking thread)."""
+    logger.info("Executing Python code")
+    script_path = None
+    
+    try:
+        script_path, job, timeout = _prepare(code)
+        if session or reset:
+            current_span().set(mode="session")
+            return await asyncio.to_thread(_run_session, script_path, job, reset, timeout)
+        if interpreter_pool.available:
+            # The pool protocol is blocking; only the wait for the fork leaves the loop
+            result = await asyncio.to_thread(_run_warm, script_path, job, timeout)
+            if result is not None:
+                current_span().set(mode="warm")
+                return result
+        current_span().set(mode="cold")
         
-        if proc.returncode == 0:
-            logger.info(f"✓ Code executed successfully")
-            logger.info(f"Output: {stdout[:200]}")
-        else:
-            logger.warning(f"Code execution failed with code {proc.returncode}")
-            logger.error(f"STDERR: {stderr}")
-            logger.error(f"STDOUT: {stdout}")
+        out_path, err_path = new_capture()
+        with open(out_path, "wb") as out, open(err_path, "wb") as err:
+            proc = await asyncio.create_subprocess_exec(
+                *_cold_command(script_path, timeout),
+                stdout=out,
+                stderr=err,
+                **_cold_options(script_path)
+            )
+        group = ProcessGroup(proc.pid)
+        if job:
+            job.track(group)
         
-        return result
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            group.kill()
+            await proc.wait()
+            return await asyncio.to_thread(_cold_timeout, out_path, err_path, script_path, timeout)
+        finally:
+            if job:
+                job.untrack(group)
         
+        stdout, stderr = await asyncio.to_thread(_collect_outputs, out_path, err_path, script_path)
+        return _result(stdout, stderr, proc.returncode)
+    
     except Exception as e:
-        logger.error(f"Code execution error: {e}")
-        return {
-            "stdout": "",
-            "stderr": str(e),
-            "return_code": -1
-        }
+        return _failed(e)
+    
+    finally:
+        if script_path:
+            script_path.unlink(missing_ok=True)
+
+
+run_code.coroutine = _arun_code
@@ -0,0 +1,233 @@
+"""Compact page representation for the LLM instead of raw HTML."""
+import csv
+import hashlib
+import io
+import logging
+import re
+from html.parser import HTMLParser
+from typing import Optional
+from urllib.parse import urljoin
+
+from config import (
+    TEMP_DIR,
+    EXTRACT_MAX_TEXT_CHARS,
+    EXTRACT_MAX_LINKS,
+    EXTRACT_MAX_TABLE_ROWS,
+)
+from .context import workdir
+
+logger = logging.getLogger(__name__)
+
+PAGES_DIR = TEMP_DIR / "pages"
+
+_SKIP_TAGS = {"script", "style", "noscript", "template", "svg"}
+_BLOCK_TAGS = {
+    "p", "div", "br", "li", "ul", "ol", "h1", "h2", "h3", "h4", "h5", "h6",
+    "pre", "section", "article", "header", "footer", "form", "blockquote",
+    "tr", "dt", "dd", "label", "hr",
+}
+_MEDIA_TAGS = {"audio", "video", "source", "img", "embed", "object", "iframe"}
+_VOID_TAGS = {"br", "hr", "img", "input", "source", "embed", "meta", "link"}
+_WHITESPACE = re.compile(r"\s+")
+
+
+class _PageParser(HTMLParser):
+    """Single pass over the DOM collecting text, links, forms, tables and media."""
+
+    def __init__(self, base_url: str):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.title = ""
+        self.text = []
+        self.links = []
+        self.forms = []
+        self.tables = []
+        self.media = []
+        self._skip = 0
+        self._in_title = False
+        self._in_pre = 0
+        self._link = None
+        self._table_stack = []
+
+    def _abs(self, url: str) -> str:
+        return urljoin(self.base_url, url.strip())
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "base" and attrs.get("href"):
+            self.base_url = self._abs(attrs["href"])
+        if tag == "title":
+            self._in_title = True
+        if tag in _SKIP_TAGS and tag not in _VOID_TAGS:
+            self._skip += 1
+        if self._skip:
+            return
+
+        if tag in _BLOCK_TAGS:
+            self.text.append("\n")
+        if tag == "pre":
+            self._in_pre += 1
+
+        if tag == "a" and attrs.get("href") and not attrs["href"].startswith(("#", "javascript:")):
+            self._link = [self._abs(attrs["href"]), []]
+        elif tag == "form":
+            self.forms.append({
+                "method": (attrs.get("method") or "GET").upper(),
+                "action": self._abs(attrs.get("action") or ""),
+                "fields": [],
+            })
+        elif tag in ("input", "select", "textarea") and self.forms and attrs.get("name"):
+            self.forms[-1]["fields"].append(attrs["name"])
+        elif tag in _MEDIA_TAGS and (attrs.get("src") or attrs.get("data")):
+            src = self._abs(attrs.get("src") or attrs.get("data"))
+            label = attrs.get("alt") or attrs.get("type") or ""
+            self.media.append((tag, src, label))
+        elif tag == "table":
+            self._table_stack.append([])
+        elif tag == "tr" and self._table_stack:
+            self._table_stack[-1].append([])
+        elif tag in ("td", "th") and self._table_stack and self._table_stack[-1]:
+            self._table_stack[-1][-1].append("")
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        if tag in _SKIP_TAGS and tag not in _VOID_TAGS:
+            self._skip = max(0, self._skip - 1)
+            return
+        if self._skip:
+            return
+
+        if tag == "pre":
+            self._in_pre = max(0, self._in_pre - 1)
+        if tag == "a" and self._link:
+            href, words = self._link
+            self.links.append((href, " ".join("".join(words).split())))
+            self._link = None
+        elif tag == "table" and self._table_stack:
+            rows = [row for row in self._table_stack.pop() if any(cell.strip() for cell in row)]
+            if rows:
+                self.tables.append(rows)
+        if tag in _BLOCK_TAGS:
+            self.text.append("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+            return
+        if self._skip:
+            return
+        if self._link:
+            self._link[1].append(data)
+        table = self._table_stack[-1] if self._table_stack else None
+        if table and table[-1]:
+            table[-1][-1] += data
+            return
+        if self._in_pre:
+            self.text.append(data)
+            return
+        self.text.append(_WHITESPACE.sub(" ", data))
+
+
+def _clean_text(chunks: list) -> str:
+    lines = (" ".join(line.split()) for line in "".join(chunks).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def _table_csv(rows: list, max_rows: int) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in rows[:max_rows]:
+        writer.writerow(" ".join(cell.split()) for cell in row)
+    if len(rows) > max_rows:
+        buffer.write(f"... ({len(rows) - max_rows} more rows)\n")
+    return buffer.getvalue()
+
+
+def _cap(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return text[:limit] + f"\n... [truncated {len(text) - limit} chars]"
+
+
+def save_raw(url: str, content: str) -> str:
+    """Store the raw page in the job's workdir and return its workdir-relative path."""
+    directory = workdir() / PAGES_DIR.name
+    directory.mkdir(parents=True, exist_ok=True)
+    name = hashlib.sha1(url.encode()).hexdigest()[:12] + ".html"
+    (directory / name).write_text(content, encoding="utf-8")
+    return f"{PAGES_DIR.name}/{name}"
+
+
+def parse_page(content: str, url: str) -> dict:
+    """Title, visible text, absolute links, forms, table rows and media of an HTML page."""
+    parser = _PageParser(url)
+    parser.feed(content)
+    parser.close()
+    return {
+        "title": " ".join(parser.title.split()),
+        "text": _clean_text(parser.text),
+        "links": parser.links,
+        "forms": parser.forms,
+        "tables": parser.tables,
+        "media": parser.media,
+    }
+
+
+def looks_like_html(content: str) -> bool:
+    head = content.lstrip()[:1000].lower()
+    return "<html" in head or "<body" in head or "<!doctype" in head or "<div" in head
+
+
+def extract_page(
+    content: str,
+    url: str,
+    max_text_chars: int = EXTRACT_MAX_TEXT_CHARS,
+    max_links: int = EXTRACT_MAX_LINKS,
+    max_table_rows: int = EXTRACT_MAX_TABLE_ROWS,
+    page: Optional[dict] = None,
+) -> str:
+    """
+    Turn a rendered page into a compact text summary.
+
+    The summary keeps visible text, absolute links, form endpoints, tables
+    as CSV and media references. Non-HTML bodies are returned capped.
+    Pass `page` when the caller already has the `parse_page` result.
+    """
+    if not looks_like_html(content):
+        return _cap(content, max_text_chars)
+
+    if page is None:
+        page = parse_page(content, url)
+
+    sections = [f"URL: {url}"]
+    if page["title"]:
+        sections.append(f"TITLE: {page['title']}")
+    sections.append("TEXT:\n" + _cap(page["text"], max_text_chars))
+
+    if page["links"]:
+        seen = set()
+        lines = []
+        for href, label in page["links"]:
+            if href in seen:
+                continue
+            seen.add(href)
+            lines.append(f"- {label} -> {href}" if label else f"- {href}")
+        extra = len(lines) - max_links
+        sections.append("LINKS:\n" + "\n".join(lines[:max_links]) + (f"\n... ({extra} more)" if extra > 0 else ""))
+
+    if page["forms"]:
+        lines = [
+            f"- {form['method']} {form['action']} fields: {', '.join(form['fields']) or '(none)'}"
+            for form in page["forms"]
+        ]
+        sections.append("FORMS:\n" + "\n".join(lines))
+
+    for index, rows in enumerate(page["tables"], 1):
+        sections.append(f"TABLE {index} (csv):\n" + _table_csv(rows, max_table_rows).rstrip())
+
+    if page["media"]:
+        lines = [f"- {tag}: {src}" + (f" ({label})" if label else "") for tag, src, label in page["media"]]
+        sections.append("MEDIA:\n" + "\n".join(lines))
+
+    return "\n\n".join(sections)
@@ -0,0 +1,377 @@
+"""Shared HTTP client layer for the tools: pooling, retries, DNS cache and reuse stats."""
+import asyncio
+import importlib.util
+import ipaddress
+import logging
+import random
+import socket
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Optional
+
+import httpcore
+import httpx
+
+from config import (
+    HTTP_HTTP2,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_RETRIES,
+    HTTP_BACKOFF,
+    HTTP_DNS_TTL,
+    HTTP_DNS_CACHE_SIZE,
+)
+from .deadline import EXPIRED, FINAL, current_deadline, tool_timeout
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {429, 502, 503, 504}
+MAX_RETRY_AFTER = 30
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+if HTTP_HTTP2 and not HTTP2_AVAILABLE:
+    logger.warning("HTTP/2 requested but the 'h2' package is missing, using HTTP/1.1 (pip install 'httpx[http2]')")
+
+_stats = {"requests": 0, "connections": 0, "retries": 0, "http2": 0, "dns_hits": 0, "dns_misses": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key: str, amount: int = 1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def get_http_stats() -> dict:
+    """Request, connection and retry counters since startup."""
+    with _stats_lock:
+        stats = dict(_stats)
+    reused = max(0, stats["requests"] - stats["connections"])
+    stats["reused_connections"] = reused
+    stats["reuse_rate"] = round(reused / stats["requests"], 3) if stats["requests"] else 0.0
+    return stats
+
+
+# --- DNS cache --------------------------------------------------------------
+
+_dns_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_dns_lock = threading.Lock()
+
+
+def _literal(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def _cached_addresses(host: str, port: int) -> Optional[list]:
+    now = time.monotonic()
+    with _dns_lock:
+        hit = _dns_cache.get((host, port))
+        if hit is None or hit[0] <= now:
+            return None
+        _dns_cache.move_to_end((host, port))
+    _count("dns_hits")
+    return hit[1]
+
+
+def _remember_addresses(host: str, port: int, infos: list) -> list:
+    addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    now = time.monotonic()
+    _count("dns_misses")
+    with _dns_lock:
+        for key in [key for key, (expires, _) in _dns_cache.items() if expires <= now]:
+            del _dns_cache[key]
+        _dns_cache[(host, port)] = (now + HTTP_DNS_TTL, addresses)
+        while len(_dns_cache) > HTTP_DNS_CACHE_SIZE:
+            _dns_cache.popitem(last=False)
+    return addresses
+
+
+def _resolve(host: str, port: int) -> list:
+    if _literal(host):
+        return [host]
+    addresses = _cached_addresses(host, port)
+    if addresses is None:
+        try:
+            infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except OSError as e:
+            raise httpcore.ConnectError(str(e)) from e
+        addresses = _remember_addresses(host, port, infos)
+    return addresses
+
+
+async def _aresolve(host: str, port: int) -> list:
+    if _literal(host):
+        return [host]
+    addresses = _cached_addresses(host, port)
+    if addresses is None:
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except OSError as e:
+            raise httpcore.ConnectError(str(e)) from e
+        addresses = _remember_addresses(host, port, infos)
+    return addresses
+
+
+class _CachingBackend(httpcore.SyncBackend):
+    """httpcore's sync network backend, resolving through the DNS cache (TLS still uses the host name)."""
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        error = None
+        for address in _resolve(host, port):
+            try:
+                return super().connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        raise error
+
+
+class _AsyncCachingBackend(httpcore.AnyIOBackend):
+    """Async `_CachingBackend`."""
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        error = None
+        for address in await _aresolve(host, port):
+            try:
+                return await super().connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        raise error
+
+
+def _cache_dns(transport):
+    """Resolve `transport`'s connections through the DNS cache (only the tools' clients, not the process)."""
+    if HTTP_DNS_TTL <= 0 or not isinstance(transport, (httpx.HTTPTransport, httpx.AsyncHTTPTransport)):
+        return
+    # httpx has no option for the network backend; its pool holds the one it connects with
+    async_transport = isinstance(transport, httpx.AsyncHTTPTransport)
+    transport._pool._network_backend = _AsyncCachingBackend() if async_transport else _CachingBackend()
+
+
+# --- Clients ----------------------------------------------------------------
+
+def _client_options() -> dict:
+    return {
+        "follow_redirects": True,
+        "http2": HTTP_HTTP2 and HTTP2_AVAILABLE,
+        "limits": httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+
+# Wraps the transport of every new client (the record/replay harness uses it)
+_transport_wrapper: Optional[Callable] = None
+
+# httpx.AsyncClient pools connections per event loop, so keep one per loop
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def _new_client(client_class, transport_class):
+    options = _client_options()
+    if _transport_wrapper is not None:
+        transport = transport_class(http2=options["http2"], limits=options["limits"])
+        _cache_dns(transport)
+        options["transport"] = _transport_wrapper(transport)
+        return client_class(**options)
+    client = client_class(**options)
+    _cache_dns(client._transport)
+    return client
+
+
+def get_client() -> httpx.Client:
+    """Pooled, thread-safe sync client shared by all tools."""
+    global _client
+    with _client_lock:
+        if _client is None or _client.is_closed:
+            _client = _new_client(httpx.Client, httpx.HTTPTransport)
+        return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Pooled async client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _new_client(httpx.AsyncClient, httpx.AsyncHTTPTransport)
+        _async_clients[loop] = client
+    return client
+
+
+def wrap_transports(wrapper: Optional[Callable]):
+    """
+    Build clients from now on with `wrapper(default transport)` as their
+    transport (None restores the default). Open clients are dropped.
+    """
+    global _transport_wrapper
+    _transport_wrapper = wrapper
+    close_client()
+    _async_clients.clear()
+
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+async def aclose_async_client():
+    """Close the running loop's client (call on shutdown)."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+# --- Retry policy -----------------------------------------------------------
+
+def _trace(event: str, info: dict):
+    if event == "connection.connect_tcp.complete":
+        _count("connections")
+
+
+async def _atrace(event: str, info: dict):
+    _trace(event, info)
+
+
+def _out_of_time() -> bool:
+    """Whether the chain's question is down to its last seconds: no retries, no Retry-After waits."""
+    deadline = current_deadline.get()
+    return deadline is not None and deadline.phase() in (FINAL, EXPIRED)
+
+
+def _attempt_timeout(timeout, attempt: int):
+    """The caller's timeout, cut again to what the question has left when this is a retry."""
+    if attempt == 0 or not isinstance(timeout, (int, float)):
+        return timeout
+    return tool_timeout(timeout)
+
+
+def _retry_delay(method: str, attempt: int, error: Optional[Exception] = None,
+                 response: Optional[httpx.Response] = None) -> Optional[float]:
+    """Seconds to wait before retrying, or None when the call must not be retried."""
+    if attempt >= HTTP_RETRIES or _out_of_time():
+        return None
+    if error is not None:
+        # A failed connect never reached the server, so even a POST is safe to resend
+        connect_failed = isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout))
+        if method not in IDEMPOTENT_METHODS and not connect_failed:
+            return None
+    else:
+        if response.status_code not in RETRY_STATUSES or method not in IDEMPOTENT_METHODS:
+            return None
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), MAX_RETRY_AFTER)
+    return HTTP_BACKOFF * (2 ** attempt) * (0.5 + random.random())
+
+
+def _note_response(response: httpx.Response):
+    _count("requests")
+    if response.http_version == "HTTP/2":
+        _count("http2")
+
+
+def _send(method: str, url: str, stream: bool = False, **kwargs) -> httpx.Response:
+    client = get_client()
+    method = method.upper()
+    timeout = kwargs.pop("timeout", httpx.USE_CLIENT_DEFAULT)
+    attempt = 0
+    while True:
+        request = client.build_request(method, url, timeout=_attempt_timeout(timeout, attempt), **kwargs)
+        request.extensions["trace"] = _trace
+        try:
+            response = client.send(request, stream=stream)
+        except httpx.TransportError as e:
+            delay = _retry_delay(method, attempt, error=e)
+            if delay is None:
+                raise
+            logger.info(f"{method} {url} failed ({e!r}), retrying in {delay:.1f}s")
+        else:
+            _note_response(response)
+            delay = _retry_delay(method, attempt, response=response)
+            if delay is None:
+                return response
+            response.close()
+            logger.info(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+        _count("retries")
+        attempt += 1
+        time.sleep(delay)
+
+
+async def _asend(method: str, url: str, stream: bool = False, **kwargs) -> httpx.Response:
+    client = get_async_client()
+    method = method.upper()
+    timeout = kwargs.pop("timeout", httpx.USE_CLIENT_DEFAULT)
+    attempt = 0
+    while True:
+        request = client.build_request(method, url, timeout=_attempt_timeout(timeout, attempt), **kwargs)
+        request.extensions["trace"] = _atrace
+        try:
+            response = await client.send(request, stream=stream)
+        except httpx.TransportError as e:
+            delay = _retry_delay(method, attempt, error=e)
+            if delay is None:
+                raise
+            logger.info(f"{method} {url} failed ({e!r}), retrying in {delay:.1f}s")
+        else:
+            _note_response(response)
+            delay = _retry_delay(method, attempt, response=response)
+            if delay is None:
+                return response
+            await response.aclose()
+            logger.info(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+        _count("retries")
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+def request(method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Send a request through the shared client.
+
+    Idempotent methods are retried with exponential backoff on transport
+    errors and on 429/502/503/504 (honouring Retry-After). Other methods,
+    i.e. answer submissions, are only resent when the connection could not
+    be opened at all. Retries get what is left of the question's time and
+    stop once it is in its FINAL phase.
+    """
+    return _send(method, url, **kwargs)
+
+
+async def arequest(method: str, url: str, **kwargs) -> httpx.Response:
+    """Async `request`."""
+    return await _asend(method, url, **kwargs)
+
+
+@contextmanager
+def stream(method: str, url: str, **kwargs):
+    """`request` whose body is read incrementally inside the `with` block."""
+    response = _send(method, url, stream=True, **kwargs)
+    try:
+        yield response
+    finally:
+        response.close()
+
+
+@asynccontextmanager
+async def astream(method: str, url: str, **kwargs):
+    """Async `stream`."""
+    response = await _asend(method, url, stream=True, **kwargs)
+    try:
+        yield response
+    finally:
+        await response.aclose()
@@ -1,13 +1,19 @@
-"""Python package installer tool."""
+"""Python package installer tool (per-job overlay environments, see packages.py)."""
+import asyncio
 import logging
-import subprocess
 from typing import List
 from langchain_core.tools import tool
+from config import PACKAGE_TIMEOUT
+from .context import current_job, workdir
+from .deadline import tool_timeout
+from .packages import package_manager, PackageError
+from .tracing import traced
 
 logger = logging.getLogger(__name__)
 
 
 @tool
+@traced("install_package")
 def install_package(packages: List[str]) -> str:
     """
     Install Python packages using pip.
@@ -23,24 +29,30 @@ def install_package(packages: List[str]) -> str:
     logger.info(f"Installing packages: {', '.join(packages)}")
     
     try:
-        result = subprocess.run(
-            ["pip", "install", "--quiet"] + packages,
-            capture_output=True,
-            text=True,
-            timeout=120
-        )
-        
-        if result.returncode == 0:
-            logger.info(f"✓ Installed: {', '.join(packages)}")
-            return f"Successfully installed: {', '.join(packages)}"
-        else:
-            logger.error(f"Installation failed: {result.stderr}")
-            return f"Installation failed: {result.stderr}"
-            
-    except subprocess.TimeoutExpired:
-        logger.error("Installation timeout")
-        return "Error: Installation timeout (120s)"
+        return package_manager.install(packages, workdir(), tool_timeout(PACKAGE_TIMEOUT), current_job.get())
+    except PackageError as e:
+        logger.error(f"Installation failed: {e}")
+        return f"Installation failed: {e}"
+    except Exception as e:
+        logger.error(f"Installation error: {e}")
+        return f"Error: {str(e)}"
+
+
+@traced("install_package")
+async def _ainstall_package(packages: List[str]) -> str:
+    """Async variant of install_package."""
+    logger.info(f"Installing packages: {', '.join(packages)}")
     
+    try:
+        return await asyncio.to_thread(
+            package_manager.install, packages, workdir(), tool_timeout(PACKAGE_TIMEOUT), current_job.get()
+        )
+    except PackageError as e:
+        logger.error(f"Installation failed: {e}")
+        return f"Installation failed: {e}"
     except Exception as e:
         logger.error(f"Installation error: {e}")
         return f"Error: {str(e)}"
+
+
+install_package.coroutine = _ainstall_package
@@ -0,0 +1,438 @@
+"""Pool of warm Python interpreters that run_code forks snippets from."""
+import json
+import logging
+import os
+import queue
+import select
+import signal
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from config import (
+    TEMP_DIR,
+    CODE_MEMORY_LIMIT_MB,
+    CODE_MAX_OPEN_FILES,
+    CODE_MAX_FILE_MB,
+    WARM_WORKERS,
+    WARM_MAX_RUNS,
+    WARM_PRELOAD,
+    SESSION_IDLE_TIMEOUT,
+    SESSION_MEMORY_MB,
+)
+from .output import collect, new_capture
+from .packages import overlay_paths
+
+logger = logging.getLogger(__name__)
+
+WORKER_SCRIPT = Path(__file__).with_name("interpreter_worker.py")
+READY_TIMEOUT = 60  # Preloading pandas & co. on a cold disk can be slow
+REPLY_TIMEOUT = 10
+
+
+class WorkerError(Exception):
+    """The warm interpreter could not take the snippet (nothing was run)."""
+
+
+def sandbox_limits(timeout: float) -> dict:
+    """rlimits for a snippet, by `resource` constant name."""
+    mb = 1024 * 1024
+    return {
+        "RLIMIT_CPU": int(timeout) + 5,
+        "RLIMIT_AS": CODE_MEMORY_LIMIT_MB * mb,
+        "RLIMIT_NOFILE": CODE_MAX_OPEN_FILES,
+        "RLIMIT_FSIZE": CODE_MAX_FILE_MB * mb,
+    }
+
+
+# Runs in the child: applies the rlimits in argv[1], then execs the rest of argv.
+# A preexec_fn would do it between fork and exec, which is unsafe in this
+# threaded server (browser pool, prefetch, job workers).
+_LIMITED_EXEC = """
+import json, os, resource, sys
+for name, value in json.loads(sys.argv[1]).items():
+    try:
+        resource.setrlimit(getattr(resource, name), (value, value))
+    except (ValueError, OSError):
+        pass
+os.execvp(sys.argv[2], sys.argv[2:])
+"""
+
+
+def limited(command: list, limits: dict) -> list:
+    """`command` wrapped so the child applies `sandbox_limits()` to itself before it starts."""
+    return ["python3", "-c", _LIMITED_EXEC, json.dumps(limits), *command]
+
+
+class ProcessGroup:
+    """Handle for a snippet in its own process group, so JobContext.cancel() kills it and its children."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+
+    def kill(self):
+        try:
+            os.killpg(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            # setpgid() has not run yet in the child
+            os.kill(self.pid, signal.SIGKILL)
+
+
+class _Interpreter:
+    """One warm `interpreter_worker.py` process."""
+
+    def __init__(self, preload: tuple, args: tuple = (), **popen_kwargs):
+        self.proc = subprocess.Popen(
+            ["python3", str(WORKER_SCRIPT), *args, *preload],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=str(TEMP_DIR),
+            **popen_kwargs,
+        )
+        self.runs = 0
+        self.ready = False
+        self._buffer = b""
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def _read(self, timeout: float) -> Optional[dict]:
+        """Next protocol message, or None if none arrives within `timeout`."""
+        deadline = time.monotonic() + timeout
+        fd = self.proc.stdout.fileno()
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            readable, _, _ = select.select([fd], [], [], remaining)
+            if not readable:
+                return None
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise WorkerError("interpreter exited")
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return json.loads(line)
+
+    def _expect(self, key: str, timeout: float):
+        message = self._read(timeout)
+        if message is None or key not in message:
+            raise WorkerError(f"expected '{key}' from interpreter, got {message}")
+        return message[key]
+
+    def _submit(self, script: Path, cwd: Path, limits: Optional[dict] = None) -> tuple:
+        """Send one run request; returns the (stdout, stderr) capture files."""
+        if not self.ready:
+            self._expect("ready", READY_TIMEOUT)
+            self.ready = True
+
+        out_path, err_path = new_capture()
+        request = {
+            "script": str(Path(script).resolve()),
+            "cwd": str(Path(cwd).resolve()),
+            "stdout": str(out_path.resolve()),
+            "stderr": str(err_path.resolve()),
+            "limits": limits or {},
+            "paths": overlay_paths(cwd),
+        }
+        try:
+            self.proc.stdin.write((json.dumps(request) + "\n").encode())
+            self.proc.stdin.flush()
+        except OSError as e:
+            raise WorkerError(f"interpreter not accepting work: {e}")
+        self.runs += 1
+        return out_path, err_path
+
+    def run(self, script: Path, cwd: Path, timeout: float, job=None) -> tuple:
+        """Run `script` in a fork; returns (stdout, stderr, return_code, timed_out)."""
+        out_path, err_path = self._submit(script, cwd, sandbox_limits(timeout))
+        child = ProcessGroup(self._expect("pid", REPLY_TIMEOUT))
+        if job:
+            job.track(child)
+        timed_out = False
+        try:
+            message = self._read(timeout)
+            timed_out = message is None
+            if timed_out:
+                child.kill()
+                message = self._read(REPLY_TIMEOUT)
+        except WorkerError:
+            # The snippet may already have run: report it, don't retry it
+            message = None
+        finally:
+            if job:
+                job.untrack(child)
+
+        stdout = collect(out_path, cwd, "stdout", script.name)
+        stderr = collect(err_path, cwd, "stderr", script.name)
+        if message is None or "rc" not in message:
+            return stdout, stderr + "\nInterpreter worker died while running the code", -1, timed_out
+        return stdout, stderr, message["rc"], timed_out
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+
+class InterpreterPool:
+    """
+    Warm interpreters with the data libraries already imported.
+
+    Each snippet runs in a fresh fork of a warm interpreter, so it gets a
+    clean namespace, its own limits (see `sandbox_limits`) and cannot take
+    the interpreter down with it. An interpreter is replaced after
+    `max_runs` snippets, after a snippet killed by a signal and whenever
+    it stops answering.
+    """
+
+    def __init__(
+        self,
+        size: int = WARM_WORKERS,
+        max_runs: int = WARM_MAX_RUNS,
+        preload: tuple = WARM_PRELOAD,
+    ):
+        self.size = size
+        self.max_runs = max_runs
+        self.preload = tuple(preload)
+        self._idle: "queue.LifoQueue[_Interpreter]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._count = 0
+        self._stopped = False
+        self.runs = 0
+        self.recycles = 0
+
+    @property
+    def available(self) -> bool:
+        return hasattr(os, "fork") and self.size > 0 and not self._stopped
+
+    def start(self):
+        """Spawn all interpreters now instead of on first use."""
+        self._stopped = False
+        with self._lock:
+            missing = self.size - self._count
+            self._count += missing
+        for _ in range(missing):
+            self._idle.put(_Interpreter(self.preload))
+        logger.info(f"✓ Interpreter pool started ({self.size} warm workers, preload: {', '.join(self.preload)})")
+
+    def stop(self):
+        self._stopped = True
+        while True:
+            try:
+                interpreter = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            interpreter.close()
+            with self._lock:
+                self._count -= 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self._count,
+            "idle": self._idle.qsize(),
+            "runs": self.runs,
+            "recycles": self.recycles,
+        }
+
+    def _lease(self) -> _Interpreter:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            spawn = self._count < self.size
+            if spawn:
+                self._count += 1
+        if spawn:
+            return _Interpreter(self.preload)
+        # Waiting for a busy interpreter can take longer than a cold start
+        raise WorkerError(f"all {self.size} warm interpreters are busy")
+
+    def _release(self, interpreter: _Interpreter, healthy: bool):
+        if healthy and interpreter.alive and interpreter.runs < self.max_runs and not self._stopped:
+            self._idle.put(interpreter)
+            return
+        interpreter.close()
+        self.recycles += 1
+        if self._stopped:
+            with self._lock:
+                self._count -= 1
+            return
+        # Start the replacement now so the next snippet finds it warm
+        self._idle.put(_Interpreter(self.preload))
+
+    def run(self, script: Path, cwd: Path, timeout: float, job=None) -> tuple:
+        """Run a script file; returns (stdout, stderr, return_code, timed_out)."""
+        interpreter = self._lease()
+        healthy = False
+        try:
+            result = interpreter.run(script, cwd, timeout, job)
+            healthy = result[2] >= 0
+            self.runs += 1
+            return result
+        finally:
+            self._release(interpreter, healthy)
+
+
+class _Session(_Interpreter):
+    """Long-lived interpreter that keeps one chain's variables between snippets."""
+
+    def __init__(self, preload: tuple):
+        limits = sandbox_limits(0)
+        # CPU time accumulates over the whole session; timeouts cover runaway snippets
+        del limits["RLIMIT_CPU"]
+        super().__init__(preload, ("--session", json.dumps(limits)), start_new_session=True)
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+    def kill(self):
+        """Kill the session and anything it started (JobContext.cancel() calls this)."""
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def execute(self, script: Path, cwd: Path, timeout: float, job=None) -> tuple:
+        """Returns (stdout, stderr, return_code, timed_out, reply)."""
+        out_path, err_path = self._submit(script, cwd)
+        if job:
+            job.track(self)
+        message = None
+        timed_out = False
+        try:
+            message = self._read(timeout)
+            timed_out = message is None
+        except WorkerError:
+            pass
+        finally:
+            if job:
+                job.untrack(self)
+            self.last_used = time.monotonic()
+        if message is None:
+            self.kill()
+
+        stdout = collect(out_path, cwd, "stdout", script.name)
+        stderr = collect(err_path, cwd, "stderr", script.name)
+        if message is None or "rc" not in message:
+            return stdout, stderr, -1, timed_out, {}
+        return stdout, stderr, message["rc"], False, message
+
+    def close(self):
+        super().close()
+        self.kill()
+
+
+class SessionManager:
+    """
+    Stateful run_code sessions, one per chain.
+
+    A session is a warm interpreter running every snippet in one persistent
+    namespace, so DataFrames and parsed files survive between calls. A
+    session is dropped when it sits idle for `idle_timeout`, when its RSS
+    passes `memory_mb`, when a snippet times out or crashes it, and when
+    its chain ends.
+    """
+
+    def __init__(
+        self,
+        idle_timeout: float = SESSION_IDLE_TIMEOUT,
+        memory_mb: int = SESSION_MEMORY_MB,
+        preload: tuple = WARM_PRELOAD,
+    ):
+        self.idle_timeout = idle_timeout
+        self.memory_mb = memory_mb
+        self.preload = tuple(preload)
+        self._sessions: "dict[str, _Session]" = {}
+        self._rss = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    @property
+    def available(self) -> bool:
+        return hasattr(os, "killpg")
+
+    def stats(self) -> dict:
+        self.evict_idle()
+        return {
+            "sessions": len(self._sessions),
+            "rss_mb": round(sum(self._rss.values()), 1),
+            "evictions": self.evictions,
+        }
+
+    def close(self, key: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(key, None)
+            self._rss.pop(key, None)
+        if session is not None:
+            session.close()
+        return session is not None
+
+    def close_all(self):
+        for key in list(self._sessions):
+            self.close(key)
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            idle = [
+                key for key, session in self._sessions.items()
+                if now - session.last_used > self.idle_timeout and not session.lock.locked()
+            ]
+        for key in idle:
+            if self.close(key):
+                self.evictions += 1
+                logger.info(f"Evicted idle run_code session {key}")
+
+    def _get(self, key: str, job) -> _Session:
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None and session.alive:
+                return session
+            session = _Session(self.preload)
+            self._sessions[key] = session
+        if job:
+            job.on_close(lambda: self.close(key))
+        logger.info(f"✓ Started run_code session {key}")
+        return session
+
+    def run(self, key: str, script: Path, cwd: Path, timeout: float, job=None) -> tuple:
+        """
+        Run a script in the session `key`, starting it if needed.
+
+        Returns (stdout, stderr, return_code, timed_out, info) where `info`
+        lists the variables the session holds and its memory use.
+        """
+        self.evict_idle()
+        session = self._get(key, job)
+        with session.lock:
+            stdout, stderr, return_code, timed_out, reply = session.execute(script, cwd, timeout, job)
+
+        if not reply:
+            self.close(key)
+            reason = "timed out" if timed_out else "crashed"
+            return stdout, stderr, return_code, timed_out, {"note": f"Session {reason} and was reset: all variables are gone"}
+
+        info = {"objects": reply.get("objects", []), "rss_mb": reply.get("rss_mb")}
+        self._rss[key] = reply.get("rss_mb") or 0
+        if (reply.get("rss_mb") or 0) > self.memory_mb:
+            self.close(key)
+            self.evictions += 1
+            info["note"] = f"Session used {reply['rss_mb']} MB (limit {self.memory_mb} MB) and was reset: all variables are gone"
+        return stdout, stderr, return_code, timed_out, info
+
+
+interpreter_pool = InterpreterPool()
+session_manager = SessionManager()
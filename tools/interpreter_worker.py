@@ -0,0 +1,214 @@
+"""Warm interpreter for run_code: imports data libraries once, then runs snippets.
+
+Default mode forks a fresh child per snippet. With --session <limits JSON>
+it runs every snippet in-process in one persistent namespace instead, so
+variables survive between calls; the limits then apply to the whole worker.
+
+Protocol (one JSON object per line):
+    parent -> worker  {"script", "cwd", "stdout", "stderr", "limits": {rlimit name: value},
+                       "paths": [overlay site-packages to put ahead of the system ones]}
+    worker -> parent  {"ready": pid} once preloading is done, then per request
+                      {"pid": child_pid} and {"rc": exit_code}
+                      (session mode: {"rc", "objects", "rss_mb"}; "limits" is ignored)
+
+Runs as a standalone script, so it must not import anything from the app.
+"""
+import importlib
+import json
+import os
+import resource
+import sys
+import traceback
+import types
+
+MAX_LISTED_OBJECTS = 30
+# Thread pools BLAS/OpenMP start on import do not survive fork(): a child can
+# inherit one mid-operation and deadlock. Forking workers preload without them.
+SINGLE_THREADED = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+_protocol = sys.stdout
+
+
+def _send(message: dict):
+    _protocol.write(json.dumps(message) + "\n")
+    _protocol.flush()
+
+
+def _redirect(fd: int, path: str, flags: int):
+    target = os.open(path, flags, 0o600)
+    os.dup2(target, fd)
+    os.close(target)
+
+
+def _limit(name: str, value: int):
+    try:
+        resource.setrlimit(getattr(resource, name), (value, value))
+    except (AttributeError, ValueError, OSError):
+        pass
+
+
+def _exit_code(exc: SystemExit) -> int:
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    print(exc.code, file=sys.stderr)
+    return 1
+
+
+def _add_paths(paths: list):
+    """Put a job's overlay site-packages right after the script directory."""
+    added = [path for path in paths if path not in sys.path]
+    if added:
+        sys.path[1:1] = added
+        importlib.invalidate_caches()
+
+
+def _execute(script: str, namespace: dict) -> int:
+    """Run a script file in `namespace`; returns its exit code."""
+    sys.argv = [script]
+    sys.path[0] = os.path.dirname(os.path.abspath(script))
+    try:
+        with open(script, encoding="utf-8") as f:
+            compiled = compile(f.read(), script, "exec")
+        namespace["__file__"] = script
+        exec(compiled, namespace)
+        return 0
+    except SystemExit as e:
+        return _exit_code(e)
+    except BaseException as e:
+        # Drop this frame so the traceback starts in the user's script
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        return 1
+
+
+def _child(request: dict):
+    """Runs in the forked process: isolate it, run the script, never return."""
+    code = 1
+    try:
+        os.setpgid(0, 0)
+        for name, value in request.get("limits", {}).items():
+            _limit(name, value)
+
+        _redirect(0, os.devnull, os.O_RDONLY)
+        _redirect(1, request["stdout"], os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        _redirect(2, request["stderr"], os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        os.chdir(request["cwd"])
+        _add_paths(request.get("paths", []))
+
+        # Fresh namespace per snippet, exactly like `python3 script.py`
+        code = _execute(request["script"], {"__name__": "__main__", "__builtins__": __builtins__})
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def _size(value) -> int:
+    usage = getattr(value, "memory_usage", None)
+    if callable(usage):
+        try:
+            total = usage(deep=True)
+            return int(total.sum() if hasattr(total, "sum") else total)
+        except Exception:
+            pass
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    return sys.getsizeof(value)
+
+
+def _describe(namespace: dict) -> list:
+    """One line per user variable: name, type, shape or length, memory."""
+    lines = []
+    for name, value in namespace.items():
+        if name.startswith("_") or isinstance(value, types.ModuleType) or callable(value):
+            continue
+        shape = getattr(value, "shape", None)
+        if not isinstance(shape, tuple):
+            shape = f"len {len(value)}" if isinstance(value, (list, dict, set, tuple, str, bytes)) else ""
+        size_kb = _size(value) / 1024
+        lines.append(f"{name}: {type(value).__name__} {shape} {size_kb:.1f} KB".replace("  ", " "))
+    if len(lines) > MAX_LISTED_OBJECTS:
+        lines = lines[:MAX_LISTED_OBJECTS] + [f"... {len(lines) - MAX_LISTED_OBJECTS} more"]
+    return lines
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024, 1)
+    except (OSError, ValueError):
+        # Peak instead of current RSS (kB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _serve_forks():
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            _child(request)
+        _send({"pid": pid})
+        _, status = os.waitpid(pid, 0)
+        _send({"rc": os.waitstatus_to_exitcode(status)})
+
+
+def _serve_session():
+    global _protocol
+    # Snippets must not see the protocol pipes: keep private copies of them
+    _protocol = os.fdopen(os.dup(1), "w")
+    requests = os.fdopen(os.dup(0))
+    _redirect(0, os.devnull, os.O_RDONLY)
+    sys.stdin = open(os.devnull)
+    namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+    for line in requests:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        os.chdir(request["cwd"])
+        _add_paths(request.get("paths", []))
+        _redirect(1, request["stdout"], os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        _redirect(2, request["stderr"], os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        try:
+            code = _execute(request["script"], namespace)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            _redirect(1, os.devnull, os.O_WRONLY)
+            _redirect(2, os.devnull, os.O_WRONLY)
+        _send({"rc": code, "objects": _describe(namespace), "rss_mb": _rss_mb()})
+
+
+def main():
+    session = len(sys.argv) > 1 and sys.argv[1] == "--session"
+    if session:
+        for name, value in json.loads(sys.argv[2]).items():
+            _limit(name, value)
+    else:
+        # Must happen before the preload: the libraries read these once, on import
+        os.environ.update(dict.fromkeys(SINGLE_THREADED, "1"))
+    for name in sys.argv[3 if session else 1:]:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+
+    _send({"ready": os.getpid()})
+    if session:
+        _serve_session()
+    else:
+        _serve_forks()
+
+
+if __name__ == "__main__":
+    main()
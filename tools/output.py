@@ -0,0 +1,178 @@
+"""Bounded reading and summaries of run_code output before it reaches the agent."""
+import logging
+import re
+import shutil
+import uuid
+from pathlib import Path
+from typing import List, Optional
+
+from config import TEMP_DIR, CODE_OUTPUT_MAX_CHARS, CODE_OUTPUT_SCAN_KB
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_DIR = TEMP_DIR / ".runs"
+SPILL_DIR = "outputs"
+COLLAPSE_MIN_RUN = 6  # Shorter runs of alike lines are kept as they are
+TRACEBACK_START = "Traceback (most recent call last):"
+_FRAME = re.compile(r'^  File "(?P<file>[^"]+)", line \d+')
+_DIGITS = re.compile(r"\d+(?:\.\d+)?")
+_SPACES = re.compile(r"\s+")
+
+
+def new_capture() -> tuple:
+    """Fresh (stdout, stderr) capture file paths; a snippet's output streams there, not into memory."""
+    CAPTURE_DIR.mkdir(parents=True, exist_ok=True)
+    out_path = CAPTURE_DIR / f"{uuid.uuid4().hex}.out"
+    return out_path, out_path.with_suffix(".err")
+
+
+def _shape(line: str) -> str:
+    """A line with its numbers and spacing blurred: rows of a table or a debug loop look alike."""
+    return _SPACES.sub(" ", _DIGITS.sub("#", line)).strip()
+
+
+def collapse_lines(lines: List[str]) -> List[str]:
+    """Replace runs of COLLAPSE_MIN_RUN or more identical or alike lines by their ends and a count."""
+    collapsed = []
+    i = 0
+    while i < len(lines):
+        shape = _shape(lines[i])
+        j = i
+        while j + 1 < len(lines) and _shape(lines[j + 1]) == shape:
+            j += 1
+        run = lines[i:j + 1]
+        if len(run) < COLLAPSE_MIN_RUN:
+            collapsed.extend(run)
+        elif all(line == run[0] for line in run):
+            collapsed.extend([run[0], f"[... same line repeated {len(run) - 1} more times]"])
+        else:
+            collapsed.extend([run[0], run[1], f"[... {len(run) - 3} similar lines]", run[-1]])
+        i = j + 1
+    return collapsed
+
+
+def _frames(block: List[str]) -> tuple:
+    """Split a traceback into (header, frames, exception lines); a frame is its File line plus source lines."""
+    frames = []
+    i = 1
+    while i < len(block) and _FRAME.match(block[i]):
+        frame = [block[i]]
+        i += 1
+        while i < len(block) and block[i].startswith("    "):
+            frame.append(block[i])
+            i += 1
+        frames.append(frame)
+    return block[0], frames, block[i:]
+
+
+def reduce_traceback(text: str, script: Optional[str] = None) -> str:
+    """
+    Keep the frames of the snippet itself and the one that raised; library
+    frames in between are counted instead of listed.
+    """
+    lines = text.splitlines()
+    if TRACEBACK_START not in lines:
+        return text
+    start = len(lines) - 1 - lines[::-1].index(TRACEBACK_START)
+    header, frames, tail = _frames(lines[start:])
+    if len(frames) <= 2:
+        return text
+
+    def relevant(index: int) -> bool:
+        file = _FRAME.match(frames[index][0]).group("file")
+        return index == len(frames) - 1 or file.startswith("<") or (script is not None and Path(file).name == script)
+
+    kept = [header]
+    dropped = omitted = 0
+    for index, frame in enumerate(frames):
+        if relevant(index):
+            if dropped:
+                kept.append(f"  [... {dropped} library frame{'s' if dropped > 1 else ''} omitted]")
+                omitted += dropped
+                dropped = 0
+            kept.extend(frame)
+        else:
+            dropped += 1
+    if not omitted:
+        return text
+    # Earlier output may hold the tracebacks this one was chained to
+    context = reduce_traceback("\n".join(lines[:start]), script).splitlines() if start else []
+    return "\n".join(context + kept + tail)
+
+
+def _read_window(path: Path, scan: int) -> tuple:
+    """(head, tail, size, unread): the whole file as head if it is small, else `scan` bytes from each end."""
+    size = path.stat().st_size
+    with open(path, "rb") as f:
+        if size <= 2 * scan:
+            return f.read().decode("utf-8", errors="replace"), None, size, 0
+        head = f.read(scan)
+        f.seek(-scan, 2)
+        tail = f.read(scan)
+    # Cut at line boundaries so no half line is collapsed or shown
+    head = head[: head.rfind(b"\n") + 1 or len(head)]
+    tail = tail[tail.find(b"\n") + 1:]
+    unread = size - len(head) - len(tail)
+    return head.decode("utf-8", errors="replace"), tail.decode("utf-8", errors="replace"), size, unread
+
+
+def _spill(path: Path, cwd: Path, kind: str) -> str:
+    """Move the capture into <cwd>/outputs; returns its cwd-relative name."""
+    directory = Path(cwd) / SPILL_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"run_{path.stem[:8]}_{kind}.txt"
+    shutil.move(str(path), directory / name)
+    return f"{SPILL_DIR}/{name}"
+
+
+def _summarize(text: str, kind: str, script: Optional[str]) -> str:
+    if kind == "stderr":
+        text = reduce_traceback(text, script)
+    return "\n".join(collapse_lines(text.splitlines()))
+
+
+def collect(
+    path: Path,
+    cwd: Path,
+    kind: str,
+    script: Optional[str] = None,
+    max_chars: int = CODE_OUTPUT_MAX_CHARS,
+    scan_bytes: int = CODE_OUTPUT_SCAN_KB * 1024,
+) -> str:
+    """
+    The text of a stdout/stderr capture file, as the agent should see it.
+
+    Small output comes back whole and the file is deleted. Otherwise only
+    the ends of the file are read (at most 2 x `scan_bytes`), repeated or
+    alike lines are collapsed, stderr tracebacks keep the snippet's own
+    frames, and what still exceeds `max_chars` is cut to head and tail.
+    The full capture then stays under <cwd>/outputs and is named in the
+    text, so the agent can page through it with run_code.
+    """
+    try:
+        head, tail, size, unread = _read_window(path, scan_bytes)
+    except FileNotFoundError:
+        return ""
+
+    if tail is None:
+        reduced = reduce_traceback(head, script) if kind == "stderr" else head
+        if reduced == head and len(head) <= max_chars:
+            path.unlink(missing_ok=True)
+            return head
+        if len(reduced) > max_chars:
+            reduced = _summarize(reduced, kind, script)
+    else:
+        reduced = "\n".join([
+            _summarize(head, "stdout", script),
+            f"[... {unread} bytes not read ...]",
+            _summarize(tail, kind, script),
+        ])
+
+    if len(reduced) > max_chars:
+        keep_head = max_chars * 2 // 3
+        keep_tail = max_chars - keep_head
+        omitted = len(reduced) - keep_head - keep_tail
+        reduced = f"{reduced[:keep_head]}\n[... {omitted} chars omitted ...]\n{reduced[-keep_tail:]}"
+    pointer = _spill(path, cwd, kind)
+    logger.info(f"Summarized {size} bytes of {kind} ({len(reduced)} chars to agent), full output in {pointer}")
+    return f"{reduced}\n[Full {kind} ({size} bytes) saved to {pointer}; page through it with run_code if needed]"
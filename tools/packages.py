@@ -0,0 +1,238 @@
+"""Local wheelhouse and per-job overlay environments behind install_package."""
+import logging
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
+from importlib import metadata
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import InvalidWheelFilename, canonicalize_name, parse_wheel_filename
+
+from config import PACKAGE_WHEELHOUSE, PACKAGE_OFFLINE, PACKAGE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+OVERLAY_DIR = ".venv"
+SITE_PACKAGES = Path("lib") / f"python{sys.version_info.major}.{sys.version_info.minor}" / "site-packages"
+PIP = [sys.executable, "-m", "pip", "--disable-pip-version-check", "--no-input"]
+
+
+class PackageError(Exception):
+    """An install that cannot go ahead; the message is meant for the agent."""
+
+
+def overlay_paths(cwd: Path) -> List[str]:
+    """sys.path entries a snippet running in `cwd` needs to see its job's installed packages."""
+    site = Path(cwd) / OVERLAY_DIR / SITE_PACKAGES
+    return [str(site.resolve())] if site.is_dir() else []
+
+
+def parse_requirements(packages: List[str]) -> List[Requirement]:
+    """Requirement specifiers only: pip options, URLs and paths are refused."""
+    requirements = []
+    for package in packages:
+        text = str(package).strip()
+        if not text or text.startswith("-"):
+            raise PackageError(f"'{package}' is not a package name")
+        try:
+            requirement = Requirement(text)
+        except InvalidRequirement as e:
+            raise PackageError(f"'{package}' is not a valid requirement: {e}")
+        if requirement.url:
+            raise PackageError(f"'{package}': installing from URLs is not allowed")
+        requirements.append(requirement)
+    return requirements
+
+
+def _versions(paths: Optional[List[str]] = None) -> Dict[str, str]:
+    """Canonical name -> version of the distributions on `paths` (sys.path by default)."""
+    versions = {}
+    for dist in metadata.distributions(**({"path": paths} if paths is not None else {})):
+        name = dist.metadata["Name"]
+        if name:
+            versions.setdefault(canonicalize_name(name), dist.version)
+    return versions
+
+
+def _satisfies(requirement: Requirement, version: Optional[str]) -> bool:
+    if version is None:
+        return False
+    return not requirement.specifier or requirement.specifier.contains(version, prereleases=True)
+
+
+def _run(args: List[str], deadline: float, job) -> str:
+    """Run pip until `deadline` (monotonic); returns stderr, raises PackageError on failure."""
+    proc = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if job:
+        job.track(proc)
+    try:
+        _, stderr = proc.communicate(timeout=max(0.0, deadline - time.monotonic()))
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.communicate()
+        raise TimeoutError
+    finally:
+        if job:
+            job.untrack(proc)
+    if proc.returncode != 0:
+        raise PackageError(stderr.strip()[-2000:] or f"pip exited with code {proc.returncode}")
+    return stderr
+
+
+class PackageManager:
+    """
+    Installs packages for quiz chains without touching the shared interpreter.
+
+    Each job gets an overlay venv (<workdir>/.venv, created with
+    --system-site-packages) that run_code puts ahead of the system
+    site-packages. Installs into it are always offline, from a local
+    wheelhouse that the image build fills and that missing packages are
+    fetched into (unless PACKAGE_OFFLINE); two chains asking for the same
+    missing package share one fetch. A registry of what is installed, in
+    the system and in each overlay, answers repeated requests without
+    starting pip.
+    """
+
+    def __init__(self, wheelhouse: Path = PACKAGE_WHEELHOUSE, offline: bool = PACKAGE_OFFLINE):
+        self.wheelhouse = Path(wheelhouse)
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._system: Optional[Dict[str, str]] = None
+        self._overlays: Dict[Path, Dict[str, str]] = {}
+        self._overlay_locks: Dict[Path, threading.Lock] = {}
+        self._fetches: Dict[str, Future] = {}
+
+    def installed(self, cwd: Path) -> Dict[str, str]:
+        """Canonical name -> version visible to snippets running in `cwd`."""
+        with self._lock:
+            if self._system is None:
+                self._system = _versions()
+            versions = dict(self._system)
+            overlay = self._overlays.get(Path(cwd).resolve())
+        if overlay is None:
+            paths = overlay_paths(cwd)
+            overlay = _versions(paths) if paths else {}
+            with self._lock:
+                self._overlays[Path(cwd).resolve()] = overlay
+        versions.update(overlay)
+        return versions
+
+    def forget(self, cwd: Path):
+        """Drop the registry entry of a job's overlay (when its workdir goes away)."""
+        with self._lock:
+            self._overlays.pop(Path(cwd).resolve(), None)
+            self._overlay_locks.pop(Path(cwd).resolve(), None)
+
+    def wheels(self) -> Dict[str, List[str]]:
+        """Canonical name -> versions of the wheels in the wheelhouse."""
+        found = {}
+        for path in self.wheelhouse.glob("*.whl"):
+            try:
+                name, version, _, _ = parse_wheel_filename(path.name)
+            except InvalidWheelFilename:
+                continue
+            found.setdefault(name, []).append(str(version))
+        return found
+
+    def install(self, packages: List[str], cwd: Path, timeout: float = PACKAGE_TIMEOUT, job=None) -> str:
+        """Make `packages` importable for snippets in `cwd`; returns a message for the agent."""
+        requirements = parse_requirements(packages)
+        names = ", ".join(str(r) for r in requirements)
+        versions = self.installed(cwd)
+        missing = [r for r in requirements if not _satisfies(r, versions.get(canonicalize_name(r.name)))]
+        if not missing:
+            logger.info(f"✓ Already installed: {names}")
+            return f"Already installed: {names}"
+
+        deadline = time.monotonic() + timeout
+        try:
+            self._fetch(missing, deadline, job)
+            self._install(missing, Path(cwd), deadline, job)
+        except TimeoutError:
+            raise PackageError(f"timed out after {timeout:g}s")
+        logger.info(f"✓ Installed into {Path(cwd) / OVERLAY_DIR}: {', '.join(str(r) for r in missing)}")
+        return f"Successfully installed: {names}"
+
+    def _fetch(self, requirements: List[Requirement], deadline: float, job):
+        """Make sure the wheelhouse has wheels for `requirements`; joins fetches already under way."""
+        wheels = self.wheels()
+        absent = [
+            r for r in requirements
+            if not any(_satisfies(r, v) for v in wheels.get(canonicalize_name(r.name), []))
+        ]
+        if not absent:
+            return
+        if self.offline:
+            raise PackageError(
+                f"Not in the local wheelhouse (offline mode): {', '.join(str(r) for r in absent)}"
+            )
+
+        own = Future()
+        mine, joined = [], []
+        with self._lock:
+            for requirement in absent:
+                key = str(requirement)
+                if key in self._fetches:
+                    joined.append(self._fetches[key])
+                else:
+                    self._fetches[key] = own
+                    mine.append(requirement)
+
+        if mine:
+            logger.info(f"Fetching into the wheelhouse: {', '.join(str(r) for r in mine)}")
+            try:
+                self.wheelhouse.mkdir(parents=True, exist_ok=True)
+                _run(
+                    PIP + ["wheel", "--quiet", "--wheel-dir", str(self.wheelhouse),
+                           "--find-links", str(self.wheelhouse)] + [str(r) for r in mine],
+                    deadline, job,
+                )
+                own.set_result(None)
+            except BaseException as e:
+                own.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    for requirement in mine:
+                        self._fetches.pop(str(requirement), None)
+        for fetch in set(joined):
+            logger.info("Waiting for another chain's fetch of the same package")
+            try:
+                fetch.result(timeout=max(0.0, deadline - time.monotonic()))
+            except TimeoutError:
+                raise
+            except Exception as e:
+                raise PackageError(f"Fetching failed: {e}")
+
+    def _install(self, requirements: List[Requirement], cwd: Path, deadline: float, job):
+        """Install from the wheelhouse into the job's overlay venv, one install per overlay at a time."""
+        key = cwd.resolve()
+        with self._lock:
+            lock = self._overlay_locks.setdefault(key, threading.Lock())
+        if not lock.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise TimeoutError
+        try:
+            venv = cwd / OVERLAY_DIR
+            if not (venv / "pyvenv.cfg").exists():
+                _run([sys.executable, "-m", "venv", "--without-pip", "--system-site-packages", str(venv)],
+                     deadline, job)
+                if job:
+                    job.on_close(partial(self.forget, cwd))
+            _run(
+                PIP + ["--python", str(venv / "bin" / "python"), "install", "--quiet", "--no-index",
+                       "--find-links", str(self.wheelhouse)] + [str(r) for r in requirements],
+                deadline, job,
+            )
+            overlay = _versions(overlay_paths(cwd))
+            with self._lock:
+                self._overlays[key] = overlay
+        finally:
+            lock.release()
+
+
+package_manager = PackageManager()
@@ -0,0 +1,302 @@
+"""Background prefetch of the files and pages a scraped page links to."""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Optional
+from urllib.parse import urldefrag, urlsplit
+
+import httpx
+
+from config import (
+    PREFETCH_ENABLED,
+    PREFETCH_WORKERS,
+    PREFETCH_MAX_MB,
+    PREFETCH_MAX_FILES,
+    PREFETCH_MAX_PAGES,
+    PREFETCH_FRESH_SECONDS,
+    PREFETCH_WAIT,
+)
+from . import http_client
+from .context import current_job
+from .deadline import current_deadline, tool_timeout
+from .download_cache import download_cache, chunk_size
+from .transfer import content_length
+
+logger = logging.getLogger(__name__)
+
+FILE_EXTENSIONS = {
+    ".csv", ".tsv", ".json", ".jsonl", ".xml", ".txt", ".pdf", ".zip", ".gz", ".tgz", ".tar",
+    ".xlsx", ".xls", ".parquet", ".mp3", ".wav", ".opus", ".ogg", ".m4a", ".flac",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".svg",
+}
+PAGE_EXTENSIONS = {"", ".html", ".htm", ".php", ".asp", ".aspx"}
+
+
+class _Abandoned(Exception):
+    """The chain that wanted this prefetch has ended, or the body is too large."""
+
+
+class _Scope:
+    """Prefetches started on behalf of one chain, cancelled together when it ends."""
+
+    def __init__(self):
+        self.ended = threading.Event()
+        self.futures = set()
+
+
+def _linked(url: str, page: dict) -> tuple:
+    """(file URLs, same-origin page URLs) that the parsed page at `url` links to."""
+    origin = urlsplit(url).netloc
+    files, pages = [], []
+    hrefs = [href for href, _ in page["links"]] + [src for _, src, _ in page["media"]]
+    for href in dict.fromkeys(urldefrag(href)[0] for href in hrefs):
+        parts = urlsplit(href)
+        if parts.scheme not in ("http", "https") or href == url:
+            continue
+        extension = os.path.splitext(parts.path)[1].lower()
+        if extension in FILE_EXTENSIONS:
+            files.append(href)
+        elif extension in PAGE_EXTENSIONS and parts.netloc == origin:
+            pages.append(href)
+    return files, pages
+
+
+def _within(deadline, fn, *args):
+    """Run `fn` under the question deadline of the chain that scheduled it."""
+    token = current_deadline.set(deadline)
+    try:
+        return fn(*args)
+    finally:
+        current_deadline.reset(token)
+
+
+class Prefetcher:
+    """
+    Fetches what a scraped page links to while the agent decides what to do.
+
+    Linked files go into the download cache and same-origin pages into a
+    short-lived page store, so the download_file or scrape_page call that
+    usually follows finds them ready. A tool asking for a URL that is still
+    being prefetched waits for it instead of fetching it twice. Work is
+    bounded by a small thread pool and per-page limits, large files are
+    skipped, and everything a chain started is cancelled when it ends.
+    """
+
+    def __init__(self, workers: int = PREFETCH_WORKERS, max_bytes: int = PREFETCH_MAX_MB * 1024 * 1024):
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._fresh_files: Dict[str, float] = {}
+        self._pages: Dict[str, tuple] = {}
+        self._scopes: Dict[str, _Scope] = {}
+        self._global_scope = _Scope()
+        self.metrics = Counter()
+
+    def _count(self, **deltas):
+        with self._lock:
+            self.metrics.update(deltas)
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prefetch")
+            return self._pool
+
+    def _scope(self) -> _Scope:
+        job = current_job.get()
+        if job is None:
+            return self._global_scope
+        with self._lock:
+            scope = self._scopes.get(job.job_id)
+            if scope is None:
+                scope = self._scopes[job.job_id] = _Scope()
+                job.on_close(lambda: self._end(job.job_id))
+        return scope
+
+    def _end(self, job_id: str):
+        with self._lock:
+            scope = self._scopes.pop(job_id, None)
+        if scope is None:
+            return
+        scope.ended.set()
+        cancelled = sum(future.cancel() for future in list(scope.futures))
+        if cancelled:
+            self._count(cancelled=cancelled)
+
+    # --- Scheduling ---------------------------------------------------------
+
+    def schedule(self, url: str, page: dict, fetch_page: Callable[[str], Optional[str]]):
+        """
+        Start prefetching what `page` (`parse_page` of the page at `url`) links to.
+
+        The fetches are registered before this returns, so a tool call right
+        after the scrape joins them instead of fetching the same URL again.
+        """
+        if not PREFETCH_ENABLED:
+            return
+        scope = self._scope()
+        if scope.ended.is_set():
+            return
+        files, pages = _linked(url, page)
+        for href in files[:PREFETCH_MAX_FILES]:
+            if not self.file_is_fresh(href) and self._submit(scope, href, self._fetch_file, href, scope):
+                self._count(files_scheduled=1)
+        for href in pages[:PREFETCH_MAX_PAGES]:
+            if href not in self._pages and self._submit(scope, href, self._fetch_page, href, fetch_page, scope):
+                self._count(pages_scheduled=1)
+        skipped = max(0, len(files) - PREFETCH_MAX_FILES) + max(0, len(pages) - PREFETCH_MAX_PAGES)
+        if skipped:
+            self._count(skipped_over_limit=skipped)
+
+    def _submit(self, scope: _Scope, key: str, fn, *args) -> bool:
+        executor = self._executor()
+        with self._lock:
+            if key in self._inflight:
+                return False
+            future = executor.submit(_within, current_deadline.get(), fn, *args)
+            self._inflight[key] = future
+            scope.futures.add(future)
+
+        def done(finished: Future):
+            with self._lock:
+                if self._inflight.get(key) is finished:
+                    del self._inflight[key]
+            scope.futures.discard(finished)
+
+        future.add_done_callback(done)
+        return True
+
+    # --- Fetching -----------------------------------------------------------
+
+    def _fetch_file(self, url: str, scope: _Scope):
+        entry = download_cache.lookup(url)
+        headers = download_cache.revalidation_headers(entry)
+        start = time.perf_counter()
+        try:
+            with http_client.stream("GET", url, timeout=tool_timeout(30), headers=headers) as response:
+                if entry and response.status_code == 304:
+                    self._mark_fresh(url)
+                    return
+                if response.status_code >= 400:
+                    self._count(errors=1)
+                    return
+                length = content_length(response.headers)
+                if length is not None and length > self.max_bytes:
+                    raise _Abandoned(f"{length} bytes is over the prefetch limit")
+
+                pending = download_cache.begin()
+                try:
+                    for chunk in response.iter_bytes(chunk_size(length)):
+                        if scope.ended.is_set():
+                            raise _Abandoned("chain ended")
+                        pending.write(chunk)
+                        if pending.size > self.max_bytes:
+                            raise _Abandoned(f"more than {self.max_bytes} bytes")
+                except BaseException:
+                    pending.discard()
+                    raise
+                download_cache.store(url, pending, response.headers, None, time.perf_counter() - start)
+            self._mark_fresh(url)
+            self._count(files=1, bytes=pending.size)
+            logger.info(f"✓ Prefetched {url} ({pending.size} bytes)")
+        except _Abandoned as e:
+            self._count(abandoned=1)
+            logger.info(f"Prefetch of {url} abandoned: {e}")
+        except httpx.HTTPError as e:
+            self._count(errors=1)
+            logger.info(f"Prefetch of {url} failed: {e}")
+
+    def _fetch_page(self, url: str, fetch_page, scope: _Scope):
+        # Only the plain HTTP tier: a speculative fetch is not worth a browser
+        content = fetch_page(url)
+        if content is None or scope.ended.is_set():
+            return
+        now = time.monotonic()
+        with self._lock:
+            for stale in [key for key, (expires, _) in self._pages.items() if expires < now]:
+                del self._pages[stale]
+            self._pages[url] = (now + PREFETCH_FRESH_SECONDS, content)
+        self._count(pages=1)
+
+    def _mark_fresh(self, url: str):
+        with self._lock:
+            self._fresh_files[url] = time.monotonic() + PREFETCH_FRESH_SECONDS
+
+    # --- Lookups from the tools ---------------------------------------------
+
+    def _pending(self, url: str) -> Optional[Future]:
+        with self._lock:
+            return self._inflight.get(url)
+
+    def wait(self, url: str, timeout: float = PREFETCH_WAIT):
+        """Block until an in-flight prefetch of `url` (if any) is done."""
+        future = self._pending(url)
+        if future is None:
+            return
+        self._count(joined=1)
+        try:
+            future.result(timeout=timeout)
+        except (FutureTimeout, CancelledError):
+            pass
+
+    async def await_inflight(self, url: str, timeout: float = PREFETCH_WAIT):
+        """Async `wait`."""
+        future = self._pending(url)
+        if future is None:
+            return
+        self._count(joined=1)
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError, CancelledError):
+            pass
+
+    def file_is_fresh(self, url: str) -> bool:
+        """Whether the cached copy of `url` was (re)validated by a prefetch moments ago."""
+        with self._lock:
+            expires = self._fresh_files.get(url)
+            if expires is not None and expires < time.monotonic():
+                del self._fresh_files[url]
+                expires = None
+        return expires is not None
+
+    def use_file(self, url: str) -> bool:
+        """`file_is_fresh`, counted as a prefetch hit when true."""
+        fresh = self.file_is_fresh(url)
+        if fresh:
+            self._count(file_hits=1)
+        return fresh
+
+    def take_page(self, url: str) -> Optional[str]:
+        """A prefetched copy of the page at `url` if still fresh (used once)."""
+        with self._lock:
+            expires, content = self._pages.pop(url, (0, None))
+        if content is None or expires < time.monotonic():
+            return None
+        self._count(page_hits=1)
+        return content
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.metrics)
+            stats["inflight"] = len(self._inflight)
+            stats["pages_stored"] = len(self._pages)
+        stats["enabled"] = PREFETCH_ENABLED
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+            scopes = list(self._scopes)
+        for job_id in scopes:
+            self._end(job_id)
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+prefetcher = Prefetcher()
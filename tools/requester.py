@@ -1,14 +1,115 @@
 """HTTP POST request tool for quiz submission."""
+import asyncio
 import logging
 import json
-from typing import Dict, Any
-import requests
+from typing import Any, Dict, Optional
+import httpx
 from langchain_core.tools import tool
+from config import QUESTION_TIME_LIMIT
+from . import http_client
+from .deadline import question_deadline
+from .submissions import submission_log
+from .tracing import SUBMISSIONS, current_span, traced
 
 logger = logging.getLogger(__name__)
 
 
+MAX_LISTED_REJECTIONS = 10
+
+
+def _repeated(url: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Verdict for an answer already rejected for this question, without posting it again."""
+    attempt = submission_log.duplicate(url, payload)
+    if attempt is None:
+        return None
+    current_span().set(duplicate=True)
+    logger.warning(f"Answer {attempt.answer} was already rejected for {submission_log.question(payload)}, not resending")
+    data = {
+        "correct": False,
+        "reason": f"This answer was already submitted and judged wrong ({attempt.reason}); it was not sent again",
+        "duplicate": True,
+    }
+    deadline = question_deadline()
+    if attempt.next_url and not deadline.worth_retrying():
+        # No time for a different answer: move on as the server's verdict allowed
+        logger.warning(f"Too little time left for another answer - moving on to {attempt.next_url}")
+        data["url"] = attempt.next_url
+        deadline.begin(attempt.next_url)
+    return data
+
+
+def _verdict(data: Dict[str, Any], url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Record the server's verdict, then shape it for the agent."""
+    rejected = [] if data.get("correct") else submission_log.rejected(url, submission_log.question(payload))
+    submission_log.record(url, payload, data)
+    data = _apply_retry_policy(data, url, payload)
+    if rejected and not data.get("url"):
+        # Answers tried before this one, so the agent does not go back to them
+        data["rejected_before"] = rejected[-MAX_LISTED_REJECTIONS:]
+    return data
+
+
+def _server_delay(data: Dict[str, Any]) -> Optional[float]:
+    """Seconds the server counts for this question; None when it sent no usable number."""
+    delay = data.get("delay")
+    if isinstance(delay, bool) or not isinstance(delay, (int, float)):
+        return None
+    return delay
+
+
+def _apply_retry_policy(data: Dict[str, Any], url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape the server verdict so the agent retries or moves on."""
+    # Extract key fields
+    correct = data.get("correct", False)
+    delay = _server_delay(data)
+    current_span().set(correct=bool(correct), delay=delay)
+    SUBMISSIONS.inc(correct=str(bool(correct)).lower())
+    deadline = question_deadline()
+    # Without the server's count the local clock decides
+    deadline.submitted(url, payload, bool(correct), delay)
+    expired = delay is not None and delay >= QUESTION_TIME_LIMIT
+    used = "no delay reported" if delay is None else f"{delay}s"
+    
+    # Smart retry logic
+    if not correct and not expired and "url" in data:
+        if deadline.worth_retrying():
+            # Wrong answer but time left - remove URL to force retry
+            logger.info(f"Wrong answer, time left ({used}) - will retry")
+            del data["url"]
+        else:
+            # Another attempt could not land in time - take the next question
+            logger.warning(f"Wrong answer, too little time left ({used}) for a retry - moving on")
+    
+    if expired:
+        # Time limit exceeded - only keep URL to move on
+        logger.warning(f"Time limit exceeded ({delay}s) - moving to next question")
+        data = {"url": data.get("url")}
+    
+    if data.get("url"):
+        deadline.begin(data["url"])
+    logger.info(f"Response: {json.dumps(data, indent=2)}")
+    return data
+
+
+def _log_post(url: str, payload: Dict[str, Any]):
+    logger.info(f"Sending POST to {url}")
+    logger.debug(f"Payload: {json.dumps(payload, indent=2)}")
+
+
+def _failed(e: Exception) -> Dict[str, Any]:
+    """Tool result for a POST that got no verdict: the server's error body if it sent one."""
+    if isinstance(e, httpx.HTTPStatusError):
+        logger.error(f"HTTP error: {e}")
+        try:
+            return e.response.json()
+        except ValueError:
+            return {"error": e.response.text}
+    logger.error(f"Request failed: {e}")
+    return {"error": str(e)}
+
+
 @tool
+@traced("send_post")
 def send_post(url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
     """
     Send a POST request with JSON payload to submit quiz answers.
@@ -24,49 +125,40 @@ def send_post(url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
     Returns:
         Server response as dictionary
     """
-    logger.info(f"Sending POST to {url}")
-    logger.debug(f"Payload: {json.dumps(payload, indent=2)}")
+    _log_post(url, payload)
     
     try:
-        headers = {"Content-Type": "application/json"}
-        response = requests.post(
-            url,
-            json=payload,
-            headers=headers,
-            timeout=30
-        )
-        
-        response.raise_for_status()
-        data = response.json()
-        
-        # Extract key fields
-        correct = data.get("correct", False)
-        delay = data.get("delay", 0)
-        delay = delay if isinstance(delay, (int, float)) else 0
+        repeated = _repeated(url, payload)
+        if repeated is not None:
+            return repeated
         
-        # Smart retry logic
-        if not correct and delay < 180:
-            # Wrong answer but time left - remove URL to force retry
-            if "url" in data:
-                logger.info(f"Wrong answer, time left ({delay}s) - will retry")
-                del data["url"]
+        # Never retried once the request may have reached the server
+        response = http_client.request("POST", url, json=payload, timeout=30)
         
-        if delay >= 180:
-            # Time limit exceeded - only keep URL to move on
-            logger.warning(f"Time limit exceeded ({delay}s) - moving to next question")
-            data = {"url": data.get("url")}
+        response.raise_for_status()
+        return _verdict(response.json(), url, payload)
         
-        logger.info(f"Response: {json.dumps(data, indent=2)}")
-        return data
+    except Exception as e:
+        return _failed(e)
+
+
+@traced("send_post")
+async def _asend_post(url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Async variant of send_post."""
+    _log_post(url, payload)
+    
+    try:
+        # The submission log is SQLite: keep it off the event loop
+        repeated = await asyncio.to_thread(_repeated, url, payload)
+        if repeated is not None:
+            return repeated
         
-    except requests.HTTPError as e:
-        logger.error(f"HTTP error: {e}")
-        try:
-            error_data = e.response.json()
-        except:
-            error_data = {"error": e.response.text}
-        return error_data
+        response = await http_client.arequest("POST", url, json=payload, timeout=30)
+        response.raise_for_status()
+        return await asyncio.to_thread(_verdict, response.json(), url, payload)
     
     except Exception as e:
-        logger.error(f"Request failed: {e}")
-        return {"error": str(e)}
+        return _failed(e)
+
+
+send_post.coroutine = _asend_post
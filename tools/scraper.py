@@ -1,49 +1,291 @@
-"""Playwright-based web scraper for JavaScript-rendered pages."""
+"""Web scraper with a plain HTTP fast path and Playwright for JavaScript-rendered pages."""
 import logging
+import re
+import threading
+import time
+from collections import Counter
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
 from langchain_core.tools import tool
+from playwright.async_api import async_playwright, TimeoutError as AsyncPlaywrightTimeout
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
 
+from config import SCRAPE_HTTP_FIRST, SCRAPE_MIN_TEXT_CHARS, SCRAPE_BROWSER_AFTER, SCRAPE_BROWSER_TTL
+from .browser import browser_pool, async_browser_pool
+from .deadline import question_deadline, tool_timeout
+from .extractor import extract_page, looks_like_html, parse_page, save_raw
+from .prefetch import prefetcher
+from . import http_client
+from .tracing import current_span, span, traced
+
 logger = logging.getLogger(__name__)
 
+HTTP_TIER = "http"
+BROWSER_TIER = "browser"
+
+# Signs that the served HTML is only a shell that a script fills in
+_JS_MARKERS = re.compile(
+    r"<noscript|atob\s*\(|\.innerHTML\s*=|document\.write\s*\(|"
+    r"insertAdjacentHTML|fetch\s*\(|XMLHttpRequest",
+    re.IGNORECASE,
+)
+_SCRIPT_OR_STYLE = re.compile(r"<(script|style)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_TAG = re.compile(r"<[^>]+>")
+_NUMERIC_SEGMENT = re.compile(r"\d+")
+
+# (host, path pattern) -> (tier that worked last time, monotonic time a browser pin ends)
+_tier_memory = {}
+# (host, path pattern) -> HTTP-tier failures in a row
+_http_failures = Counter()
+_tier_stats = Counter()
+_lock = threading.Lock()
+
+
+def _route_key(url: str) -> tuple:
+    """Group URLs of the same quiz origin: digits in the path are wildcards."""
+    parts = urlsplit(url)
+    return parts.netloc, _NUMERIC_SEGMENT.sub("#", parts.path.rstrip("/"))
+
+
+def needs_js(html: str) -> bool:
+    """Heuristic: does this HTML need a browser to show its real content?"""
+    if _JS_MARKERS.search(html):
+        return True
+    visible = _TAG.sub(" ", _SCRIPT_OR_STYLE.sub(" ", html))
+    return len(" ".join(visible.split())) < SCRAPE_MIN_TEXT_CHARS
+
+
+def get_tier_stats() -> dict:
+    """Counters for how scrape_page calls were served."""
+    with _lock:
+        stats = dict(_tier_stats)
+        stats["remembered_routes"] = len(_tier_memory)
+    total = stats.get(HTTP_TIER, 0) + stats.get(BROWSER_TIER, 0)
+    stats["http_hit_rate"] = round(stats.get(HTTP_TIER, 0) / total, 3) if total else 0.0
+    return stats
+
+
+def _pinned(key: tuple) -> bool:
+    """Whether the route currently skips HTTP; call with `_lock` held."""
+    tier, until = _tier_memory.get(key, (None, None))
+    return tier == BROWSER_TIER and until > time.monotonic()
+
+
+def _remember(key: tuple, tier: str):
+    with _lock:
+        _tier_stats[tier] += 1
+        if tier == HTTP_TIER:
+            _http_failures.pop(key, None)
+            _tier_memory[key] = (HTTP_TIER, None)
+        elif _http_failures[key] >= SCRAPE_BROWSER_AFTER and not _pinned(key):
+            # One timeout or 5xx is not enough to give up on HTTP, and never for good:
+            # calls served during the pin leave it as is, so HTTP gets a try when it ends
+            _tier_memory[key] = (BROWSER_TIER, time.monotonic() + SCRAPE_BROWSER_TTL)
+
+
+def _plan(url: str) -> tuple:
+    """Route key of `url` and whether the HTTP tier should be tried first."""
+    key = _route_key(url)
+    with _lock:
+        pinned = _pinned(key)
+    return key, SCRAPE_HTTP_FIRST and not pinned
+
+
+def _settle(key: tuple, content: Optional[str]) -> Optional[str]:
+    """Record the outcome of the HTTP tier."""
+    if content is not None:
+        _remember(key, HTTP_TIER)
+    else:
+        with _lock:
+            _tier_stats["escalated"] += 1
+            _http_failures[key] += 1
+    return content
+
+
+def _prefetched(url: str) -> Optional[str]:
+    """The page if a prefetch already fetched it."""
+    content = prefetcher.take_page(url)
+    if content is not None:
+        current_span().set(tier="prefetch", page_bytes=len(content))
+    return content
+
+
+def _served(content: str, tier: str) -> str:
+    current_span().set(tier=tier, page_bytes=len(content))
+    return content
+
+
+def _present(url: str, content: str) -> str:
+    """Save the raw page and build the compact version handed to the agent."""
+    raw_path = save_raw(url, content)
+    page = parse_page(content, url) if looks_like_html(content) else None
+    summary = extract_page(content, url, page=page)
+    logger.info(f"✓ Scraped {len(content)} chars from {url} ({len(summary)} chars to agent)")
+    if page is not None:
+        # Fetch the linked files and pages while the agent reads the summary
+        prefetcher.schedule(url, page, _fetch_http)
+    return f"{summary}\n\nRAW_HTML: {raw_path} (full page source, open it with run_code if something is missing)"
+
+
+def _usable(status_code: int, content_type: str, text: str) -> Optional[str]:
+    """The HTTP body if it can be used without a browser, else None."""
+    if status_code >= 400:
+        return None
+    if "html" not in content_type:
+        # Non-HTML bodies (JSON APIs, plain text) need no rendering
+        return text
+    return None if needs_js(text) else text
+
+
+def _fetch_http(url: str) -> Optional[str]:
+    """Plain GET; returns None when the response is not usable HTML."""
+    try:
+        response = http_client.request("GET", url, timeout=tool_timeout(15))
+    except httpx.HTTPError as e:
+        return _unreachable(url, e)
+    return _usable(response.status_code, response.headers.get("Content-Type", ""), response.text)
+
+
+async def _afetch_http(url: str) -> Optional[str]:
+    try:
+        response = await http_client.arequest("GET", url, timeout=tool_timeout(15))
+    except httpx.HTTPError as e:
+        return _unreachable(url, e)
+    return _usable(response.status_code, response.headers.get("Content-Type", ""), response.text)
+
+
+def _unreachable(url: str, error: httpx.HTTPError) -> None:
+    logger.info(f"HTTP fetch failed for {url}, escalating: {error}")
+    return None
+
+
+def _render(page, url: str) -> str:
+    """Load a page, wait for the network to be idle and return its HTML."""
+    page.goto(url, wait_until="networkidle", timeout=tool_timeout(30) * 1000)
+    return page.content()
+
+
+async def _arender(page, url: str) -> str:
+    await page.goto(url, wait_until="networkidle", timeout=tool_timeout(30) * 1000)
+    return await page.content()
+
+
+async def _afetch_browser(url: str) -> str:
+    if async_browser_pool.running:
+        return await async_browser_pool.run(lambda page: _arender(page, url))
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        try:
+            return await _arender(await browser.new_page(), url)
+        finally:
+            await browser.close()
+
+
+def _fetch_browser(url: str) -> str:
+    if browser_pool.running:
+        return browser_pool.run(lambda page: _render(page, url))
+
+    # No pool (e.g. tools used outside the server) - one-off browser
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        try:
+            return _render(browser.new_page(), url)
+        finally:
+            # Closing the browser closes its context and page, also after a failed load
+            browser.close()
+
+
+def fetch_page(url: str) -> str:
+    """Page source from the cheapest tier that serves it in full (HTTP, else the browser)."""
+    question_deadline().scraped(url)
+    prefetcher.wait(url)
+    content = _prefetched(url)
+    if content is not None:
+        return content
+
+    key, try_http = _plan(url)
+    if try_http:
+        with span("scrape.http"):
+            content = _settle(key, _fetch_http(url))
+        if content is not None:
+            return _served(content, HTTP_TIER)
+
+    with span("scrape.browser"):
+        content = _fetch_browser(url)
+    _remember(key, BROWSER_TIER)
+    return _served(content, BROWSER_TIER)
+
+
+async def afetch_page(url: str) -> str:
+    """Async `fetch_page` (httpx + async Playwright)."""
+    question_deadline().scraped(url)
+    await prefetcher.await_inflight(url)
+    content = _prefetched(url)
+    if content is not None:
+        return content
+
+    key, try_http = _plan(url)
+    if try_http:
+        with span("scrape.http"):
+            content = _settle(key, await _afetch_http(url))
+        if content is not None:
+            return _served(content, HTTP_TIER)
+
+    with span("scrape.browser"):
+        content = await _afetch_browser(url)
+    _remember(key, BROWSER_TIER)
+    return _served(content, BROWSER_TIER)
+
+
+def _failed(url: str, e: Exception) -> str:
+    if isinstance(e, (PlaywrightTimeout, AsyncPlaywrightTimeout)):
+        logger.error(f"Timeout loading {url}")
+        return f"Error: Page load timeout for {url}"
+    logger.error(f"Scraping error: {e}")
+    return f"Error scraping page: {str(e)}"
+
 
 @tool
+@traced("scrape_page")
 def scrape_page(url: str) -> str:
     """
-    Fetch and render a webpage using Playwright.
-    
-    This handles JavaScript-rendered pages by loading them in a headless browser.
-    
+    Fetch and render a webpage.
+
+    Static pages are fetched with a plain HTTP request; pages that need
+    JavaScript are loaded in a headless browser.
+
     IMPORTANT: Only use this for HTML pages. For direct file downloads
     (URLs ending in .pdf, .csv, .zip, etc.), use download_file instead.
-    
+
     Args:
         url: The webpage URL to scrape
-        
+
     Returns:
-        The fully rendered HTML content
+        Compact page content: visible text, absolute links, forms, tables
+        as CSV and media URLs, plus the path of the saved raw HTML
     """
     logger.info(f"Scraping page: {url}")
-    
+
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            
-            # Load page and wait for network to be idle
-            page.goto(url, wait_until="networkidle", timeout=30000)
-            
-            # Get rendered HTML
-            content = page.content()
-            
-            browser.close()
-            
-            logger.info(f"✓ Scraped {len(content)} chars from {url}")
-            return content
-            
-    except PlaywrightTimeout:
-        logger.error(f"Timeout loading {url}")
-        return f"Error: Page load timeout for {url}"
-    
+        return _present(url, fetch_page(url))
+
     except Exception as e:
-        logger.error(f"Scraping error: {e}")
-        return f"Error scraping page: {str(e)}"
+        return _failed(url, e)
+
+
+@traced("scrape_page")
+async def _ascrape_page(url: str) -> str:
+    """Async variant of scrape_page (httpx + async Playwright)."""
+    logger.info(f"Scraping page: {url}")
+
+    try:
+        return _present(url, await afetch_page(url))
+
+    except Exception as e:
+        return _failed(url, e)
+
+
+scrape_page.coroutine = _ascrape_page
@@ -0,0 +1,180 @@
+"""Answers submitted per question and their verdicts, kept on disk across restarts."""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import SUBMISSION_LOG, SUBMISSION_LOG_PATH, SUBMISSION_LOG_TTL, SUBMISSION_REPLAY
+from .context import current_job
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_CHARS = 200  # Wrong answers are kept only this long; correct ones whole, to replay them
+
+_SCHEMA = """
+DROP TABLE IF EXISTS attempts; -- verdicts not yet scoped to a chain
+CREATE TABLE IF NOT EXISTS verdicts (
+    chain TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    question TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    correct INTEGER NOT NULL,
+    reason TEXT,
+    next_url TEXT,
+    submitted REAL NOT NULL,
+    PRIMARY KEY (chain, endpoint, question, digest)
+) WITHOUT ROWID;
+"""
+
+
+@dataclass
+class Attempt:
+    answer: str  # canonical JSON (a preview for wrong answers)
+    correct: bool
+    reason: Optional[str]
+    next_url: Optional[str]
+
+
+def canonical(answer: Any) -> str:
+    """The answer as compact JSON with sorted keys: the same value always compares alike."""
+    return json.dumps(answer, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+
+def _chain() -> str:
+    """The running job's id: verdicts belong to the chain that got them (and to its resumptions)."""
+    job = current_job.get()
+    return job.job_id if job else ""
+
+
+class SubmissionLog:
+    """
+    Verdicts of submitted answers, keyed by chain (job id), submit
+    endpoint, question (the payload's "url") and answer.
+
+    send_post asks it before posting: an answer the chain already got
+    judged wrong for the question is not sent again. The solvers' fast path
+    asks it for an answer already judged correct, so a resumed chain
+    replays it without solving; answers accepted in other chains are only
+    replayed with `replay_across_chains`, as a re-run quiz may serve new
+    data at the same URLs. Rows live in SQLite (WAL, so worker processes
+    can share it) and expire after SUBMISSION_LOG_TTL; path=None keeps them
+    in memory.
+    """
+
+    def __init__(self, path: Optional[Path] = SUBMISSION_LOG_PATH, enabled: bool = SUBMISSION_LOG,
+                 ttl: float = SUBMISSION_LOG_TTL, replay_across_chains: bool = SUBMISSION_REPLAY):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.replay_across_chains = replay_across_chains
+        self._lock = threading.Lock()
+        self.metrics = {"recorded": 0, "duplicates": 0, "replayed": 0}
+        if path is None:
+            self._db = sqlite3.connect(":memory:", check_same_thread=False)
+        else:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+        with self._lock:
+            self._db.executescript(_SCHEMA)
+            self._db.execute("DELETE FROM verdicts WHERE submitted < ?", (time.time() - ttl,))
+            self._db.commit()
+
+    @staticmethod
+    def question(payload: Dict[str, Any]) -> str:
+        return str(payload.get("url") or "") if isinstance(payload, dict) else ""
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self.metrics[key] += value
+
+    def lookup(self, endpoint: str, payload: Dict[str, Any]) -> Optional[Attempt]:
+        """The chain's earlier verdict on this exact answer to this question, if any."""
+        if not self.enabled or not isinstance(payload, dict) or "answer" not in payload:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT answer, correct, reason, next_url FROM verdicts "
+                "WHERE chain = ? AND endpoint = ? AND question = ? AND digest = ? AND submitted >= ?",
+                (_chain(), endpoint, self.question(payload), _digest(canonical(payload["answer"])),
+                 time.time() - self.ttl),
+            ).fetchone()
+        return Attempt(row[0], bool(row[1]), row[2], row[3]) if row else None
+
+    def duplicate(self, endpoint: str, payload: Dict[str, Any]) -> Optional[Attempt]:
+        """The earlier verdict if the chain already got this answer judged wrong (it must not be resent)."""
+        attempt = self.lookup(endpoint, payload)
+        if attempt is None or attempt.correct:
+            return None
+        self._count(duplicates=1)
+        return attempt
+
+    def record(self, endpoint: str, payload: Dict[str, Any], verdict: Dict[str, Any]):
+        """Remember the server's verdict on an answer (before any retry policy reshapes it)."""
+        if not self.enabled or not isinstance(payload, dict) or "answer" not in payload or "correct" not in verdict:
+            return
+        text = canonical(payload["answer"])
+        correct = bool(verdict.get("correct"))
+        next_url = verdict.get("url") if isinstance(verdict.get("url"), str) else None
+        reason = verdict.get("reason")
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO verdicts "
+                "(chain, endpoint, question, digest, answer, correct, reason, next_url, submitted) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (_chain(), endpoint, self.question(payload), _digest(text), text if correct else text[:PREVIEW_CHARS],
+                 int(correct), None if reason is None else str(reason)[:PREVIEW_CHARS], next_url, time.time()),
+            )
+            self._db.commit()
+            self.metrics["recorded"] += 1
+
+    def rejected(self, endpoint: str, question: str) -> List[str]:
+        """Answers (previews) the chain already got judged wrong for a question, oldest first."""
+        if not self.enabled:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT answer FROM verdicts "
+                "WHERE chain = ? AND endpoint = ? AND question = ? AND correct = 0 AND submitted >= ? "
+                "ORDER BY submitted",
+                (_chain(), endpoint, question, time.time() - self.ttl),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def correct_answer(self, endpoint: str, question: str) -> Optional[tuple]:
+        """(answer,) already judged correct for a question, for replaying it; None if there is none."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT answer FROM verdicts "
+                "WHERE (chain = ? OR ?) AND endpoint = ? AND question = ? AND correct = 1 AND submitted >= ? "
+                "ORDER BY submitted DESC LIMIT 1",
+                (_chain(), self.replay_across_chains, endpoint, question, time.time() - self.ttl),
+            ).fetchone()
+        if row is None:
+            return None
+        self._count(replayed=1)
+        return (json.loads(row[0]),)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.metrics)
+            questions, attempts, correct = self._db.execute(
+                "SELECT COUNT(DISTINCT endpoint || ' ' || question), COUNT(*), COALESCE(SUM(correct), 0) FROM verdicts"
+            ).fetchone()
+        stats.update(questions=questions, attempts=attempts, correct=correct, enabled=self.enabled)
+        return stats
+
+
+submission_log = SubmissionLog()
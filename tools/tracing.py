@@ -0,0 +1,302 @@
+"""Spans around agent steps and tools, Prometheus metrics and per-chain Chrome traces."""
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence
+
+from config import TRACE_EXPORT, TRACE_DIR, TRACE_MAX_SPANS
+from .context import current_job
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 180)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864, 268435456)
+TOKEN_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+
+
+# --- Metrics ----------------------------------------------------------------
+
+def _labels(names: Sequence[str], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Prometheus histogram with a fixed label set (cumulative buckets, sum and count)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # bucket counts..., sum, count
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self) -> list:
+        lines = []
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            for bound, count in zip(self.buckets, values):
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {values[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(values[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {values[-1]}")
+        return lines
+
+
+class Counter:
+    """Prometheus counter with a fixed label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in sorted(values.items())]
+
+
+class Gauge(Counter):
+    """Prometheus gauge; `set` replaces the value of one label combination."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+
+STEP_SECONDS = Histogram("quiz_step_seconds", "Duration of agent steps, tools and their stages", DURATION_BUCKETS, ("step",))
+STEP_BYTES = Histogram("quiz_step_bytes", "Bytes handled by a step (pages, downloads, tool output)", SIZE_BUCKETS, ("step",))
+STEP_ERRORS = Counter("quiz_step_errors_total", "Steps that raised", ("step",))
+LLM_TOKENS = Histogram("quiz_llm_tokens", "Tokens per LLM call", TOKEN_BUCKETS, ("kind",))
+SUBMISSIONS = Counter("quiz_submissions_total", "Answers submitted to quiz servers", ("correct",))
+JOBS = Gauge("quiz_jobs", "Quiz chains known to the job manager, by status", ("status",))
+TOOLS_SAVED = Counter("quiz_tool_saved_seconds_total", "Tool time saved by reused results and parallel calls", ("reason",))
+
+METRICS = [STEP_SECONDS, STEP_BYTES, STEP_ERRORS, LLM_TOKENS, SUBMISSIONS, JOBS, TOOLS_SAVED]
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+# --- Spans ------------------------------------------------------------------
+
+class Span:
+    """One timed step; `attrs` end up in the Chrome trace and feed the byte/token histograms."""
+
+    def __init__(self, name: str, parent: Optional["Span"], attrs: dict):
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.error = False
+        self.track = _track_id()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class _NoSpan:
+    """Stand-in returned by `current_span` outside any span, so callers needn't check."""
+
+    attrs = {}
+
+    def set(self, **attrs):
+        pass
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def _track_id() -> int:
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return id(task) if task is not None else threading.get_ident()
+
+
+class _JobTrace:
+    """Finished spans of one chain, written as a Chrome trace when it ends."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.spans = []
+        self.dropped = 0
+
+    def export(self):
+        tracks = {}
+        events = []
+        for span in self.spans:
+            tid = tracks.setdefault(span.track, len(tracks) + 1)
+            args = {key: value for key, value in span.attrs.items() if value is not None}
+            if span.error:
+                args["error"] = True
+            events.append({
+                "name": span.name,
+                "cat": span.name.split(".")[0],
+                "ph": "X",
+                "ts": int(span.wall_start * 1e6),
+                "dur": max(1, int(span.duration * 1e6)),
+                "pid": 1,
+                "tid": tid,
+                "args": args,
+            })
+        document = {"traceEvents": events, "displayTimeUnit": "ms",
+                    "otherData": {"job_id": self.job_id, "dropped_spans": self.dropped}}
+        TRACE_DIR.mkdir(parents=True, exist_ok=True)
+        path = TRACE_DIR / f"{self.job_id}.json"
+        path.write_text(json.dumps(document, default=str))
+        logger.info(f"✓ Trace of job {self.job_id} written to {path} ({len(events)} spans)")
+
+
+_traces: Dict[str, _JobTrace] = {}
+_traces_lock = threading.Lock()
+
+
+def _end_trace(job_id: str):
+    with _traces_lock:
+        trace = _traces.pop(job_id, None)
+    if trace is not None and trace.spans:
+        trace.export()
+
+
+def _collect(span: Span):
+    job = current_job.get()
+    if job is None or not TRACE_EXPORT:
+        return
+    with _traces_lock:
+        trace = _traces.get(job.job_id)
+        if trace is None:
+            trace = _traces[job.job_id] = _JobTrace(job.job_id)
+            job.on_close(lambda: _end_trace(job.job_id))
+        if len(trace.spans) < TRACE_MAX_SPANS:
+            trace.spans.append(span)
+        else:
+            trace.dropped += 1
+
+
+def _finish(span: Span):
+    STEP_SECONDS.observe(span.duration, step=span.name)
+    if span.error:
+        STEP_ERRORS.inc(step=span.name)
+    if span.attrs.get("bytes") is not None:
+        STEP_BYTES.observe(span.attrs["bytes"], step=span.name)
+    for kind in ("input", "output"):
+        if span.attrs.get(f"{kind}_tokens"):
+            LLM_TOKENS.observe(span.attrs[f"{kind}_tokens"], kind=kind)
+    _collect(span)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Time the enclosed block as step `name`.
+
+    Works in threads and coroutines alike (the current span is a
+    ContextVar). Durations go to quiz_step_seconds, a `bytes` attribute to
+    quiz_step_bytes and `input_tokens`/`output_tokens` to quiz_llm_tokens;
+    inside a chain with TRACE_EXPORT on, the span is kept for its trace.
+    """
+    current = Span(name, _current.get(), attrs)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException:
+        current.error = True
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.start
+        _current.reset(token)
+        _finish(current)
+
+
+def current_span():
+    """The innermost open span (a no-op stand-in outside of one)."""
+    return _current.get() or _NoSpan()
+
+
+def _size(result) -> Optional[int]:
+    if isinstance(result, (str, bytes)):
+        return len(result)
+    try:
+        return len(json.dumps(result, default=str))
+    except (TypeError, ValueError):
+        return None
+
+
+def traced(name: str):
+    """Run a tool function (sync or async) in a span; the size of its output is its `bytes`
+    unless the tool set them itself."""
+
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name) as current:
+                    result = await fn(*args, **kwargs)
+                    current.attrs.setdefault("bytes", _size(result))
+                    return result
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name) as current:
+                result = fn(*args, **kwargs)
+                current.attrs.setdefault("bytes", _size(result))
+                return result
+        return wrapper
+
+    return decorate
@@ -0,0 +1,337 @@
+"""Resumable and parallel (HTTP Range) transfers plus archive extraction for download_file."""
+import asyncio
+import gzip
+import logging
+import tarfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, ExitStack
+from contextvars import copy_context
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import httpx
+
+from config import DOWNLOAD_SEGMENTS, DOWNLOAD_PARALLEL_MIN_MB, DOWNLOAD_RESUME_RETRIES, DOWNLOAD_MAX_EXTRACT_MB
+from . import http_client
+from .deadline import tool_timeout
+from .download_cache import PendingBlob, chunk_size
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class RangeRejected(Exception):
+    """The server ignored a Range request, or the file changed between requests."""
+
+
+def content_length(headers) -> Optional[int]:
+    try:
+        return int(headers.get("Content-Length"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _validator(headers) -> Optional[str]:
+    """If-Range value that pins follow-up requests to the same version of the file."""
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+def resumable(headers) -> bool:
+    """Whether the rest of this body can be re-requested by byte offset."""
+    return (
+        headers.get("Accept-Ranges", "").lower() == "bytes"
+        # Offsets would point into the encoded bytes, not what httpx hands us
+        and headers.get("Content-Encoding", "identity") == "identity"
+        and content_length(headers) is not None
+        and _validator(headers) is not None
+    )
+
+
+def splittable(headers) -> bool:
+    """Whether the body is worth fetching as parallel Range segments."""
+    return (
+        DOWNLOAD_SEGMENTS > 1
+        and resumable(headers)
+        and content_length(headers) >= DOWNLOAD_PARALLEL_MIN_MB * MB
+    )
+
+
+def segments(length: int, count: int = DOWNLOAD_SEGMENTS) -> List[Tuple[int, int]]:
+    """Split `length` bytes into `count` inclusive (start, end) ranges."""
+    step = -(-length // count)
+    return [(start, min(start + step, length) - 1) for start in range(0, length, step)]
+
+
+def _range_headers(start: int, end: Optional[int], validator: str) -> dict:
+    return {"Range": f"bytes={start}-{'' if end is None else end}", "If-Range": validator}
+
+
+def _check_partial(response: httpx.Response, start: int):
+    if response.status_code != 206 or not response.headers.get("Content-Range", "").startswith(f"bytes {start}-"):
+        raise RangeRejected(f"asked for bytes from {start}, got HTTP {response.status_code}")
+
+
+def _resume_after(error: Exception, url: str, offset: int, failures: int) -> int:
+    failures += 1
+    if failures > DOWNLOAD_RESUME_RETRIES:
+        raise error
+    logger.info(f"Transfer of {url} broke at byte {offset} ({error!r}), resuming")
+    return failures
+
+
+def describe_rate(size: int, seconds: float, parts: int = 1) -> str:
+    rate = size / seconds / MB if seconds else 0.0
+    text = f"{size / MB:.1f} MB in {seconds:.2f}s, {rate:.1f} MB/s"
+    return text + (f", {parts} segments" if parts > 1 else "")
+
+
+def _follow_up(headers: Optional[dict] = None) -> dict:
+    """Request options of the GETs a transfer sends after the first response."""
+    # Sized like the first request: a stalled segment must not outlive the question
+    return {"timeout": tool_timeout(30), "headers": headers}
+
+
+def _stream_plan(response: httpx.Response) -> Tuple[Optional[str], int]:
+    """(validator to resume with, or None if the body cannot be resumed; chunk size)."""
+    validator = _validator(response.headers) if resumable(response.headers) else None
+    return validator, chunk_size(content_length(response.headers))
+
+
+def _write_segment(pending: PendingBlob, offset: int, end: int, chunk: bytes) -> int:
+    """Write a chunk of the segment ending at `end`; returns the next offset."""
+    pending.write_at(offset, chunk[:end + 1 - offset])
+    return offset + len(chunk)
+
+
+def _segment_done(offset: int, end: int):
+    if offset <= end:
+        raise httpx.RemoteProtocolError(f"body ended at byte {offset}")
+
+
+def _split(headers, pending: PendingBlob) -> Tuple[List[Tuple[int, int]], str]:
+    """(segments, validator) of a parallel fetch; sizes `pending` for them."""
+    length = content_length(headers)
+    pending.allocate(length)
+    return segments(length), _validator(headers)
+
+
+def _start_over(url: str, error: RangeRejected, pending: PendingBlob):
+    logger.info(f"Range request for {url} refused or the file changed ({error}), downloading it again in one stream")
+    pending.reset()
+
+
+# --- Sync -------------------------------------------------------------------
+
+def fetch_stream(url: str, response: httpx.Response, pending: PendingBlob):
+    """Copy `response` into `pending`, resuming with Range requests if the connection drops."""
+    validator, size = _stream_plan(response)
+    failures = 0
+    with ExitStack() as stack:
+        while True:
+            try:
+                for chunk in response.iter_bytes(size):
+                    pending.write(chunk)
+                return
+            except httpx.TransportError as e:
+                if validator is None:
+                    raise
+                failures = _resume_after(e, url, pending.size, failures)
+            response = stack.enter_context(
+                http_client.stream("GET", url, **_follow_up(_range_headers(pending.size, None, validator)))
+            )
+            _check_partial(response, pending.size)
+
+
+def _fetch_segment(url: str, start: int, end: int, validator: str, pending: PendingBlob, stop: threading.Event):
+    offset, failures = start, 0
+    size = chunk_size(end - start + 1)
+    while offset <= end and not stop.is_set():
+        try:
+            with http_client.stream("GET", url, **_follow_up(_range_headers(offset, end, validator))) as response:
+                _check_partial(response, offset)
+                for chunk in response.iter_bytes(size):
+                    if stop.is_set():
+                        return
+                    offset = _write_segment(pending, offset, end, chunk)
+                _segment_done(offset, end)
+        except httpx.TransportError as e:
+            failures = _resume_after(e, url, offset, failures)
+
+
+def fetch_segments(url: str, headers, pending: PendingBlob) -> int:
+    """Fetch the body as parallel Range requests into `pending`; returns the segment count."""
+    parts, validator = _split(headers, pending)
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=len(parts), thread_name_prefix="download") as pool:
+        # Each segment sees the chain's question deadline
+        futures = [
+            pool.submit(copy_context().run, _fetch_segment, url, start, end, validator, pending, stop)
+            for start, end in parts
+        ]
+        try:
+            for future in futures:
+                future.result()
+        except BaseException:
+            stop.set()
+            raise
+    return len(parts)
+
+
+def download(url: str, response: httpx.Response, pending: PendingBlob) -> int:
+    """Copy the body of a 200 `response` into `pending`; returns the number of segments used."""
+    try:
+        if not splittable(response.headers):
+            fetch_stream(url, response, pending)
+            return 1
+        # The segments request the body again, in parallel
+        response.close()
+        return fetch_segments(url, response.headers, pending)
+    except RangeRejected as e:
+        _start_over(url, e, pending)
+    with http_client.stream("GET", url, **_follow_up()) as response:
+        response.raise_for_status()
+        fetch_stream(url, response, pending)
+    return 1
+
+
+# --- Async ------------------------------------------------------------------
+
+async def afetch_stream(url: str, response: httpx.Response, pending: PendingBlob):
+    """Async `fetch_stream`."""
+    validator, size = _stream_plan(response)
+    failures = 0
+    async with AsyncExitStack() as stack:
+        while True:
+            try:
+                async for chunk in response.aiter_bytes(size):
+                    pending.write(chunk)
+                return
+            except httpx.TransportError as e:
+                if validator is None:
+                    raise
+                failures = _resume_after(e, url, pending.size, failures)
+            response = await stack.enter_async_context(
+                http_client.astream("GET", url, **_follow_up(_range_headers(pending.size, None, validator)))
+            )
+            _check_partial(response, pending.size)
+
+
+async def _afetch_segment(url: str, start: int, end: int, validator: str, pending: PendingBlob):
+    offset, failures = start, 0
+    size = chunk_size(end - start + 1)
+    while offset <= end:
+        try:
+            async with http_client.astream("GET", url,
+                                           **_follow_up(_range_headers(offset, end, validator))) as response:
+                _check_partial(response, offset)
+                async for chunk in response.aiter_bytes(size):
+                    offset = _write_segment(pending, offset, end, chunk)
+                _segment_done(offset, end)
+        except httpx.TransportError as e:
+            failures = _resume_after(e, url, offset, failures)
+
+
+async def afetch_segments(url: str, headers, pending: PendingBlob) -> int:
+    """Async `fetch_segments`."""
+    parts, validator = _split(headers, pending)
+    tasks = [asyncio.ensure_future(_afetch_segment(url, start, end, validator, pending)) for start, end in parts]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return len(parts)
+
+
+async def adownload(url: str, response: httpx.Response, pending: PendingBlob) -> int:
+    """Async `download`."""
+    try:
+        if not splittable(response.headers):
+            await afetch_stream(url, response, pending)
+            return 1
+        await response.aclose()
+        return await afetch_segments(url, response.headers, pending)
+    except RangeRejected as e:
+        _start_over(url, e, pending)
+    async with http_client.astream("GET", url, **_follow_up()) as response:
+        response.raise_for_status()
+        await afetch_stream(url, response, pending)
+    return 1
+
+
+# --- Extraction -------------------------------------------------------------
+
+_ARCHIVE_SUFFIXES = (".tar.gz", ".tar.bz2", ".tar.xz", ".tgz", ".tar", ".zip")
+
+
+def _target_dir(path: Path) -> Path:
+    name = path.name
+    for suffix in _ARCHIVE_SUFFIXES:
+        if name.lower().endswith(suffix) and len(name) > len(suffix):
+            name = name[:-len(suffix)]
+            break
+    else:
+        name += "_extracted"
+    return path.with_name(name)
+
+
+def _too_large(total: int, path: Path):
+    if total > DOWNLOAD_MAX_EXTRACT_MB * MB:
+        raise ValueError(f"{path.name} unpacks to more than {DOWNLOAD_MAX_EXTRACT_MB} MB")
+
+
+def extract(path: Path) -> List[Path]:
+    """
+    Unpack a downloaded archive next to it and return the files produced.
+
+    zip and tar (optionally gz/bz2/xz compressed) archives go into a
+    directory named after the archive; a plain gzip file is decompressed
+    alongside it. Everything is streamed in chunks rather than read into
+    memory. Files that are not archives produce [].
+    """
+    if zipfile.is_zipfile(path):
+        target = _target_dir(path)
+        with zipfile.ZipFile(path) as archive:
+            members = [member for member in archive.infolist() if not member.is_dir()]
+            _too_large(sum(member.file_size for member in members), path)
+            # ZipFile.extract drops absolute paths and ".." components
+            return [Path(archive.extract(member, target)) for member in members]
+
+    if tarfile.is_tarfile(path):
+        target = _target_dir(path)
+        produced, total = [], 0
+        with tarfile.open(path, "r|*") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                total += member.size
+                _too_large(total, path)
+                archive.extract(member, target, filter="data")
+                produced.append(target / member.name)
+        return produced
+
+    with open(path, "rb") as f:
+        if f.read(2) != b"\x1f\x8b":
+            return []
+    output = path.with_suffix("") if path.suffix.lower() == ".gz" else path.with_name(path.name + ".out")
+    # Left over from an earlier extraction
+    output.unlink(missing_ok=True)
+    total = 0
+    try:
+        with gzip.open(path, "rb") as source, open(output, "wb") as dest:
+            while block := source.read(MB):
+                total += len(block)
+                _too_large(total, path)
+                dest.write(block)
+    except BaseException:
+        output.unlink(missing_ok=True)
+        raise
+    return [output]
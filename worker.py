@@ -0,0 +1,52 @@
+"""Worker process: runs quiz chains queued in the shared job store, without serving the API."""
+import argparse
+import asyncio
+import logging
+import signal
+from pathlib import Path
+
+from config import AGENT_ASYNC, JOB_WORKERS, JOB_STORE_PATH
+from agent import run_agent, run_agent_async
+from job_store import JobStore
+from jobs import StoreJobManager
+from ratelimit import llm_limiter
+from services import start_services, stop_services
+
+logger = logging.getLogger(__name__)
+
+
+async def serve(manager: StoreJobManager, services: bool = True):
+    """Run `manager` until SIGTERM or SIGINT; its chains still running go back to the queue."""
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopped.set)
+    if services:
+        await start_services()
+    await manager.start()
+    try:
+        await stopped.wait()
+    finally:
+        logger.info("👋 Worker shutting down...")
+        await manager.stop()
+        if services:
+            await stop_services()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS, help="chains this process runs at once")
+    parser.add_argument("--store", type=Path, default=JOB_STORE_PATH, help="SQLite job store shared with the API")
+    args = parser.parse_args()
+
+    manager = StoreJobManager(
+        run_agent_async if AGENT_ASYNC else run_agent,
+        JobStore(args.store),
+        workers=args.workers,
+        limiter=llm_limiter,
+    )
+    asyncio.run(serve(manager))
+
+
+if __name__ == "__main__":
+    main()